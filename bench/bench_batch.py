@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+import loadgen
+import overlay
+
+from utils import clientutils
+
+"""
+| ===================================================================
+| one_at_a_time: a CLIREQ per key, each waiting for its first answer
+| ===================================================================
+"""
+
+def one_at_a_time(srv_addr, keys, timeout):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    answered = 0
+    began = time.time()
+    for key in keys:
+        if overlay.lookup(sock, srv_addr, key, timeout) is not None:
+            answered += 1
+    elapsed = time.time() - began
+    sock.close()
+    return answered, elapsed
+
+"""
+| ===================================================================
+| batched: the same keys through MULTIREQs, window keys in flight
+| ===================================================================
+"""
+
+def batched(srv_addr, keys, timeout, window):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    answers = set()
+    began = time.time()
+    clientutils.p2p_ask_many(sock, keys, srv_addr[0], srv_addr[1], lambda key, value, ip_addr: answers.add(key),
+                             window, timeout)
+    elapsed = time.time() - began
+    sock.close()
+    return len(answers), elapsed
+
+"""
+| ===================================================================
+| pipelined: the same keys as tagged lookups through PipelinedClient
+| ===================================================================
+"""
+
+def pipelined(srv_addr, keys, window):
+    client = clientutils.PipelinedClient(srv_addr[0], srv_addr[1], window)
+    answered = 0
+    began = time.time()
+    for lookup in client.lookup_many(keys):
+        if lookup.answers:
+            answered += 1
+    elapsed = time.time() - began
+    client.close()
+    return answered, elapsed
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=5000, help="keys looked up per run")
+    parser.add_argument('--windows', type=int, nargs="*", default=[64, 256], help="keys in flight for batches")
+    parser.add_argument('--port', type=int, default=7700, help="first of the two spawned servents' ports")
+    parser.add_argument('--timeout', type=float, default=1.0, help="seconds to wait for an answer")
+    opt = parser.parse_args()
+
+    # Half the keys live on the servent we ask, the other half one hop away
+    keys = ["service%d" % i for i in xrange(opt.keys)]
+    workdir = tempfile.mkdtemp()
+    input_files = []
+    for half in (0, 1):
+        input_file = os.path.join(workdir, "node%d.txt" % half)
+        with open(input_file, "w") as services:
+            for key in keys[half::2]:
+                services.write("%s %d/tcp\n" % (key, len(key)))
+        input_files.append(input_file)
+
+    near = loadgen.spawn_servent(opt.port, input_files[0], ["--event_loop", "--other_peers",
+                                                            "127.0.0.1:%d" % (opt.port + 1)])
+    far = loadgen.spawn_servent(opt.port + 1, input_files[1], ["--event_loop", "--other_peers",
+                                                               "127.0.0.1:%d" % opt.port])
+    srv_addr = ("127.0.0.1", opt.port)
+    try:
+        answered, elapsed = one_at_a_time(srv_addr, keys, opt.timeout)
+        baseline = answered / elapsed
+        print("%-18s %6d/%d answered %10.1f keys/s" % ("one at a time", answered, len(keys), baseline))
+        for window in opt.windows:
+            answered, elapsed = batched(srv_addr, keys, opt.timeout, window)
+            print("%-18s %6d/%d answered %10.1f keys/s  %.1fx" % ("batch window %d" % window, answered, len(keys),
+                                                                 answered / elapsed, answered / elapsed / baseline))
+        for window in opt.windows:
+            answered, elapsed = pipelined(srv_addr, keys, window)
+            print("%-18s %6d/%d answered %10.1f keys/s  %.1fx" % ("tagged window %d" % window, answered, len(keys),
+                                                                 answered / elapsed, answered / elapsed / baseline))
+    finally:
+        for proc in (near, far):
+            proc.terminate()
+            proc.wait()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import os
+import socket
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import peerutils
+
+"""
+| ===================================================================
+| old_forward: the per-forward split of HOST:PORT strings
+| ===================================================================
+"""
+
+def old_forward(sock, send_message, exclude_list, other_peers):
+    for peer in other_peers:
+        peer = tuple([peer.split(":")[0], int(peer.split(":")[1])])
+        if peer not in exclude_list:
+            try:
+                sock.sendto(send_message, peer)
+            except:
+                pass
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--peers', type=int, nargs="*", default=[4, 16, 64, 256], help="peer counts to compare")
+    parser.add_argument('--number', type=int, default=2000, help="forwards per measurement")
+    parser.add_argument('--repeat', type=int, default=3, help="measurements, the best one is reported")
+    opt = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    send_message = bytearray("\x00\x02" + "\x00" * 12 + "http")
+    exclude_list = [("127.0.0.1", 1), ("0.0.0.0", 2)]
+
+    # Receivers nobody reads from: the kernel just drops what overflows, which is fine for timing sends
+    receivers = []
+    for _ in xrange(max(opt.peers)):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receivers.append(receiver)
+    peer_strings = ["127.0.0.1:%d" % receiver.getsockname()[1] for receiver in receivers]
+
+    print("sendmmsg %s" % ("available" if peerutils.sendmmsg else "not available"))
+    for count in opt.peers:
+        peers = peer_strings[:count]
+        table = peerutils.PeerTable(peers, use_sendmmsg=False)
+        batched = peerutils.PeerTable(peers)
+        exclude = set(exclude_list)
+        results = []
+        for run in (lambda: old_forward(sock, send_message, exclude_list, peers),
+                    lambda: table.send(sock, send_message, exclude),
+                    lambda: batched.send(sock, send_message, exclude)):
+            results.append(min(timeit.repeat(run, number=opt.number, repeat=opt.repeat)) * 1e6 / opt.number)
+        print("%4d peers  split+sendto %8.1f us  table+sendto %8.1f us  table+sendmmsg %8.1f us per forward" %
+              ((count,) + tuple(results)))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import logging
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import utils, cacheutils, protocol, serventutils
+
+"""
+| ===================================================================
+| run: feeds datagrams to a Servent and returns its processing stats
+| ===================================================================
+"""
+
+def run(datagrams, entries, peers):
+    srv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    srv_sock.bind(("127.0.0.1", 0))
+    service_list = dict(("service%d" % i, "%d/tcp" % i) for i in xrange(entries))
+
+    # Peers and clients are ports nobody listens on, sendto still does all of its work
+    other_peers = ["127.0.0.1:%d" % (20000 + i) for i in xrange(peers)]
+    servent = serventutils.Servent(srv_sock, srv_sock.getsockname(), service_list, other_peers,
+                                   cacheutils.TTLCache(len(datagrams) + 1))
+    client = ("127.0.0.1", 19999)
+    started = time.time()
+    for recv_data in datagrams:
+        servent.handle(recv_data, client)
+    elapsed = time.time() - started
+    srv_sock.close()
+    return elapsed / len(datagrams), servent.stats()["processing_us"]
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datagrams', type=int, default=50000, help="distinct datagrams to handle")
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--peers', type=int, default=4)
+    opt = parser.parse_args()
+
+    # Half hits, half misses that get flooded, as QUERYs from another servent with fresh seqs
+    datagrams = [protocol.build_query(utils.TTL, ("127.0.0.1", 19998), seq,
+                                      "service%d" % (seq if seq % 2 else opt.entries + seq))
+                 for seq in xrange(opt.datagrams)]
+
+    # Records are formatted and written out as a real run would, only to /dev/null
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("[%(asctime)s][%(levelname)s] %(message)s", "%m-%d-%Y %I:%M:%S %p"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    for level in ("DEBUG", "WARNING"):
+        root.setLevel(getattr(logging, level))
+        per_packet, processing = run(datagrams, opt.entries, opt.peers)
+        query = processing["QUERY"]
+        print("--log_level %-8s %6.2f us/datagram  handle() p50 %4dus  p99 %4dus  p99.9 %4dus" % (
+            level, per_packet * 1e6, query["p50"], query["p99"], query["p999"]))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import overlay
+
+from utils import clientutils, utils
+
+"""
+| ===================================================================
+| fetch_all: looks a key up repeats times, one lookup after another
+| ===================================================================
+"""
+
+def fetch_all(client, key, size, repeats):
+    latencies = []
+    for _ in xrange(repeats):
+        lookup = client.lookup(key)
+        if not lookup.values or len(lookup.values[0]) != size:
+            raise RuntimeError("'%s' came back with %s bytes" % (key, lookup.values and len(lookup.values[0])))
+        latencies.append(lookup.latency)
+    return sorted(latencies)
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs="*", default=[512, 1024, 10240, 102400, 1048576, 10485760],
+                        help="value sizes in bytes")
+    parser.add_argument('--repeats', type=int, default=20, help="lookups per size")
+    parser.add_argument('--large_threshold', type=int, default=utils.LARGE_VALUE_THRESHOLD,
+                        help="passed on to the servents")
+    parser.add_argument('--base_port', type=int, default=8700)
+    opt = parser.parse_args()
+
+    # The client asks node 0, node 1 holds the values: every answer is a flooded miss, then a fetch from node 1
+    workdir = tempfile.mkdtemp()
+    net = overlay.Overlay(workdir, opt.base_port, ["--large_threshold", str(opt.large_threshold),
+                                                   "--advertise", "127.0.0.1"])
+    catalog = dict(("value%d" % size, "v" * size) for size in opt.sizes)
+    net.start({0: [1], 1: [0]}, {1: catalog})
+    client = clientutils.PipelinedClient(*net.address(0))
+    try:
+        print("%10s  %-9s  %9s  %9s  %10s" % ("size", "path", "p50", "p99", "MB/s"))
+        for size in opt.sizes:
+            started = time.time()
+            latencies = fetch_all(client, "value%d" % size, size, opt.repeats)
+            elapsed = time.time() - started
+            print("%10d  %-9s  %7.2fms  %7.2fms  %10.2f" % (
+                size, "udp" if size <= opt.large_threshold else "udp+tcp", latencies[len(latencies) / 2] * 1e3,
+                latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+                size * opt.repeats / elapsed / 1048576.0))
+    finally:
+        client.close()
+        stats = net.stop()
+        shutil.rmtree(workdir)
+    print("%d values announced, %d fetched, %.1f MB sent over TCP" % (
+        overlay.total(stats, "large_announced"), overlay.total(stats, "large_fetches"),
+        overlay.total(stats, "large_bytes_sent") / 1048576.0))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import replicautils
+
+"""
+| ===================================================================
+| linear_scan: what answering a pattern costs without an index
+| ===================================================================
+"""
+
+def linear_scan(service_list, pattern, after, limit):
+    matches = sorted(key for key in service_list if key > after and fnmatch.fnmatchcase(key, pattern))
+    return [(key, service_list[key]) for key in matches[:limit]], len(matches) > limit
+
+"""
+| ===================================================================
+| timed: mean seconds per call of search over every pattern
+| ===================================================================
+"""
+
+def timed(search, patterns, limit):
+    matched = 0
+    started = time.time()
+    for pattern in patterns:
+        items, _ = search(pattern, limit)
+        matched += len(items)
+    return (time.time() - started) / len(patterns), matched
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, nargs="*", default=[10000, 100000, 1000000],
+                        help="catalog sizes to compare")
+    parser.add_argument('--patterns', type=int, default=200, help="random patterns per kind and size")
+    parser.add_argument('--limit', type=int, default=100, help="page size, as a servent would cap it")
+    opt = parser.parse_args()
+
+    for entries in opt.entries:
+        service_list = dict(("service%d" % i, "%d/tcp" % (i % 65536)) for i in xrange(entries))
+        store = replicautils.VersionedStore(service_list, 0)
+        started = time.time()
+        store.match("")
+        build_time = time.time() - started
+
+        # Narrow and wide prefixes, and patterns with a wildcard past the prefix
+        kinds = (("prefix", lambda: "service%d*" % random.randint(0, entries / 10)),
+                 ("wide prefix", lambda: "service%d*" % random.randint(1, 9)),
+                 ("glob", lambda: "service%d?1" % random.randint(0, entries / 100)),
+                 ("cursor", lambda: "service*"))
+        print("%d entries (index built once in %.2fs)" % (entries, build_time))
+        for name, make_pattern in kinds:
+            patterns = [make_pattern() for _ in xrange(opt.patterns)]
+            after = "service%d" % random.randint(0, entries) if name == "cursor" else ""
+            indexed, matched = timed(lambda pattern, limit: store.match(pattern, after, limit), patterns, opt.limit)
+            scan, _ = timed(lambda pattern, limit: linear_scan(service_list, pattern, after, limit),
+                            patterns[:max(1, opt.patterns * 10000 / entries)], opt.limit)
+            print("  %-12s index %9.2f us  scan %11.2f us  %7.0fx  (%.1f matches per page)" % (
+                name, indexed * 1e6, scan * 1e6, scan / indexed, float(matched) / len(patterns)))
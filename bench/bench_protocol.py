@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import utils, protocol
+
+"""
+| ===================================================================
+| old_*: packet handling as servent.py did it before utils.protocol
+| ===================================================================
+"""
+
+def old_parse_query(recv_data):
+    recv_message_type = struct.unpack("!H", recv_data[:struct.calcsize("!H")])[0]
+    recv_header_size = struct.calcsize(utils.MESSAGE_FORMAT["QUERY"])
+    _, recv_ttl, recv_from, recv_port, recv_seq = struct.unpack(utils.MESSAGE_FORMAT["QUERY"],
+                                                                recv_data[:recv_header_size])
+    recv_from = utils.int_to_ip(recv_from)
+    recv_message = recv_data[recv_header_size:]
+    return recv_message_type, recv_ttl, recv_from, recv_port, recv_seq, recv_message
+
+def old_forward_query(recv_data):
+    _, recv_ttl, recv_from, recv_port, recv_seq, _ = old_parse_query(recv_data)
+    recv_header_size = struct.calcsize(utils.MESSAGE_FORMAT["QUERY"])
+    send_header = struct.pack(utils.MESSAGE_FORMAT["QUERY"], utils.MESSAGE_TYPES["QUERY"], recv_ttl - 1,
+                              utils.ip_to_int(recv_from), recv_port, recv_seq)
+    return send_header + recv_data[recv_header_size:]
+
+"""
+| ===================================================================
+| new_*: the same work through utils.protocol
+| ===================================================================
+"""
+
+def new_parse_query(recv_data):
+    recv_message_type = protocol.message_type(recv_data)
+    return (recv_message_type,) + protocol.parse_query(recv_data)
+
+def new_forward_query(recv_data):
+    recv_ttl = protocol.parse_query(recv_data)[0]
+    send_message = protocol.rewrite_query(recv_data, recv_ttl - 1)
+
+    # Only for the benchmark, so every round sees the same packet
+    protocol.rewrite_query(recv_data, recv_ttl)
+    return send_message
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200000, help="packets per measurement")
+    parser.add_argument('--repeat', type=int, default=5, help="measurements, the best one is reported")
+    parser.add_argument('--key', type=str, default="http-alternative", help="key carried by the query")
+    opt = parser.parse_args()
+
+    packet = struct.pack(utils.MESSAGE_FORMAT["QUERY"], utils.MESSAGE_TYPES["QUERY"], utils.TTL,
+                         utils.ip_to_int("10.0.0.7"), 5000, 12345) + opt.key
+    packet_buffer = protocol.PacketBuffer()
+    packet_buffer.buffer[:len(packet)] = packet
+    view = packet_buffer.view[:len(packet)]
+
+    assert old_parse_query(packet) == new_parse_query(view)
+    assert old_forward_query(packet) == protocol.rewrite_query(view, utils.TTL - 1).tobytes()
+    protocol.rewrite_query(view, utils.TTL)
+
+    for name, old, new in (("parse", old_parse_query, new_parse_query),
+                           ("parse + forward", old_forward_query, new_forward_query)):
+        old_time = min(timeit.repeat(lambda: old(packet), number=opt.number, repeat=opt.repeat))
+        new_time = min(timeit.repeat(lambda: new(view), number=opt.number, repeat=opt.repeat))
+        print("%-16s old %7.1f ns/packet  new %7.1f ns/packet  %.2fx" % (name, old_time * 1e9 / opt.number,
+                                                                          new_time * 1e9 / opt.number,
+                                                                          old_time / new_time))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import utils, cacheutils
+
+"""
+| ===================================================================
+| run_cache: the bounded TTLCache used by servent.py
+| ===================================================================
+"""
+
+def run_cache(query_history, queries):
+    for query in queries:
+        query_history.seen(query)
+
+"""
+| ===================================================================
+| make_queries: generates a stream of queries with some duplicates
+| ===================================================================
+"""
+
+def make_queries(start, count, dup_ratio):
+    queries = []
+    for seq in xrange(start, start + count):
+        query = ("10.0.%d.%d" % (seq % 200, seq % 250), 5000 + seq % 1000, seq, "service%d" % (seq % 5000))
+        queries.append(query)
+
+        # Flooding delivers the same query through several peers
+        if random.random() < dup_ratio:
+            queries.append(query)
+    return queries
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=3000000, help="total distinct queries for the cache run")
+    parser.add_argument('--window', type=int, default=250000, help="queries per reported window")
+    parser.add_argument('--list_queries', type=int, default=40000, help="total distinct queries for the list run")
+    parser.add_argument('--dup_ratio', type=float, default=0.5, help="fraction of queries delivered twice")
+    parser.add_argument('--size', type=int, default=utils.QUERY_HISTORY_SIZE, help="cache max size")
+    parser.add_argument('--ttl', type=float, default=utils.QUERY_HISTORY_TTL, help="cache ttl in seconds")
+    opt = parser.parse_args()
+
+    random.seed(42)
+
+    print("list (old query_history)")
+    queries = make_queries(0, opt.list_queries, opt.dup_ratio)
+    window = max(1, len(queries) / 8)
+    query_history = []
+    for start in xrange(0, len(queries), window):
+        chunk = queries[start:start + window]
+        began = time.time()
+        for query in chunk:
+            if query not in query_history:
+                query_history.append(query)
+        elapsed = time.time() - began
+        print("  after %9d packets: %10.1f ns/packet" % (start + len(chunk), elapsed * 1e9 / len(chunk)))
+
+    print("TTLCache (size=%d, ttl=%.1fs)" % (opt.size, opt.ttl))
+    query_history = cacheutils.TTLCache(opt.size, opt.ttl)
+    total = 0
+    for start in xrange(0, opt.queries, opt.window):
+        chunk = make_queries(start, min(opt.window, opt.queries - start), opt.dup_ratio)
+        began = time.time()
+        run_cache(query_history, chunk)
+        elapsed = time.time() - began
+        total += len(chunk)
+        print("  after %9d packets: %10.1f ns/packet, %d entries" % (total, elapsed * 1e9 / len(chunk),
+                                                                     len(query_history)))
+    print("  %(hits)d duplicates dropped, %(misses)d new, %(evictions)d evictions" % query_history.stats())
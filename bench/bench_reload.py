@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import loadgen
+
+"""
+| ===================================================================
+| write_catalog: writes a synthetic services file, version changes values
+| ===================================================================
+"""
+
+def write_catalog(path, entries, changed, version):
+    with open(path, "w") as services:
+        for i in xrange(entries):
+            port = (i + version) % 65536 if i < changed else i % 65536
+            services.write("service%d\t%d/tcp\n" % (i, port))
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=200000, help="catalog size")
+    parser.add_argument('--changed', type=int, default=1000, help="entries changed by each update")
+    parser.add_argument('--reloads', type=int, default=5, help="updates applied during the run")
+    parser.add_argument('--window', type=float, default=0.5, help="seconds per reported throughput sample")
+    parser.add_argument('--port', type=int, default=7700, help="port for the spawned servent")
+    opt = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    catalog = os.path.join(workdir, "services.txt")
+    log_path = os.path.join(workdir, "servent.log")
+    write_catalog(catalog, opt.entries, opt.changed, 0)
+
+    with open(log_path, "w") as log_file:
+        proc = subprocess.Popen([sys.executable, os.path.join(loadgen.ROOT, "servent.py"), str(opt.port), catalog,
+                                 "--event_loop"], stdout=log_file, stderr=log_file)
+    time.sleep(2.0 + opt.entries / 100000.0)
+
+    # Updates land while load is running, one every other window
+    def update():
+        for version in xrange(1, opt.reloads + 1):
+            time.sleep(2 * opt.window)
+            write_catalog(catalog, opt.entries, opt.changed, version)
+            proc.send_signal(signal.SIGHUP)
+
+    updater = threading.Thread(target=update)
+    updater.start()
+    try:
+        samples = int((opt.reloads + 2) * 2)
+        for sample in xrange(samples):
+            _, received, elapsed = loadgen.drive(("127.0.0.1", opt.port), "service0", opt.window, 32)
+            print("t=%5.1fs %10.1f datagrams/s" % (sample * opt.window, received / elapsed))
+    finally:
+        updater.join()
+        time.sleep(1.0)
+        proc.terminate()
+        proc.wait()
+
+    with open(log_path) as log_file:
+        for line in log_file:
+            if "Reloaded" in line:
+                sys.stdout.write(line)
+    os.remove(catalog)
+    os.remove(log_path)
+    os.rmdir(workdir)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import serventutils, storeutils
+
+"""
+| ===================================================================
+| rss: resident set size of this process in bytes
+| ===================================================================
+"""
+
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+"""
+| ===================================================================
+| measure: loads input_file in a fresh interpreter and times lookups
+| ===================================================================
+"""
+
+def measure(input_file, keys_file):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--measure", input_file, keys_file])
+    startup, memory, lookup = output.split()
+    return float(startup), int(memory), float(lookup)
+
+def measure_child(input_file, keys_file):
+    with open(keys_file) as keys:
+        keys = keys.read().split()
+    rss_before = rss()
+    started = time.time()
+    service_list = serventutils.load_service_list(input_file)
+    startup = time.time() - started
+    memory = rss() - rss_before
+
+    started = time.time()
+    for key in keys:
+        service_list.get(key)
+    lookup = (time.time() - started) / len(keys)
+    print("%r %d %r" % (startup, memory, lookup))
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, nargs="*", default=[10000, 100000, 1000000],
+                        help="catalog sizes to compare")
+    parser.add_argument('--lookups', type=int, default=100000, help="random lookups per run")
+    parser.add_argument('--measure', type=str, nargs=2, metavar=("INPUT_FILE", "KEYS_FILE"), help=argparse.SUPPRESS)
+    opt = parser.parse_args()
+
+    if opt.measure:
+        measure_child(*opt.measure)
+        sys.exit(0)
+
+    workdir = tempfile.mkdtemp()
+    for entries in opt.entries:
+        text_file = os.path.join(workdir, "services-%d.txt" % entries)
+        with open(text_file, "w") as services:
+            for i in xrange(entries):
+                services.write("service%d\t%d/tcp\tsynthetic entry %d\n" % (i, i % 65536, i))
+
+        started = time.time()
+        store_file = os.path.join(workdir, "services-%d.kvs" % entries)
+        storeutils.compile_store(serventutils.read_input_file(text_file), store_file)
+        compile_time = time.time() - started
+
+        keys_file = os.path.join(workdir, "keys-%d.txt" % entries)
+        with open(keys_file, "w") as keys:
+            keys.write("\n".join("service%d" % random.randint(0, entries * 2) for _ in xrange(opt.lookups)))
+        print("%d entries (compiled once in %.2fs)" % (entries, compile_time))
+        for name, input_file in (("text", text_file), ("compiled", store_file)):
+            startup, memory, lookup = measure(input_file, keys_file)
+            print("  %-9s startup %8.4fs  rss after load +%8.1f MB  lookup %6.2f us" % (name, startup,
+                                                                                       memory / 1048576.0,
+                                                                                       lookup * 1e6))
+        os.remove(keys_file)
+        os.remove(text_file)
+        os.remove(store_file)
+    os.rmdir(workdir)
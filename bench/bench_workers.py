@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import multiprocessing
+import tempfile
+
+import loadgen
+
+"""
+| ===================================================================
+| drive_one: a single load generator process
+| ===================================================================
+"""
+
+def drive_one(args):
+    return loadgen.drive(*args)
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs="*", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument('--clients', type=int, default=multiprocessing.cpu_count(),
+                        help="load generator processes, each with its own source port")
+    parser.add_argument('--port', type=int, default=7600, help="port for spawned servents")
+    parser.add_argument('--key', type=str, default="http", help="key to ask for")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per run")
+    parser.add_argument('--window', type=int, default=32, help="requests kept in flight per client")
+    opt = parser.parse_args()
+
+    input_file = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+    input_file.write("%s 80/tcp\n" % opt.key)
+    input_file.close()
+
+    print("%d cpus, %d load generator processes" % (multiprocessing.cpu_count(), opt.clients))
+    baseline = None
+    for workers in opt.workers:
+        proc = loadgen.spawn_servent(opt.port, input_file.name, ["--event_loop", "--workers", str(workers)])
+        pool = multiprocessing.Pool(opt.clients)
+        try:
+            results = pool.map(drive_one, [(("127.0.0.1", opt.port), opt.key, opt.duration, opt.window)] *
+                               opt.clients)
+        finally:
+            pool.close()
+            pool.join()
+            proc.terminate()
+            proc.wait()
+        rate = sum(received / elapsed for _, received, elapsed in results)
+        baseline = baseline or rate
+        print("%2d workers %10.1f datagrams/s  %.2fx" % (workers, rate, rate / baseline))
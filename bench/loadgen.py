@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import errno
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from utils import utils
+
+"""
+| ===================================================================
+| spawn_servent: starts a servent.py on loopback with extra args
+| ===================================================================
+"""
+
+def spawn_servent(port, input_file, extra_args=()):
+    with open(os.devnull, "w") as devnull:
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "servent.py"), str(port), input_file] +
+                                list(extra_args), stdout=devnull, stderr=devnull)
+    time.sleep(1.0)
+    return proc
+
+"""
+| ===================================================================
+| drive: keeps window CLIREQs in flight and counts RESPONSEs per second
+| ===================================================================
+"""
+
+def drive(srv_addr, key, duration, window):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.setblocking(False)
+    request = struct.pack(utils.MESSAGE_FORMAT["CLIREQ"], utils.MESSAGE_TYPES["CLIREQ"]) + key
+
+    sent = received = 0
+    in_flight = 0
+    began = time.time()
+    deadline = began + duration
+    while time.time() < deadline:
+        while in_flight < window:
+            sock.sendto(request, srv_addr)
+            sent += 1
+            in_flight += 1
+        readable, _, _ = select.select([sock], [], [], 0.05)
+        if not readable:
+
+            # Whatever is still outstanding got dropped somewhere, so we refill the window
+            in_flight = 0
+            continue
+        while True:
+            try:
+                sock.recvfrom(utils.MAX_BUFFER_SIZE)
+            except socket.error, e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            received += 1
+            in_flight = max(0, in_flight - 1)
+    elapsed = time.time() - began
+    sock.close()
+    return sent, received, elapsed
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', type=str, metavar="HOST:PORT", default=None,
+                        help="drive an already running servent instead of spawning one per mode")
+    parser.add_argument('--modes', type=str, nargs="*", default=["blocking", "event_loop"],
+                        help="servent modes to compare when spawning")
+    parser.add_argument('--port', type=int, default=7500, help="port for spawned servents")
+    parser.add_argument('--key', type=str, default="http", help="key to ask for")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per run")
+    parser.add_argument('--window', type=int, default=32, help="requests kept in flight")
+    parser.add_argument('--log_level', type=str, default="WARNING",
+                        help="passed on to spawned servents, INFO logs every datagram and hides the loop's own cost")
+    parser.add_argument('--rounds', type=int, default=3,
+                        help="runs per mode, taken in turns so noise from other processes hits every mode alike")
+    opt = parser.parse_args()
+
+    if opt.target:
+        host, port = opt.target.split(":")
+        targets = [(opt.target, (host, int(port)), None)]
+    else:
+        input_file = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+        input_file.write("%s 80/tcp\n" % opt.key)
+        input_file.close()
+        targets = []
+        for mode in opt.modes:
+            extra_args = ["--log_level", opt.log_level] + (["--event_loop"] if mode == "event_loop" else [])
+            targets.append((mode, ("127.0.0.1", opt.port), (input_file.name, extra_args)))
+
+    rates = dict((name, []) for name, _, _ in targets)
+    for _ in xrange(opt.rounds):
+        for name, srv_addr, spawn in targets:
+            proc = spawn_servent(srv_addr[1], *spawn) if spawn else None
+            try:
+                sent, received, elapsed = drive(srv_addr, opt.key, opt.duration, opt.window)
+            finally:
+                if proc:
+                    proc.terminate()
+                    proc.wait()
+            rates[name].append(received / elapsed)
+            print("%-12s %8d sent %8d answered %10.1f datagrams/s" % (name, sent, received, received / elapsed))
+    if opt.rounds > 1:
+        for name, _, _ in targets:
+            print("%-12s median %10.1f datagrams/s" % (name, sorted(rates[name])[opt.rounds / 2]))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import bisect
+import json
+import os
+import random
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from utils import utils
+
+"""
+| ===================================================================
+| make_topology: adjacency sets for a line, ring or random overlay
+| ===================================================================
+"""
+
+def make_topology(kind, nodes, degree=3, rng=random):
+    neighbors = dict((node, set()) for node in xrange(nodes))
+
+    def link(a, b):
+        if a != b:
+            neighbors[a].add(b)
+            neighbors[b].add(a)
+
+    for node in xrange(nodes - 1):
+        link(node, node + 1)
+    if kind == "ring" and nodes > 2:
+        link(nodes - 1, 0)
+    elif kind == "random":
+
+        # A shuffled chain keeps the graph connected, random chords bring the average degree up
+        order = range(nodes)
+        rng.shuffle(order)
+        neighbors = dict((node, set()) for node in xrange(nodes))
+        for a, b in zip(order, order[1:]):
+            link(a, b)
+        while nodes > degree and sum(len(peers) for peers in neighbors.values()) < degree * nodes:
+            link(rng.randrange(nodes), rng.randrange(nodes))
+    elif kind != "line":
+        raise ValueError("unknown topology %s" % kind)
+    return neighbors
+
+"""
+| ===================================================================
+| place_keys: spreads keys over nodes, replicas copies of each
+| ===================================================================
+"""
+
+def place_keys(keys, nodes, replicas=1, rng=random):
+    catalogs = dict((node, dict()) for node in xrange(nodes))
+    for key in keys:
+        for node in rng.sample(xrange(nodes), min(replicas, nodes)):
+            catalogs[node][key] = "%d/tcp node%d" % (rng.randrange(1, 65536), node)
+    return catalogs
+
+"""
+| ===================================================================
+| zipf_sampler: returns a function drawing keys with Zipf(s) popularity
+| ===================================================================
+"""
+
+def zipf_sampler(keys, s=1.0, rng=random):
+    if s <= 0:
+        return lambda: rng.choice(keys)
+    cumulative = []
+    total = 0.0
+    for rank in xrange(1, len(keys) + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return lambda: keys[bisect.bisect_left(cumulative, rng.random() * total)]
+
+"""
+| ===================================================================
+| Overlay: a set of servent.py processes on loopback
+| ===================================================================
+"""
+
+class Overlay(object):
+
+    def __init__(self, workdir, base_port=8000, extra_args=()):
+        self.workdir = workdir
+        self.base_port = base_port
+        self.extra_args = list(extra_args)
+        self.procs = dict()
+
+    def address(self, node):
+        return "127.0.0.1", self.base_port + node
+
+    def start(self, neighbors, catalogs, node_args=None, wait=None):
+        devnull = open(os.devnull, "w")
+        for node in sorted(neighbors):
+            input_file = os.path.join(self.workdir, "node%d.txt" % node)
+            with open(input_file, "w") as services:
+                for key, value in catalogs.get(node, {}).iteritems():
+                    services.write("%s %s\n" % (key, value))
+            args = [sys.executable, os.path.join(ROOT, "servent.py"), str(self.address(node)[1]), input_file,
+                    "--event_loop", "--stats_file", os.path.join(self.workdir, "node%d.json" % node)]
+            if neighbors[node]:
+                args += ["--other_peers"] + ["%s:%d" % self.address(peer) for peer in sorted(neighbors[node])]
+            args += self.extra_args + list((node_args or {}).get(node, ()))
+            self.procs[node] = subprocess.Popen(args, stdout=devnull, stderr=devnull)
+        devnull.close()
+
+        # Give every interpreter time to come up and bind before traffic starts
+        time.sleep(1.0 + len(neighbors) / 50.0 if wait is None else wait)
+
+    def usage(self):
+        """(resident bytes, CPU seconds) of every running servent, by node, read from /proc"""
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        clock_ticks = float(os.sysconf("SC_CLK_TCK"))
+        usage = dict()
+        for node, proc in self.procs.iteritems():
+            try:
+                with open("/proc/%d/statm" % proc.pid) as statm:
+                    rss = int(statm.read().split()[1]) * page_size
+                with open("/proc/%d/stat" % proc.pid) as stat:
+
+                    # utime and stime are the 14th and 15th fields, counted after the parenthesized command
+                    fields = stat.read().rsplit(")", 1)[1].split()
+                    cpu = (int(fields[11]) + int(fields[12])) / clock_ticks
+            except (IOError, IndexError):
+                continue
+            usage[node] = (rss, cpu)
+        return usage
+
+    def kill(self, nodes):
+        """Kills servents without letting them clean up, as a crash would"""
+        for node in nodes:
+            proc = self.procs.pop(node)
+            proc.kill()
+            proc.wait()
+
+    def stop(self):
+        """Stops every servent and returns their stats, by node"""
+        for proc in self.procs.values():
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        stats = dict()
+        for node, proc in self.procs.iteritems():
+            proc.wait()
+            stats_file = os.path.join(self.workdir, "node%d.json" % node)
+            if os.path.exists(stats_file):
+                with open(stats_file) as stats_json:
+                    stats[node] = json.load(stats_json)
+        self.procs = dict()
+        return stats
+
+"""
+| ===================================================================
+| lookup: sends a CLIREQ and waits for the first matching RESPONSE
+| ===================================================================
+"""
+
+def lookup(sock, srv_addr, key, timeout):
+    sock.settimeout(timeout)
+    sock.sendto(struct.pack(utils.MESSAGE_FORMAT["CLIREQ"], utils.MESSAGE_TYPES["CLIREQ"]) + key, srv_addr)
+    started = time.time()
+    header_size = struct.calcsize(utils.MESSAGE_FORMAT["RESPONSE"])
+    while True:
+        remaining = started + timeout - time.time()
+        if remaining <= 0:
+            return None
+        sock.settimeout(remaining)
+        try:
+            recv_data, _ = sock.recvfrom(utils.MAX_BUFFER_SIZE)
+        except socket.timeout:
+            return None
+
+        # Late answers to earlier lookups are skipped
+        if recv_data[header_size:].split("\t", 1)[0] == key:
+            return time.time() - started
+
+"""
+| ===================================================================
+| udp_drops: datagrams the kernel dropped on full receive buffers
+| ===================================================================
+"""
+
+def udp_drops():
+    """Host-wide count from /proc/net/snmp, None where it can't be read"""
+    try:
+        with open("/proc/net/snmp") as snmp:
+            header, values = [line.split() for line in snmp if line.startswith("Udp:")][:2]
+        return int(values[header.index("RcvbufErrors")])
+    except (IOError, ValueError):
+        return None
+
+"""
+| ===================================================================
+| total: sums a counter over every node's stats
+| ===================================================================
+"""
+
+def total(stats, counter):
+    return sum(node_stats.get(counter, 0) for node_stats in stats.values())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import random
+import shutil
+import socket
+import tempfile
+
+import overlay
+
+"""
+| ===================================================================
+| run: one simulation, returns lookups, hits and stats by node
+| ===================================================================
+"""
+
+def run(opt, extra_args, seed):
+    rng = random.Random(seed)
+    keys = ["key%d" % i for i in xrange(opt.keys)]
+    neighbors = overlay.make_topology(opt.topology, opt.nodes, opt.degree, rng)
+    catalogs = overlay.place_keys(keys, opt.nodes, 1, rng)
+    sample = overlay.zipf_sampler(keys, opt.zipf, rng)
+
+    workdir = tempfile.mkdtemp()
+    servents = overlay.Overlay(workdir, opt.base_port, extra_args)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    hits = 0
+    try:
+        servents.start(neighbors, catalogs)
+
+        # Clients always enter through the same few servents, as they would behind a configured address
+        entries = rng.sample(xrange(opt.nodes), min(opt.entries, opt.nodes))
+        for _ in xrange(opt.lookups):
+            if overlay.lookup(sock, servents.address(rng.choice(entries)), sample(), opt.timeout) is not None:
+                hits += 1
+    finally:
+        sock.close()
+        stats = servents.stop()
+        shutil.rmtree(workdir)
+    return hits, stats
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=30, help="servents in the overlay")
+    parser.add_argument('--topology', type=str, default="random", choices=["line", "ring", "random"])
+    parser.add_argument('--degree', type=int, default=3, help="average degree of random topologies")
+    parser.add_argument('--keys', type=int, default=200, help="distinct keys, each stored on one servent")
+    parser.add_argument('--zipf', type=float, default=1.0, help="Zipf exponent of key popularity, 0 is uniform")
+    parser.add_argument('--lookups', type=int, default=500, help="lookups per run")
+    parser.add_argument('--entries', type=int, default=3, help="servents clients send their CLIREQs to")
+    parser.add_argument('--timeout', type=float, default=0.5, help="seconds to wait for the first answer")
+    parser.add_argument('--base_port', type=int, default=8000, help="first port of the overlay")
+    parser.add_argument('--seed', type=int, default=1, help="seed for topology, placement and workload")
+    opt = parser.parse_args()
+
+    for name, extra_args in (("flooding", []), ("cache", ["--cache", "--advertise", "127.0.0.1"])):
+        hits, stats = run(opt, extra_args, opt.seed)
+        messages = opt.lookups + sum(overlay.total(stats, counter) for counter in
+                                     ("forwards", "responses_sent", "responses_relayed"))
+        print("%-9s hit rate %5.1f%%  messages/lookup %7.2f  forwards %7d  floods saved %7d" % (
+            name, 100.0 * hits / opt.lookups, float(messages) / opt.lookups, overlay.total(stats, "forwards"),
+            overlay.total(stats, "floods_saved")))
+        if extra_args:
+            cache_hits = sum(node["response_cache"]["hits"] for node in stats.values())
+            cache_misses = sum(node["response_cache"]["misses"] for node in stats.values())
+            print("%-9s cache hit ratio %5.1f%% (%d hits, %d misses)" % (
+                "", 100.0 * cache_hits / max(1, cache_hits + cache_misses), cache_hits, cache_misses))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import random
+import shutil
+import socket
+import tempfile
+
+import overlay
+
+from utils import dhtutils
+
+"""
+| ===================================================================
+| run: one simulation, returns hits, latencies and stats by node
+| ===================================================================
+"""
+
+def run(opt, nodes, routing, seed):
+    rng = random.Random(seed)
+    keys = ["key%d" % i for i in xrange(opt.keys)]
+    sample = overlay.zipf_sampler(keys, opt.zipf, rng)
+
+    workdir = tempfile.mkdtemp()
+    servents = overlay.Overlay(workdir, opt.base_port, ["--routing", routing, "--advertise", "127.0.0.1"])
+    if routing == "dht":
+        # Every servent knows the whole membership and stores the keys the ring assigns to it
+        neighbors = dict((node, set(xrange(nodes)) - set([node])) for node in xrange(nodes))
+        services = dict((key, "%d/tcp" % rng.randrange(1, 65536)) for key in keys)
+        by_addr = dhtutils.partition(services, [servents.address(node) for node in xrange(nodes)])
+        catalogs = dict((node, by_addr[servents.address(node)]) for node in xrange(nodes))
+    else:
+        neighbors = overlay.make_topology("random", nodes, opt.degree, rng)
+        catalogs = overlay.place_keys(keys, nodes, 1, rng)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    latencies = []
+    try:
+        servents.start(neighbors, catalogs)
+        for _ in xrange(opt.lookups):
+            latency = overlay.lookup(sock, servents.address(rng.randrange(nodes)), sample(), opt.timeout)
+            if latency is not None:
+                latencies.append(latency)
+    finally:
+        sock.close()
+        stats = servents.stop()
+        shutil.rmtree(workdir)
+    return latencies, stats
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=[8, 16, 32, 64], nargs="*", help="overlay sizes to simulate")
+    parser.add_argument('--degree', type=int, default=3, help="average degree of the flooding topology")
+    parser.add_argument('--keys', type=int, default=200, help="distinct keys, each stored on one servent")
+    parser.add_argument('--zipf', type=float, default=1.0, help="Zipf exponent of key popularity, 0 is uniform")
+    parser.add_argument('--lookups', type=int, default=300, help="lookups per run")
+    parser.add_argument('--timeout', type=float, default=0.5, help="seconds to wait for the first answer")
+    parser.add_argument('--base_port', type=int, default=8000, help="first port of the overlay")
+    parser.add_argument('--seed', type=int, default=1, help="seed for topology, placement and workload")
+    opt = parser.parse_args()
+
+    for nodes in opt.nodes:
+        for routing in ("flood", "dht"):
+            latencies, stats = run(opt, nodes, routing, opt.seed)
+            messages = opt.lookups + sum(overlay.total(stats, counter) for counter in ("forwards", "responses_sent"))
+            line = "%3d nodes %-5s hit rate %5.1f%%  messages/lookup %7.2f  latency %6.2fms" % (
+                nodes, routing, 100.0 * len(latencies) / opt.lookups, float(messages) / opt.lookups,
+                1000.0 * sum(latencies) / max(1, len(latencies)))
+            if routing == "dht":
+                line += "  hops %4.2f" % (float(overlay.total(stats, "routed_hops")) /
+                                          max(1, overlay.total(stats, "routed_lookups")))
+            print(line)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import overlay
+
+"""
+| ===================================================================
+| read_stats: latest stats dumped by every running servent
+| ===================================================================
+"""
+
+def read_stats(servents):
+    stats = dict()
+    for node in servents.procs:
+        try:
+            with open(os.path.join(servents.workdir, "node%d.json" % node)) as stats_json:
+                stats[node] = json.load(stats_json)
+        except (IOError, ValueError):
+            continue
+    return stats
+
+"""
+| ===================================================================
+| wait_for: polls the servents stats until every one of them agrees
+| ===================================================================
+"""
+
+def wait_for(servents, converged, max_time, started=None, poll=0.5):
+    """Seconds since started until converged(stats) held for every running servent, None past max_time"""
+    started = started or time.time()
+    while time.time() - started < max_time:
+        stats = read_stats(servents)
+        if len(stats) == len(servents.procs) and all(converged(node_stats) for node_stats in stats.values()):
+            return time.time() - started
+        time.sleep(poll)
+    return None
+
+def view(node_stats):
+    return node_stats.get("membership", {})
+
+def members(node_stats):
+    """Servents in a view, suspected ones included: they stay members until declared dead"""
+    return view(node_stats).get("alive", 0) + view(node_stats).get("suspect", 0)
+
+"""
+| ===================================================================
+| gossip_rate: bytes of gossip sent per second by each servent
+| ===================================================================
+"""
+
+def gossip_rate(servents, seconds):
+    before = read_stats(servents)
+    time.sleep(seconds)
+    after = read_stats(servents)
+    sent = sum(after[node].get("gossip_bytes_sent", 0) - before[node].get("gossip_bytes_sent", 0)
+               for node in after if node in before)
+    return sent / seconds / max(1, len(after))
+
+"""
+| ===================================================================
+| run: join, crash and leave rounds on one overlay of nodes servents
+| ===================================================================
+"""
+
+def run(opt, nodes, rng):
+    workdir = tempfile.mkdtemp()
+    servents = overlay.Overlay(workdir, opt.base_port, ["--log_level", "WARNING", "--sync_interval", "0",
+                                                       "--advertise", "127.0.0.1",
+                                                       "--stats_interval", str(opt.stats_interval),
+                                                       "--heartbeat_interval", str(opt.interval),
+                                                       "--max_peers", str(opt.max_peers)])
+    result = dict(nodes=nodes, interval=opt.interval, max_peers=opt.max_peers)
+    try:
+
+        # Everyone joins through the first servent, learning the rest of the overlay by gossip
+        seed = "%s:%d" % servents.address(0)
+        node_args = dict((node, ["--seed", seed] if node else ["--gossip"]) for node in xrange(nodes))
+        started = time.time()
+        servents.start(dict((node, set()) for node in xrange(nodes)), {}, node_args, wait=0)
+        spawned = time.time() - started
+        joined = wait_for(servents, lambda node_stats: members(node_stats) == nodes - 1, opt.max_time)
+        result.update(spawn_s=spawned, join_s=joined and joined + spawned)
+        result["steady_bytes_per_s"] = gossip_rate(servents, opt.window)
+        stats = read_stats(servents)
+        peers = [node_stats.get("peers", 0) for node_stats in stats.values()]
+        result.update(min_peers=min(peers), max_peers_seen=max(peers))
+
+        # Live servents suspected at one moment, all of them wrongly since nobody crashed yet
+        result["suspects_per_view"] = sum(view(node_stats).get("suspect", 0)
+                                          for node_stats in stats.values()) / float(max(1, len(stats)))
+
+        # Crashed servents have to be suspected, then declared dead by everyone left
+        crashed = rng.sample(range(1, nodes), max(1, int(nodes * opt.churn)))
+        killed = time.time()
+        servents.kill(crashed)
+        result["crash_dead_s"] = wait_for(servents, lambda node_stats: view(node_stats).get("dead") == len(crashed),
+                                          opt.max_time, killed)
+
+        # Servents leaving say so, no suspicion period involved
+        leaving = rng.sample(sorted(set(servents.procs) - set([0])), max(1, int(nodes * opt.churn)))
+        left = time.time()
+        for node in leaving:
+            servents.procs.pop(node).send_signal(signal.SIGTERM)
+        live = nodes - len(crashed) - len(leaving)
+        result["leave_s"] = wait_for(servents, lambda node_stats: members(node_stats) == live - 1, opt.max_time, left)
+    finally:
+        servents.stop()
+        shutil.rmtree(workdir)
+    return result
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, nargs="*", default=[64, 256], help="overlay sizes")
+    parser.add_argument('--interval', type=float, default=0.5, help="servent --heartbeat_interval, in seconds")
+    parser.add_argument('--max_peers', type=int, default=8, help="servent --max_peers")
+    parser.add_argument('--stats_interval', type=float, default=0.5,
+                        help="servent --stats_interval, how stale the views we poll may be")
+    parser.add_argument('--churn', type=float, default=0.05, help="fraction of servents crashed, then leaving")
+    parser.add_argument('--window', type=float, default=5.0, help="seconds gossip bandwidth is measured over")
+    parser.add_argument('--max_time', type=float, default=120.0, help="give up waiting for convergence after this")
+    parser.add_argument('--base_port', type=int, default=9000, help="first port of the overlay")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the servents crashed and leaving")
+    parser.add_argument('--output', type=str, metavar="PATH", default=None, help="write the results here as JSON")
+    opt = parser.parse_args()
+
+    def seconds(value):
+        return "%7.2fs" % value if value is not None else "  never"
+
+    results = []
+    print("%5s %8s %8s %12s %10s %8s %8s %8s" % ("nodes", "spawn", "join", "gossip B/s", "peers", "suspects",
+                                                 "dead", "leave"))
+    for nodes in opt.nodes:
+        result = run(opt, nodes, random.Random(opt.seed))
+        results.append(result)
+        print("%5d %8s %8s %12.0f %5d-%-4d %8.2f %8s %8s" % (
+            nodes, seconds(result["spawn_s"]), seconds(result["join_s"]), result["steady_bytes_per_s"],
+            result["min_peers"], result["max_peers_seen"], result["suspects_per_view"],
+            seconds(result["crash_dead_s"]), seconds(result["leave_s"])))
+        sys.stdout.flush()
+
+    if opt.output:
+        with open(opt.output, "w") as output:
+            json.dump(dict(argv=sys.argv[1:], results=results), output, indent=2, sort_keys=True)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import itertools
+import json
+import sys
+
+import suite
+
+from utils import utils
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=64, help="servents in the overlay")
+    parser.add_argument('--degrees', type=int, nargs="*", default=[4, 8, 16], help="average degrees of the overlay")
+    parser.add_argument('--fanouts', type=int, nargs="*", default=[0, 2], help="servent --fanout values, 0 floods")
+    parser.add_argument('--failures', type=float, nargs="*", default=[0.0, 0.25],
+                        help="fractions of servents killed before lookups start")
+    parser.add_argument('--heartbeat', type=float, default=0.5, help="servent --heartbeat_interval, in seconds")
+    parser.add_argument('--workload', type=str, default="uniform", help="key popularity, 'uniform' or 'zipf:S'")
+    parser.add_argument('--rate', type=float, default=25.0,
+                        help="target lookups per second, flooding a dense overlay must not overrun socket buffers")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds lookups are sent for")
+    parser.add_argument('--keys', type=int, default=1000, help="distinct keys in the overlay")
+    parser.add_argument('--replicas', type=int, default=8, help="servents each key is placed on")
+    parser.add_argument('--clients', type=int, default=4, help="clients, each on its own entry servent")
+    parser.add_argument('--retries', type=int, default=1, help="retries of an unanswered lookup")
+    parser.add_argument('--seed', type=int, default=1, help="seed for topology, placement, failures and workload")
+    parser.add_argument('--base_port', type=int, default=9000, help="first port of the overlay")
+    parser.add_argument('--output', type=str, metavar="PATH", default=None, help="write the results here as JSON")
+    opt = parser.parse_args()
+
+    # Dead peers are noticed after HEALTH_MAX_MISSED heartbeats, lookups start once they all had the chance
+    settle = opt.heartbeat * (utils.HEALTH_MAX_MISSED + 1) + 0.5
+
+    results = []
+    # Heartbeats go on whatever the load, they are shown per servent and second instead of per lookup
+    print("%6s %6s %8s %9s %7s %10s %10s %9s %8s %8s %8s" % (
+        "degree", "fanout", "failures", "heartbeat", "hits", "msgs/lkp", "fwds/lkp", "skipped", "hb/s", "p99",
+        "drops"))
+    for degree, fanout, failures in itertools.product(opt.degrees, opt.fanouts, opt.failures):
+
+        # Without failures heartbeats only add their own traffic, with them we compare noticing the dead or not
+        for heartbeat in ([opt.heartbeat, 0] if failures else [opt.heartbeat]):
+            opt.degree = degree
+            opt.servent_args = ["--fanout", str(fanout), "--heartbeat_interval", str(heartbeat)]
+            result = suite.run(opt, "random", opt.nodes, opt.workload, opt.rate, opt.seed, failures, settle)
+            result.update(degree=degree, fanout=fanout, heartbeat=heartbeat)
+            results.append(result)
+            print("%6d %6d %7.0f%% %8.1fs %6.1f%% %10.2f %10.2f %9d %8.1f %6.2fms %8s" % (
+                degree, fanout, 100 * failures, heartbeat, 100 * result["hit_rate"],
+                result["messages_per_lookup"] - result["heartbeats_per_lookup"], result["forwards_per_lookup"],
+                result["forwards_skipped"], result["heartbeats_per_node_s"], result["p99_ms"], result["udp_drops"]))
+            sys.stdout.flush()
+
+    if opt.output:
+        with open(opt.output, "w") as output:
+            json.dump(dict(revision=suite.revision(), argv=sys.argv[1:], results=results), output, indent=2,
+                      sort_keys=True)
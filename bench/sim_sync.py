@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import itertools
+import random
+import shutil
+import socket
+import tempfile
+import time
+
+import overlay
+
+from utils import clientutils, protocol, utils
+
+"""
+| ===================================================================
+| local_keys: keys a servent holds itself, asked with a TTL 0 IDQUERY
+| ===================================================================
+"""
+
+# Servents drop a (origin, request id, key) they have already seen, every check needs its own id
+request_ids = itertools.count(1)
+
+def local_keys(sock, srv_addr, keys, timeout=0.2):
+    for send_message in protocol.build_idquery(0, sock.getsockname(), next(request_ids), 1, keys):
+        sock.sendto(send_message, srv_addr)
+    found = dict()
+    sock.settimeout(timeout)
+    try:
+        while len(found) < len(keys):
+            recv_data, _ = sock.recvfrom(utils.MAX_BUFFER_SIZE)
+            found.update(protocol.parse_responses(recv_data, "IDRESPONSE"))
+    except socket.timeout:
+        pass
+    return found
+
+"""
+| ===================================================================
+| run: writes spread over the overlay, then waits for convergence
+| ===================================================================
+"""
+
+def run(opt, rng):
+    workdir = tempfile.mkdtemp()
+    servents = overlay.Overlay(workdir, opt.base_port, ["--advertise", "127.0.0.1", "--replicas", str(opt.replicas),
+                                                        "--sync_interval", str(opt.interval)])
+    neighbors = overlay.make_topology(opt.topology, opt.nodes, opt.degree, rng)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    try:
+        servents.start(neighbors, dict())
+
+        # Every write goes to a random servent, which pushes it to its replicas peers
+        written = dict(("key%d" % i, "%d/tcp" % rng.randrange(1, 65536)) for i in xrange(opt.writes))
+        clients = [clientutils.PipelinedClient(*servents.address(node)) for node in xrange(opt.nodes)]
+        for key, value in written.iteritems():
+            rng.choice(clients).submit_write(key, value)
+        for client in clients:
+            while client.pending():
+                client.poll()
+            client.close()
+        began = time.time()
+
+        # Converged once every servent holds every write
+        converged = None
+        while time.time() - began < opt.max_time:
+            behind = sum(1 for node in xrange(opt.nodes)
+                         if local_keys(sock, servents.address(node), written.keys()) != written)
+            if not behind:
+                converged = time.time() - began
+                break
+            time.sleep(opt.interval / 2)
+    finally:
+        sock.close()
+        stats = servents.stop()
+        shutil.rmtree(workdir)
+    table_bytes = sum(len(datagram) for datagram in
+                      protocol.build_replicate([(key, (1, 0, value)) for key, value in written.iteritems()]))
+    return converged, stats, table_bytes
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=16, help="servents in the overlay")
+    parser.add_argument('--topology', type=str, default="random", choices=["line", "ring", "random"])
+    parser.add_argument('--degree', type=int, default=3, help="average degree of random topologies")
+    parser.add_argument('--writes', type=int, nargs="*", default=[100, 1000], help="distinct keys written per run")
+    parser.add_argument('--replicas', type=int, default=utils.REPLICAS, help="peers each write is pushed to")
+    parser.add_argument('--interval', type=float, default=0.5, help="seconds between anti-entropy rounds")
+    parser.add_argument('--max_time', type=float, default=60.0, help="give up waiting for convergence after this")
+    parser.add_argument('--base_port', type=int, default=8000, help="first port of the overlay")
+    parser.add_argument('--seed', type=int, default=1, help="seed for topology and workload")
+    opt = parser.parse_args()
+
+    for writes in opt.writes:
+        opt.writes = writes
+        converged, stats, table_bytes = run(opt, random.Random(opt.seed))
+        rounds = max(1, overlay.total(stats, "sync_rounds"))
+        sync_bytes = overlay.total(stats, "sync_bytes_sent")
+        print("%5d writes  converged in %s  %5d rounds  %8.0f bytes/round  whole table %7d bytes  push %7d bytes" % (
+            writes, "%.1fs" % converged if converged is not None else "never", rounds, float(sync_bytes) / rounds,
+            table_bytes, overlay.total(stats, "replication_bytes_sent")))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import overlay
+
+from utils import clientutils, statsutils
+
+# Metrics compared against a baseline, and whether a higher value is the better one
+TRACKED = (("throughput", True), ("hit_rate", True), ("p50_ms", False), ("p99_ms", False),
+           ("messages_per_lookup", False), ("rss_mb_per_node", False), ("cpu_ms_per_lookup", False))
+
+"""
+| ===================================================================
+| parse_workload: "uniform" or "zipf[:s]" into a Zipf exponent
+| ===================================================================
+"""
+
+def parse_workload(workload):
+    if workload == "uniform":
+        return 0.0
+    name, _, exponent = workload.partition(":")
+    if name != "zipf":
+        raise ValueError("unknown workload %s" % workload)
+    return float(exponent or 1.0)
+
+"""
+| ===================================================================
+| drive: open-loop lookups at rate per second, spread over clients
+| ===================================================================
+"""
+
+def drive(clients, sample, rate, duration, rng):
+    """Returns every Lookup submitted, once all of them are done, and the seconds it took"""
+    lookups = []
+    interval = 1.0 / rate
+    started = time.time()
+    next_send = started
+    deadline = started + duration
+    while True:
+
+        # Lookups are due on a fixed schedule whatever the answers, a slow overlay builds a backlog
+        now = time.time()
+        while next_send <= now and next_send < deadline:
+            lookups.append(rng.choice(clients).submit(sample()))
+            next_send += interval
+        if next_send >= deadline and not sum(client.pending() for client in clients):
+            break
+        for client in clients:
+            client.flush()
+        wakeups = [client.next_deadline() for client in clients if client.next_deadline() is not None]
+        wakeups.append(next_send if next_send < deadline else now + 0.05)
+        readable, writable, _ = select.select([sock for client in clients for sock in client.readers()],
+                                              [sock for client in clients for sock in client.writers()], [],
+                                              max(0.0, min(wakeups) - time.time()))
+
+        # Lookups are all in the list already, what each client hands back done is only drained
+        for client in clients:
+            client.handle(readable, writable)
+    return lookups, time.time() - started
+
+"""
+| ===================================================================
+| run: one scenario on a fresh overlay, returns its metrics
+| ===================================================================
+"""
+
+def run(opt, topology, nodes, workload, rate, seed, failures=0.0, settle=0.0):
+    rng = random.Random(seed)
+    keys = ["key%d" % i for i in xrange(opt.keys)]
+    sample = overlay.zipf_sampler(keys, parse_workload(workload), rng)
+    neighbors = overlay.make_topology(topology, nodes, opt.degree, rng)
+    catalogs = overlay.place_keys(keys, nodes, opt.replicas, rng)
+
+    workdir = tempfile.mkdtemp()
+    servents = overlay.Overlay(workdir, opt.base_port, ["--log_level", "WARNING", "--sync_interval", "0",
+                                                       "--advertise", "127.0.0.1"] + opt.servent_args)
+    clients = []
+    try:
+        servents.start(neighbors, catalogs)
+
+        # A fraction of the servents crashes before traffic starts, clients only enter through the others
+        dead = set(rng.sample(xrange(nodes), int(nodes * failures)))
+        servents.kill(dead)
+        time.sleep(settle)
+        live = [node for node in xrange(nodes) if node not in dead]
+        entries = rng.sample(live, min(opt.clients, len(live)))
+        clients = [clientutils.PipelinedClient(*servents.address(node), retries=opt.retries) for node in entries]
+        before = servents.usage()
+        drops = overlay.udp_drops()
+        lookups, elapsed = drive(clients, sample, rate, opt.duration, rng)
+        if drops is not None:
+            drops = overlay.udp_drops() - drops
+        after = servents.usage()
+    finally:
+        for client in clients:
+            client.close()
+        stats = servents.stop()
+        shutil.rmtree(workdir)
+
+    latency = statsutils.Histogram()
+    for lookup in lookups:
+        if lookup.answers:
+            latency.record(lookup.latency * 1e6)
+    answered = latency.count
+
+    # Every datagram a servent handled or answered with, client requests included. Heartbeats go on whatever
+    # the load, they are counted apart so that lookup traffic can be compared across degrees
+    messages = (sum(sum(node_stats.get("messages", {}).values()) for node_stats in stats.values()) +
+                overlay.total(stats, "responses_sent") + overlay.total(stats, "responses_relayed"))
+    heartbeats = sum(node_stats.get("messages", {}).get(name, 0) for node_stats in stats.values()
+                     for name in ("PING", "PONG"))
+    cpu = sum(after[node][1] - before[node][1] for node in after if node in before)
+    result = dict(topology=topology, nodes=nodes, workload=workload, rate=rate, seed=seed,
+                  lookups=len(lookups), answered=answered, elapsed=elapsed,
+                  offered=len(lookups) / opt.duration, throughput=answered / elapsed,
+                  hit_rate=float(answered) / max(1, len(lookups)),
+                  p50_ms=(latency.percentile(50) or 0) / 1e3, p99_ms=(latency.percentile(99) or 0) / 1e3,
+                  max_ms=(latency.max or 0) / 1e3, messages_per_lookup=float(messages) / max(1, len(lookups)),
+                  rss_mb_per_node=sum(rss for rss, _ in after.values()) / 1048576.0 / max(1, len(after)),
+                  cpu_ms_per_lookup=1e3 * cpu / max(1, len(lookups)),
+                  forwards_per_lookup=overlay.total(stats, "forwards") / float(max(1, len(lookups))),
+                  forwards_skipped=overlay.total(stats, "forwards_skipped"),
+                  heartbeats_per_lookup=float(heartbeats) / max(1, len(lookups)),
+                  heartbeats_per_node_s=heartbeats / max(1e-9, overlay.total(stats, "uptime")), udp_drops=drops)
+    if failures:
+        result["failures"] = failures
+    return result
+
+"""
+| ===================================================================
+| compare: flags metrics that got worse than baseline by tolerance
+| ===================================================================
+"""
+
+def scenario_key(result):
+    return result["topology"], result["nodes"], result["workload"], result["rate"], result["seed"]
+
+def compare(results, baseline, tolerance):
+    previous = dict((scenario_key(result), result) for result in baseline["results"])
+    regressions = []
+    for result in results:
+        old = previous.get(scenario_key(result))
+        if old is None:
+            continue
+        for metric, higher_is_better in TRACKED:
+            before, now = old.get(metric), result.get(metric)
+            if not before or now is None:
+                continue
+            change = (now - before) / float(before)
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append((scenario_key(result), metric, before, now, change))
+    return regressions
+
+"""
+| ===================================================================
+| revision: the commit being measured, if run from a git checkout
+| ===================================================================
+"""
+
+def revision():
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=overlay.ROOT, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+"""
+| ===================================================================
+| main program
+| ===================================================================
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--topologies', type=str, nargs="*", default=["line", "ring", "random"],
+                        choices=["line", "ring", "random"])
+    parser.add_argument('--nodes', type=int, nargs="*", default=[16, 64], help="overlay sizes")
+    parser.add_argument('--workloads', type=str, nargs="*", default=["uniform", "zipf:1.0"],
+                        help="key popularity, 'uniform' or 'zipf:S'")
+    parser.add_argument('--rates', type=float, nargs="*", default=[200.0], help="target lookups per second")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds lookups are sent for")
+    parser.add_argument('--keys', type=int, default=1000, help="distinct keys in the overlay")
+    parser.add_argument('--replicas', type=int, default=2, help="servents each key is placed on")
+    parser.add_argument('--degree', type=int, default=3, help="average degree of random topologies")
+    parser.add_argument('--clients', type=int, default=4, help="clients, each on its own entry servent")
+    parser.add_argument('--retries', type=int, default=1, help="retries of an unanswered lookup")
+    parser.add_argument('--seed', type=int, default=1, help="seed for topology, placement and workload")
+    parser.add_argument('--base_port', type=int, default=9000, help="first port of the overlay")
+    parser.add_argument('--servent_args', type=str, default="", help="extra servent.py arguments, quoted")
+    parser.add_argument('--output', type=str, metavar="PATH", default=None, help="write the results here as JSON")
+    parser.add_argument('--baseline', type=str, metavar="PATH", default=None,
+                        help="results of an earlier run to compare with, exits with 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="relative change tolerated by --baseline")
+    opt = parser.parse_args()
+    opt.servent_args = opt.servent_args.split()
+
+    results = []
+    print("%-7s %5s %-10s %7s %9s %7s %8s %8s %10s %8s %9s" % (
+        "topo", "nodes", "workload", "rate", "lookups/s", "hits", "p50", "p99", "msgs/lkp", "rss/node",
+        "cpu/lkp"))
+    for topology, nodes, workload, rate in itertools.product(opt.topologies, opt.nodes, opt.workloads, opt.rates):
+        result = run(opt, topology, nodes, workload, rate, opt.seed)
+        results.append(result)
+        print("%-7s %5d %-10s %7.0f %9.1f %6.1f%% %6.2fms %6.2fms %10.2f %6.1fMB %7.3fms" % (
+            topology, nodes, workload, rate, result["throughput"], 100 * result["hit_rate"], result["p50_ms"],
+            result["p99_ms"], result["messages_per_lookup"], result["rss_mb_per_node"],
+            result["cpu_ms_per_lookup"]))
+        sys.stdout.flush()
+
+    report = dict(revision=revision(), started=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(),
+                  platform=platform.platform(), argv=sys.argv[1:], results=results)
+    if opt.output:
+        with open(opt.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if opt.baseline:
+        with open(opt.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), opt.tolerance)
+        for key, metric, before, now, change in regressions:
+            print("REGRESSION %s %s: %.4g -> %.4g (%+.1f%%)" % ("/".join(str(field) for field in key), metric,
+                                                                before, now, 100 * change))
+        if regressions:
+            sys.exit(1)
@@ -45,6 +45,23 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('server', type=str, metavar="host:port", help="ip:port of running server")
+    parser.add_argument('--keys_file', type=str, metavar="PATH", default=None,
+                        help="look up every key in this file ('-' for stdin) in batches and print the answers")
+    parser.add_argument('--window', type=int, metavar="N", default=utils.MULTIREQ_WINDOW,
+                        help="max number of keys in flight with --keys_file")
+    parser.add_argument('--answers', type=int, metavar="N", default=1,
+                        help="with --keys_file, a lookup is done after this many answers or once it times out")
+    parser.add_argument('--retries', type=int, metavar="N", default=utils.CLIENT_RETRIES,
+                        help="with --keys_file, times an unanswered lookup is sent again")
+    parser.add_argument('--put', type=str, nargs=2, metavar=("KEY", "VALUE"), default=None,
+                        help="store VALUE under KEY and exit")
+    parser.add_argument('--delete', type=str, metavar="KEY", default=None, help="delete KEY and exit")
+    parser.add_argument('--glob', type=str, metavar="PATTERN", default=None,
+                        help="print the keys matching PATTERN (e.g. 'http*') and exit")
+    parser.add_argument('--limit', type=int, metavar="N", default=utils.GLOB_LIMIT,
+                        help="with --glob, max number of keys each servent answers with")
+    parser.add_argument('--after', type=str, metavar="KEY", default="",
+                        help="with --glob, only keys sorting after KEY, to fetch the next page")
     opt = parser.parse_args()
 
     # connection parameters
@@ -53,6 +70,54 @@ if __name__ == "__main__":
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
+    # One-shot writes, acknowledged by the servent that takes them
+    if opt.put or opt.delete:
+        sock.close()
+        client = clientutils.PipelinedClient(srv_host, srv_port, retries=opt.retries)
+        key, value = opt.put if opt.put else (opt.delete, None)
+        if client.write(key.lower(), value).answers:
+            logger.info("%s '%s' acknowledged", "Stored" if value is not None else "Deleted", key.lower())
+        else:
+            logger.warning("No acknowledgement for '%s'", key.lower())
+        client.close()
+        sys.exit(0)
+
+    # One-shot pattern search, a page of matches merged from every servent that answered
+    if opt.glob:
+        sock.close()
+        client = clientutils.PipelinedClient(srv_host, srv_port, retries=opt.retries)
+        lookup = client.glob(opt.glob.lower(), opt.limit, opt.after.lower())
+        for key, value in lookup.matches:
+            sys.stdout.write("%s\t%s\n" % (key, value))
+        if lookup.cursor is not None:
+            logger.warning("More keys match, run again with --after '%s'", lookup.cursor)
+        client.close()
+        sys.exit(0)
+
+    # Non-interactive mode, answers are streamed to stdout as "key<TAB>value" lines as lookups complete
+    if opt.keys_file:
+        sock.close()
+        client = clientutils.PipelinedClient(srv_host, srv_port, opt.window, opt.retries)
+        keys_file = sys.stdin if opt.keys_file == "-" else open(opt.keys_file)
+        keys = (line.strip().lower() for line in keys_file if line.strip())
+        unanswered = 0
+        try:
+            for lookup in client.lookup_many(keys, opt.answers):
+                if not lookup.answers:
+                    logger.warning("Nothing was received for '%s'", lookup.key)
+                    unanswered += 1
+                for value in lookup.values:
+                    sys.stdout.write("%s\t%s\n" % (lookup.key, value))
+                sys.stdout.flush()
+            logger.info("%d keys were not found, %d retries, rto %.3fs", unanswered, client.counters["retries"],
+                        client.rto)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            keys_file.close()
+            client.close()
+        sys.exit(0)
+
     def flush():
         sys.stdout.write("Enter a service name to search: ")
         sys.stdout.flush()
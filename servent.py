@@ -24,17 +24,161 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 import argparse
+import errno
+import json
 import logging
+import os
 import random
+import signal
 import socket
-import struct
+import sys
+import threading
+import time
 
-from utils import utils, serventutils
+from utils import (utils, serventutils, cacheutils, eventloop, protocol, peerutils, reloadutils, dhtutils,
+                   streamutils, memberutils)
 
 # Logging setup
 logging.basicConfig(level=logging.DEBUG, format="[%(asctime)s][%(levelname)s] %(message)s",
                     datefmt="%m-%d-%Y %I:%M:%S %p")
 
+"""
+| ===================================================================
+| bind_socket: creates the servent UDP socket
+| ===================================================================
+"""
+
+def bind_socket(srv_host, srv_port, reuse_port=False):
+    srv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    srv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+
+        # Python 2 doesn't export SO_REUSEPORT, 15 is its value on Linux
+        srv_sock.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_REUSEPORT", 15), 1)
+    srv_sock.bind((srv_host, srv_port))
+    return srv_sock
+
+"""
+| ===================================================================
+| dump_stats: writes stats as JSON to stats_file, or a line on stdout
+| ===================================================================
+"""
+
+def dump_stats(stats, stats_file=None):
+    if not stats_file:
+        sys.stdout.write(json.dumps(stats, sort_keys=True) + "\n")
+        sys.stdout.flush()
+        return
+
+    # Readers polling stats_file never see it half written
+    with open(stats_file + ".tmp", "w") as stats_json:
+        json.dump(stats, stats_json)
+    os.rename(stats_file + ".tmp", stats_file)
+
+"""
+| ===================================================================
+| serve: runs a servent until interrupted
+| ===================================================================
+"""
+
+def serve(srv_sock, servent, event_loop, reloader, stats_file=None, sync_interval=0, stream_sock=None,
+          stats_interval=0):
+    logger = logging.getLogger(__name__)
+
+    # Large values are fetched over TCP on the same port, served from a thread reading the same table
+    value_server = None
+    if stream_sock is not None:
+        value_server = streamutils.ValueServer(stream_sock, servent.service_list.get)
+        value_server.start()
+
+    def collect_stats():
+        stats = servent.stats()
+        if value_server is not None:
+            stats["large_fetches"] = value_server.fetches
+            stats["large_bytes_sent"] = value_server.bytes_sent
+            stats["large_refused"] = value_server.refused
+        return stats
+
+    # Stats are dumped every stats_interval seconds and on SIGUSR1, besides on exit. The handler only asks for
+    # a dump, the loop writes it between datagrams, where no counter is halfway through an update
+    dump_requested = threading.Event()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: dump_requested.set())
+    periodic = [(interval, callback) for interval, callback in
+                ((sync_interval, servent.sync), (stats_interval, lambda: dump_stats(collect_stats(), stats_file)),
+                 (servent.heartbeat_interval, servent.heartbeat))
+                if interval > 0]
+
+    # SIGTERM goes through the same cleanup as Ctrl+C, so stats still get written. The handler only asks the
+    # loop to stop, a SystemExit raised in the middle of a datagram could be swallowed by its bare excepts
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+    # The service list is swapped under the servent by the reloader thread, on file changes or SIGHUP
+    reloader.on_swap = servent.swap_service_list
+    if servent.membership is not None:
+        servent.join()
+    reloader.start()
+    signal.signal(signal.SIGHUP, lambda signum, frame: reloader.trigger())
+    try:
+        if event_loop:
+            loop = eventloop.EventLoop()
+            loop.add_datagram_handler(srv_sock, servent.handle)
+            for interval, callback in periodic:
+                loop.call_every(interval, callback)
+
+            # Stopping the loop instead of raising, a SystemExit landing inside a send could be swallowed
+            loop.add_signal_handler(signal.SIGTERM, loop.stop)
+            loop.add_signal_handler(signal.SIGUSR1, lambda: dump_stats(collect_stats(), stats_file))
+            loop.run()
+            loop.close()
+        else:
+            packet_buffer = protocol.PacketBuffer()
+            due = [time.time() + interval for interval, _ in periodic]
+            while not stopping.is_set():
+                if dump_requested.is_set():
+                    dump_requested.clear()
+                    dump_stats(collect_stats(), stats_file)
+
+                # Periodic tasks are run between datagrams, recvfrom never waits past the next one due
+                timeout = utils.RECV_TIMEOUT
+                for i, (interval, callback) in enumerate(periodic):
+                    if time.time() >= due[i]:
+                        callback()
+                        due[i] = time.time() + interval
+                    timeout = min(timeout, due[i] - time.time())
+                srv_sock.settimeout(max(0.001, timeout))
+                recv_data = None
+                try:
+                    recv_data, ip_addr = packet_buffer.recvfrom(srv_sock)
+                    srv_sock.settimeout(None)
+                except socket.timeout:
+                    pass
+                except socket.error, e:
+
+                    # Signals such as SIGHUP (reload) interrupt recvfrom, that's not an error
+                    if e.errno == errno.EINTR:
+                        continue
+                    logger.error(str(e))
+                    break
+
+                if recv_data:
+                    servent.handle(recv_data, ip_addr)
+    except KeyboardInterrupt:
+        print ("Bye =)")
+    finally:
+        logger.info("Query history: %(size)d entries, %(hits)d duplicates dropped, %(misses)d new, "
+                    "%(evictions)d evictions", servent.query_history.stats())
+        if servent.response_cache is not None:
+            logger.info("Response cache: %(size)d entries, %(hits)d hits, %(misses)d misses, %(evictions)d evictions",
+                        servent.response_cache.stats())
+        if servent.membership is not None:
+            servent.leave()
+        if stats_file:
+            dump_stats(collect_stats(), stats_file)
+        if value_server is not None:
+            value_server.close()
+        srv_sock.close()
+
 """
 | ===================================================================
 | main program
@@ -45,111 +189,175 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('port', type=int, metavar="port", default='65535', help="port of running server")
-    parser.add_argument('input_file', type=str, metavar="input_file", help="input file")
+    parser.add_argument('input_file', type=str, metavar="input_file",
+                        help="input file, either a text services file or a store built by compile_store.py")
     parser.add_argument('--other_peers', type=str, metavar="HOST:PORT", default=[], nargs="*",
                         help="other peers executing the system")
+    parser.add_argument('--history_size', type=int, metavar="N", default=utils.QUERY_HISTORY_SIZE,
+                        help="max number of queries remembered for duplicate suppression")
+    parser.add_argument('--history_ttl', type=float, metavar="SECONDS", default=utils.QUERY_HISTORY_TTL,
+                        help="how long a query is remembered for duplicate suppression")
+    parser.add_argument('--event_loop', action="store_true",
+                        help="serve from a non-blocking event loop instead of the blocking recvfrom loop")
+    parser.add_argument('--workers', type=int, metavar="N", default=1,
+                        help="number of worker processes sharing the port through SO_REUSEPORT")
+    parser.add_argument('--cache', action="store_true",
+                        help="relay answers to our clients and cache them, so repeated keys aren't flooded again")
+    parser.add_argument('--cache_size', type=int, metavar="N", default=utils.RESPONSE_CACHE_SIZE,
+                        help="max number of keys in the response cache")
+    parser.add_argument('--cache_ttl', type=float, metavar="SECONDS", default=utils.RESPONSE_CACHE_TTL,
+                        help="how long cached responses are served")
+    parser.add_argument('--advertise', type=str, metavar="HOST", default=None,
+                        help="address other peers reach us at, used as query origin with --cache, ring id, write tag "
+                             "and where large values are fetched from, without it they are sent inline")
+    parser.add_argument('--routing', type=str, choices=["flood", "dht"], default="flood",
+                        help="flood queries to every peer, or route them over a consistent hashing ring of the peers")
+    parser.add_argument('--replicas', type=int, metavar="K", default=utils.REPLICAS,
+                        help="number of peers every PUT and DELETE taken here is pushed to")
+    parser.add_argument('--sync_interval', type=float, metavar="SECONDS", default=utils.SYNC_INTERVAL,
+                        help="run an anti-entropy round with a random peer this often, 0 disables it")
+    parser.add_argument('--stats_file', type=str, metavar="PATH", default=None,
+                        help="write counters as JSON here on exit, suffixed by worker number with --workers")
+    parser.add_argument('--reload_interval', type=float, metavar="SECONDS", default=0,
+                        help="check input_file for changes this often and reload it, SIGHUP always reloads")
+    parser.add_argument('--stats_interval', type=float, metavar="SECONDS", default=0,
+                        help="dump stats this often, to --stats_file or as JSON lines on stdout, SIGUSR1 always dumps")
+    parser.add_argument('--log_level', type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="DEBUG",
+                        help="WARNING and above log nothing per datagram")
+    parser.add_argument('--large_threshold', type=int, metavar="BYTES", default=utils.LARGE_VALUE_THRESHOLD,
+                        help="values above this size are announced and fetched over TCP on the same port, "
+                             "with --advertise")
+    parser.add_argument('--heartbeat_interval', type=float, metavar="SECONDS", default=utils.HEARTBEAT_INTERVAL,
+                        help="ping peers not heard from this often, skip those missing pings, 0 disables it")
+    parser.add_argument('--fanout', type=int, metavar="K", default=0,
+                        help="forward each query to K healthy peers picked by answer rate and RTT, 0 for all of them")
+    parser.add_argument('--seed', type=str, metavar="HOST:PORT", default=[], nargs="*",
+                        help="servents to join the overlay through, peers are then learned by gossip")
+    parser.add_argument('--gossip', action="store_true",
+                        help="learn peers by gossip without joining anyone, for the first servent of an overlay")
+    parser.add_argument('--max_peers', type=int, metavar="N", default=utils.GOSSIP_MAX_PEERS,
+                        help="peers picked among the live members with --seed or --gossip")
     opt = parser.parse_args()
 
+    # Answers to a relayed lookup land on whichever worker the kernel picks, not the one waiting for them
+    if opt.cache and opt.workers > 1:
+        parser.error("--cache relays answers to the worker that asked, it can't be used with --workers")
+
+    # Answers to our floods come back to the origin we put in them, a guessed address may not be ours
+    if opt.cache and opt.advertise is None:
+        parser.error("--cache needs --advertise, the address answers to our floods are sent back to")
+
+    # Every servent has to place everyone on the ring by the same address, a guessed one may differ from theirs
+    if opt.routing == "dht" and opt.advertise is None:
+        parser.error("--routing dht needs --advertise, the address the other servents list us by")
+
+    if opt.seed or opt.gossip:
+        if opt.routing == "dht":
+            parser.error("--routing dht needs a fixed membership, it can't be used with --seed or --gossip")
+        if opt.workers > 1 or opt.heartbeat_interval <= 0:
+            parser.error("--seed and --gossip need heartbeats, a single worker and --heartbeat_interval above 0")
+    logging.getLogger().setLevel(getattr(logging, opt.log_level))
+
     # connection parameters
     srv_host = '0.0.0.0' #socket.gethostbyname(socket.gethostname())
     srv_port = int(opt.port)
 
-    srv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    srv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    srv_sock.bind((srv_host, srv_port))
-    logger.info("Server running at %s:%d", srv_host, srv_port)
-
     # Lets read and achieve the input services list
-    service_list = serventutils.read_input_file(opt.input_file)
+    reloader = reloadutils.ServiceListReloader(opt.input_file, None, opt.reload_interval)
+    reloader.load()
 
-    # Here we keep a track of all queries we've already answered
-    query_history = []
+    # Peers are resolved once here, forwarding works on the resolved table
+    other_peers = peerutils.PeerTable(opt.other_peers, fanout=opt.fanout)
 
-    # Lets generate a random seq to start
-    seq = random.randint(0, utils.MAX_SEQ)
-    try:
-        while True:
-            srv_sock.settimeout(utils.RECV_TIMEOUT)
-            recv_data = None
-            try:
-                recv_data, ip_addr = srv_sock.recvfrom(utils.MAX_BUFFER_SIZE)
-                srv_sock.settimeout(None)
-            except socket.timeout:
-                pass
-            except socket.error, e:
-                logger.error(str(e))
-                break
-
-            if recv_data:
-
-                # First of all we extract message_type before processing whole messsage
-                recv_message_type = struct.unpack("!H", recv_data[:struct.calcsize("!H")])[0]
-
-                if recv_message_type == utils.MESSAGE_TYPES["CLIREQ"]:
-                    recv_header_size = struct.calcsize(utils.MESSAGE_FORMAT["CLIREQ"])
-
-                    # Get key asked from user
-                    recv_message = recv_data[recv_header_size:]
-                    seq = (seq + 1) % utils.MAX_SEQ
-
-                    if (ip_addr[0], ip_addr[1], seq, recv_message) not in query_history:
-                        logger.info("[CLIREQ] %s:%s asked for '%s'" % (ip_addr[0], ip_addr[1],
-                                                                       recv_data[recv_header_size:]))
-                        if serventutils.local_db_search(srv_sock, service_list, recv_message, ip_addr):
-
-                            # Append query to query_history
-                            query_history.append((ip_addr[0], ip_addr[1], seq, recv_message))
-
-                            # Prepare forward query
-                            send_header = struct.pack(utils.MESSAGE_FORMAT["QUERY"], utils.MESSAGE_TYPES["QUERY"],
-                                                      utils.TTL, utils.ip_to_int(ip_addr[0]), ip_addr[1], seq)
-                            send_message = send_header + recv_data[recv_header_size:]
-                            for peer in opt.other_peers:
-
-                                # As opt args are stored as string, here we convert peer port to int in order
-                                # to properly forward query message
-                                peer = tuple([peer.split(":")[0], int(peer.split(":")[1])])
-                                # print ("%s:%d => %s:%d" % (peer[0], int(peer[1]), ip_addr[0], int(ip_addr[1])))
-                                if peer != ip_addr:
-                                    try:
-                                        srv_sock.sendto(send_message, peer)
-                                        logger.info("Query forwarded successfully to %s", peer)
-                                    except:
-                                        pass
-                            serventutils.forward_query(srv_sock, recv_data, recv_header_size, utils.TTL,
-                                                       ip_addr, [(srv_host, srv_port)], seq, opt.other_peers)
-                        else:
-                            logger.warning("Couldn't find %s in my service list" % recv_message)
-
-                elif recv_message_type == utils.MESSAGE_TYPES["QUERY"]:
-                    recv_header_size = struct.calcsize(utils.MESSAGE_FORMAT["QUERY"])
-                    _, recv_ttl, recv_from, recv_port, recv_seq = struct.unpack(utils.MESSAGE_FORMAT["QUERY"],
-                                                                                recv_data[:recv_header_size])
-
-                    recv_from = utils.int_to_ip(recv_from)
-
-                    # Get key asked from user
-                    recv_message = recv_data[recv_header_size:]
-
-                    if (recv_from, recv_port, recv_seq, recv_message) not in query_history:
-                        logger.info("[QUERY] %s:%s asked for '%s'" % (recv_from, recv_port,
-                                                                      recv_data[recv_header_size:]))
-                        if serventutils.local_db_search(srv_sock, service_list, recv_message, (recv_from, recv_port)):
-
-                            # Append query to query_history
-                            query_history.append((ip_addr[0], ip_addr[1], seq, recv_message))
-
-                            # Sends query to other peers as long as TTL > 0
-                            if recv_ttl > 0:
-                                recv_ttl -= 1
-
-                                serventutils.forward_query(srv_sock, recv_data, recv_header_size, recv_ttl,
-                                                           (recv_from, recv_port),
-                                                           [(ip_addr[0], int(ip_addr[1])), (srv_host, srv_port)],
-                                                           seq, opt.other_peers)
-                        else:
-                            logger.warning("Couldn't find %s in my service list" % recv_message)
-    except KeyboardInterrupt:
-        print ("Bye =)")
-    finally:
-        srv_sock.close()
+    # The advertised address also tags the writes taken here, ties between versions are broken by it
+    servent_options = dict(replicas=opt.replicas, large_threshold=opt.large_threshold,
+                           heartbeat_interval=opt.heartbeat_interval)
+    advertise_host = opt.advertise
+    if advertise_host is None:
+        try:
+            advertise_host = socket.gethostbyname(socket.gethostname())
+        except socket.error:
+            advertise_host = "127.0.0.1"
+    servent_options["advertise_addr"] = (advertise_host, srv_port)
+
+    # Large values are only announced at an address we were given, clients can't fetch them from a guessed one
+    if opt.advertise is not None:
+        servent_options["stream_addr"] = (opt.advertise, srv_port)
+
+    # Joining through seeds, or being the first servent of an overlay, keeps the peers up to date by gossip
+    if opt.seed or opt.gossip:
+        servent_options["membership"] = memberutils.Membership(servent_options["advertise_addr"], opt.seed)
+        servent_options["max_peers"] = opt.max_peers
+
+    # Every servent in the ring must be given the same membership, and store the keys it is responsible for
+    if opt.routing == "dht":
+        servent_options["ring"] = dhtutils.Ring(servent_options["advertise_addr"], other_peers.peers)
+        logger.info("Ring of %d servents, %d fingers", len(servent_options["ring"].ids),
+                    len(servent_options["ring"].fingers))
+
+    if opt.workers <= 1:
+        srv_sock = bind_socket(srv_host, srv_port)
+        stream_sock = None
+        if opt.advertise is not None:
+            stream_sock = streamutils.bind_stream_socket(srv_host, srv_port)
+        logger.info("Server running at %s:%d", srv_host, srv_port)
+
+        query_history = cacheutils.TTLCache(opt.history_size, opt.history_ttl)
+        if opt.cache:
+            servent_options["response_cache"] = cacheutils.TTLCache(opt.cache_size, opt.cache_ttl)
+        servent = serventutils.Servent(srv_sock, (srv_host, srv_port), reloader.service_list, other_peers,
+                                       query_history, **servent_options)
+        serve(srv_sock, servent, opt.event_loop, reloader, opt.stats_file, opt.sync_interval, stream_sock,
+              opt.stats_interval)
+    else:
+
+        # Pongs land on whichever worker the kernel picks for the peer, so no worker could tell peers apart
+        if opt.heartbeat_interval > 0:
+            logger.info("Heartbeats are disabled with --workers")
+            servent_options["heartbeat_interval"] = 0
+
+        # Workers inherit the service list and the shared query history through fork
+        query_history = cacheutils.SharedTTLCache(opt.history_size, opt.history_ttl)
+        workers = []
+        for worker in range(opt.workers):
+            pid = os.fork()
+            if pid == 0:
+                random.seed()
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                srv_sock = bind_socket(srv_host, srv_port, reuse_port=True)
+                stream_sock = None
+                if opt.advertise is not None:
+                    stream_sock = streamutils.bind_stream_socket(srv_host, srv_port, reuse_port=True)
+                logger.info("Worker %d running at %s:%d", worker, srv_host, srv_port)
+
+                servent = serventutils.Servent(srv_sock, (srv_host, srv_port), reloader.service_list,
+                                               other_peers, query_history, **servent_options)
+                serve(srv_sock, servent, opt.event_loop, reloader,
+                      opt.stats_file and "%s.%d" % (opt.stats_file, worker), opt.sync_interval, stream_sock,
+                      opt.stats_interval)
+                os._exit(0)
+            workers.append(pid)
+
+        def forward_signal(signum, frame):
+            for pid in workers:
+                try:
+                    os.kill(pid, signum)
+                except OSError:
+                    pass
+
+        signal.signal(signal.SIGTERM, forward_signal)
+        signal.signal(signal.SIGHUP, forward_signal)
+        signal.signal(signal.SIGUSR1, forward_signal)
+        try:
+            for pid in workers:
+                while True:
+                    try:
+                        os.waitpid(pid, 0)
+                        break
+                    except OSError, e:
+                        if e.errno != errno.EINTR:
+                            break
+        except KeyboardInterrupt:
+            for pid in workers:
+                os.waitpid(pid, 0)
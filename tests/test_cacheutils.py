@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import time
+import unittest
+
+from utils import cacheutils
+
+"""
+| ===================================================================
+| Clock: stands in for the time module so entries expire on demand
+| ===================================================================
+"""
+
+class Clock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+class ClockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = cacheutils.time = Clock()
+
+    def tearDown(self):
+        cacheutils.time = time
+
+"""
+| ===================================================================
+| TTLCache
+| ===================================================================
+"""
+
+class TTLCacheTest(ClockTestCase):
+
+    def test_seen(self):
+        cache = cacheutils.TTLCache(max_size=10, ttl=5.0)
+        self.assertFalse(cache.seen("a"))
+        self.assertTrue(cache.seen("a"))
+        self.assertIn("a", cache)
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1, "evictions": 0})
+
+    def test_expiry(self):
+        cache = cacheutils.TTLCache(max_size=10, ttl=5.0)
+        cache.put("a", 1)
+        self.clock.now += 4.9
+        self.assertEqual(cache.get("a"), 1)
+
+        # A hit refreshes recency, not the expiration time
+        self.clock.now += 0.2
+        self.assertNotIn("a", cache)
+        self.assertIsNone(cache.get("a"))
+        self.assertFalse(cache.seen("a"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expire_drops_old_entries(self):
+        cache = cacheutils.TTLCache(max_size=10, ttl=5.0)
+        cache.put("a")
+        self.clock.now += 3.0
+        cache.put("b")
+        self.clock.now += 3.0
+        cache.expire()
+        self.assertEqual(cache.entries.keys(), ["b"])
+
+    def test_lru_bound(self):
+        cache = cacheutils.TTLCache(max_size=2, ttl=5.0)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_peek(self):
+        cache = cacheutils.TTLCache(max_size=2, ttl=5.0)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.peek("a"), 1)
+        self.assertEqual(cache.peek("z", "default"), "default")
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+        # Unlike get, peek leaves "a" the oldest entry
+        cache.put("c", 3)
+        self.assertNotIn("a", cache)
+        self.clock.now += 5.0
+        self.assertIsNone(cache.peek("c"))
+
+    def test_seen_is_bounded(self):
+        cache = cacheutils.TTLCache(max_size=100, ttl=5.0)
+        for seq in xrange(1000):
+            self.assertFalse(cache.seen(("10.0.0.1", 5000, seq, "key")))
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(cache.evictions, 900)
+        self.assertTrue(cache.seen(("10.0.0.1", 5000, 999, "key")))
+        self.assertFalse(cache.seen(("10.0.0.1", 5000, 0, "key")))
+
+"""
+| ===================================================================
+| SharedTTLCache
+| ===================================================================
+"""
+
+class SharedTTLCacheTest(ClockTestCase):
+
+    def test_seen(self):
+        cache = cacheutils.SharedTTLCache(max_size=64, ttl=5.0)
+        self.assertFalse(cache.seen(("10.0.0.1", 5000, 1)))
+        self.assertTrue(cache.seen(("10.0.0.1", 5000, 1)))
+        self.assertFalse(cache.seen(("10.0.0.1", 5000, 2)))
+        self.assertIn(("10.0.0.1", 5000, 1), cache)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 1, "misses": 2, "evictions": 0})
+
+    def test_expiry(self):
+        cache = cacheutils.SharedTTLCache(max_size=64, ttl=5.0)
+        cache.seen("a")
+        self.clock.now += 5.1
+        self.assertNotIn("a", cache)
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache.seen("a"))
+
+        # Expired slots are reused without counting as evictions
+        self.assertEqual(cache.evictions, 0)
+
+    def test_size_rounds_to_ways(self):
+        cache = cacheutils.SharedTTLCache(max_size=20)
+        self.assertEqual(cache.max_size, 16)
+        self.assertEqual(cacheutils.SharedTTLCache(max_size=1).max_size, cache.WAYS)
+
+    def test_full_bucket_evicts_closest_to_expiring(self):
+        cache = cacheutils.SharedTTLCache(max_size=cacheutils.SharedTTLCache.WAYS, ttl=5.0)
+        for i in xrange(cache.WAYS):
+            cache.seen("key%d" % i)
+            self.clock.now += 0.1
+        cache.seen("new")
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(len(cache), cache.WAYS)
+        self.assertNotIn("key0", cache)
+        self.assertIn("key1", cache)
+        self.assertIn("new", cache)
+
+    def test_shared_after_fork(self):
+        cache = cacheutils.SharedTTLCache(max_size=64, ttl=5.0)
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if not cache.seen("from the worker") else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertTrue(cache.seen("from the worker"))
+
+if __name__ == "__main__":
+    unittest.main()
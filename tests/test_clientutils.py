@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import logging
+import select
+import socket
+import threading
+import time
+import unittest
+
+from utils import clientutils, indexutils, protocol, streamutils, utils
+
+def setUpModule():
+    logging.disable(logging.CRITICAL)
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+"""
+| ===================================================================
+| FakeServent: answers from a dict, on a thread of its own
+| ===================================================================
+"""
+
+class FakeServent(object):
+
+    def __init__(self, services, drop=0, stream_addr=None):
+        self.services = services
+        self.drop = drop  # requests ignored before answering any, as if they had been lost
+        self.stream_addr = stream_addr  # large values are announced as served from there
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.05)
+        self.addr = self.sock.getsockname()
+        self.requests = []
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            try:
+                recv_data, ip_addr = self.sock.recvfrom(utils.MAX_BUFFER_SIZE)
+            except socket.timeout:
+                continue
+            self.requests.append(recv_data)
+            if len(self.requests) <= self.drop:
+                continue
+            for send_message in self.answer(recv_data):
+                self.sock.sendto(send_message, ip_addr)
+
+    def answer(self, recv_data):
+        if protocol.message_type(recv_data) == utils.MESSAGE_TYPES["MULTIREQ"]:
+            keys = protocol.parse_keys(recv_data, "MULTIREQ")
+            return protocol.build_packed_response([(key, self.services[key]) for key in keys
+                                                   if key in self.services])
+        if protocol.message_type(recv_data) == utils.MESSAGE_TYPES["IDREQ"]:
+            request_id, _, keys = protocol.parse_idreq(recv_data)
+            items = [(key, self.services[key]) for key in keys if key in self.services]
+            if self.stream_addr is None:
+                return protocol.build_packed_response(items, request_id)
+            return ([protocol.build_large_response(request_id, len(value), self.stream_addr, key)
+                     for key, value in items if protocol.is_large(key, value)] +
+                    protocol.build_packed_response([(key, value) for key, value in items
+                                                    if not protocol.is_large(key, value)], request_id))
+        if protocol.message_type(recv_data) == utils.MESSAGE_TYPES["GLOBREQ"]:
+            request_id, limit, pattern, after = protocol.parse_globreq(recv_data)
+            keys, more = indexutils.SortedIndex(self.services).match(pattern, after, limit)
+            return protocol.build_glob_response(request_id, [(key, self.services[key]) for key in keys], more)
+        for message_type_name in ("PUT", "DELETE"):
+            if protocol.message_type(recv_data) == utils.MESSAGE_TYPES[message_type_name]:
+                request_id, key, value = protocol.parse_write(recv_data, message_type_name)
+                if message_type_name == "PUT":
+                    self.services[key] = value
+                else:
+                    self.services.pop(key, None)
+                return protocol.build_packed_response([(key, value)], request_id)
+        return []
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+"""
+| ===================================================================
+| p2p_ask_many: a window of keys in flight over MULTIREQs
+| ===================================================================
+"""
+
+class AskManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servent = FakeServent(dict(("key%d" % i, "value%d" % i) for i in xrange(0, 600, 2)))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.servent.close()
+        self.sock.close()
+
+    def test_answers_and_unanswered(self):
+        answers = dict()
+
+        def on_answer(key, value, ip_addr):
+            answers[key] = value
+            self.assertEqual(ip_addr, self.servent.addr)
+
+        keys = ["key%d" % i for i in xrange(600)]
+        unanswered = clientutils.p2p_ask_many(self.sock, keys, self.servent.addr[0], self.servent.addr[1],
+                                              on_answer, window=64, timeout=0.2)
+        self.assertEqual(answers, self.servent.services)
+        self.assertEqual(sorted(unanswered), sorted(key for key in keys if key not in self.servent.services))
+
+        # Never more than the window in flight, so requests carry at most that many keys
+        self.assertTrue(all(len(protocol.parse_keys(recv_data, "MULTIREQ")) <= 64
+                            for recv_data in self.servent.requests))
+
+"""
+| ===================================================================
+| PipelinedClient: tagged lookups, retries and adaptive timeouts
+| ===================================================================
+"""
+
+class PipelinedClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servent = None
+        self.client = None
+
+    def tearDown(self):
+        self.client.close()
+        self.servent.close()
+
+    def start(self, drop=0, **kwargs):
+        self.servent = FakeServent(dict(("key%d" % i, "value%d" % i) for i in xrange(0, 600, 2)), drop)
+        self.client = clientutils.PipelinedClient(self.servent.addr[0], self.servent.addr[1], **kwargs)
+
+    def test_lookup(self):
+        self.start()
+        lookup = self.client.lookup("key0")
+        self.assertTrue(lookup.done)
+        self.assertEqual(lookup.values, ["value0"])
+        self.assertEqual(lookup.answers[0][1], self.servent.addr)
+        self.assertGreaterEqual(lookup.latency, 0.0)
+
+        # The RTT sample replaces the initial timeout
+        self.assertIsNotNone(self.client.srtt)
+        self.assertGreaterEqual(self.client.rto, utils.CLIENT_MIN_RTO)
+        self.assertLess(self.client.rto, utils.CLIENT_INITIAL_RTO)
+
+    def test_unanswered_lookup_retries_then_times_out(self):
+        self.start(retries=1)
+        self.client.rto = 0.05
+        lookup = self.client.lookup("key1")
+        self.assertEqual(lookup.answers, [])
+        self.assertEqual(len(lookup.request_ids), 2)
+        self.assertEqual((self.client.counters["retries"], self.client.counters["timeouts"]), (1, 1))
+
+    def test_retry_answered(self):
+        self.start(drop=1)
+        self.client.rto = 0.05
+        lookup = self.client.lookup("key0")
+        self.assertEqual(lookup.values, ["value0"])
+        self.assertEqual(len(lookup.request_ids), 2)
+
+    def test_lookup_many(self):
+        self.start(window=64)
+        self.client.rto = 0.2
+        keys = ["key%d" % i for i in xrange(300)]
+        lookups = list(self.client.lookup_many(keys))
+        self.assertEqual(sorted(lookup.key for lookup in lookups), sorted(keys))
+        self.assertEqual(dict((lookup.key, lookup.values) for lookup in lookups if lookup.answers),
+                         dict((key, [value]) for key, value in self.servent.services.iteritems() if key in keys))
+        self.assertEqual(self.client.pending(), 0)
+        self.assertTrue(all(len(protocol.parse_idreq(recv_data)[2]) <= 64 for recv_data in self.servent.requests))
+
+    def test_same_key_twice_goes_in_separate_batches(self):
+        self.start()
+        first = self.client.submit("key0")
+        second = self.client.submit("key0")
+        while not (first.done and second.done):
+            self.client.poll()
+        self.assertNotEqual(first.request_ids, second.request_ids)
+        self.assertEqual(first.values + second.values, ["value0", "value0"])
+
+    def test_callback(self):
+        self.start()
+        done = []
+        self.client.submit("key2", callback=done.append)
+        while not done:
+            self.client.poll()
+        self.assertEqual(done[0].values, ["value2"])
+
+    def test_driven_through_handle(self):
+        self.start()
+        keys = ["key%d" % i for i in xrange(10)]
+        for key in keys:
+            self.client.submit(key)
+        self.client.flush()
+        done = []
+        while len(done) < len(keys):
+            readable, writable, _ = select.select(self.client.readers(), self.client.writers(), [],
+                                                  max(0.0, self.client.next_deadline() - time.time()))
+            done.extend(self.client.handle(readable, writable))
+            self.client.flush()
+        self.assertEqual(sorted(lookup.key for lookup in done), sorted(keys))
+        self.assertIsNone(self.client.next_deadline())
+        self.assertEqual(self.client.take_completed(), [])
+
+    def test_write(self):
+        self.start()
+        self.assertTrue(self.client.write("key1", "value1").answers)
+        self.assertEqual(self.client.lookup("key1").values, ["value1"])
+        self.assertTrue(self.client.write("key1").answers)
+        self.assertNotIn("key1", self.servent.services)
+        self.assertEqual(protocol.message_type(self.servent.requests[-1]), utils.MESSAGE_TYPES["DELETE"])
+
+    def test_glob_pages(self):
+        self.start()
+        keys = sorted("key%d" % i for i in xrange(0, 600, 2) if str(i).startswith("1"))
+        matches = []
+        after = ""
+        while True:
+            lookup = self.client.glob("key1*", 20, after)
+            matches.extend(lookup.matches)
+            if lookup.cursor is None:
+                break
+            after = lookup.cursor
+        self.assertEqual([key for key, _ in matches], keys)
+        self.assertEqual(matches[0], ("key10", "value10"))
+
+    def test_large_value_fetched(self):
+        services = {"large": "x" * (1 << 20), "small": "v"}
+        stream_sock = streamutils.bind_stream_socket("127.0.0.1", 0)
+        server = streamutils.ValueServer(stream_sock, services.get)
+        server.start()
+        try:
+            self.servent = FakeServent(services, stream_addr=stream_sock.getsockname())
+            self.client = clientutils.PipelinedClient(self.servent.addr[0], self.servent.addr[1])
+            lookups = dict((lookup.key, lookup) for lookup in self.client.lookup_many(["large", "small", "none"]))
+            self.assertEqual(lookups["large"].values, [services["large"]])
+            self.assertEqual(lookups["small"].values, ["v"])
+            self.assertEqual(lookups["none"].values, [])
+            self.assertEqual(self.client.counters["large_fetched"], 1)
+        finally:
+            server.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import math
+import unittest
+
+from utils import dhtutils
+
+"""
+| ===================================================================
+| Ring: who stores a key, and how lookups get there
+| ===================================================================
+"""
+
+class RingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addrs = [("127.0.0.1", 9000 + i) for i in xrange(64)]
+        self.rings = dict((addr, dhtutils.Ring(addr, self.addrs)) for addr in self.addrs)
+        self.keys = ["service%d" % i for i in xrange(500)]
+
+    def test_in_interval(self):
+        self.assertTrue(dhtutils.in_interval(5, 1, 5))
+        self.assertFalse(dhtutils.in_interval(1, 1, 5))
+        self.assertTrue(dhtutils.in_interval(0, 10, 2))
+        self.assertTrue(dhtutils.in_interval(11, 10, 2))
+        self.assertFalse(dhtutils.in_interval(5, 10, 2))
+
+    def test_responsible_is_successor(self):
+        ring = self.rings[self.addrs[0]]
+        ids = sorted(dhtutils.node_id(addr) for addr in self.addrs)
+        for key in self.keys:
+            key_id = dhtutils.ring_id(key)
+            expected = min([ident for ident in ids if ident >= key_id] or ids)
+            self.assertEqual(dhtutils.node_id(ring.responsible(key)), expected)
+
+    def test_every_view_agrees(self):
+        for key in self.keys:
+            responsible = set(ring.responsible(key) for ring in self.rings.itervalues())
+            self.assertEqual(len(responsible), 1)
+            storing = [addr for addr, ring in self.rings.iteritems() if ring.is_responsible(key)]
+            self.assertEqual(storing, list(responsible))
+
+    def test_next_hop_reaches_responsible(self):
+        max_hops = 2 * int(math.log(len(self.addrs), 2))
+        for i, key in enumerate(self.keys):
+            addr = self.addrs[i % len(self.addrs)]
+            hops = 0
+            while True:
+                next_addr = self.rings[addr].next_hop(key)
+                if next_addr is None:
+                    break
+                addr = next_addr
+                hops += 1
+                self.assertLessEqual(hops, max_hops)
+            self.assertEqual(addr, self.rings[addr].responsible(key))
+
+    def test_replicas(self):
+        ring = self.rings[self.addrs[0]]
+        for key in self.keys[:50]:
+            replicas = ring.replicas(key, 3)
+            self.assertEqual(len(set(replicas)), 3)
+            self.assertEqual(replicas[0], ring.responsible(key))
+        self.assertEqual(len(ring.replicas("service0", 100)), len(self.addrs))
+
+    def test_single_node(self):
+        ring = dhtutils.Ring(("127.0.0.1", 9000), [])
+        self.assertEqual(ring.responsible("service0"), ("127.0.0.1", 9000))
+        self.assertTrue(ring.is_responsible("service0"))
+        self.assertIsNone(ring.next_hop("service0"))
+
+    def test_partition(self):
+        services = dict((key, "10.0.0.1:80") for key in self.keys)
+        catalogs = dhtutils.partition(services, self.addrs)
+        self.assertEqual(sorted(catalogs), sorted(self.addrs))
+        self.assertEqual(sum(len(catalog) for catalog in catalogs.itervalues()), len(services))
+        ring = self.rings[self.addrs[0]]
+        for addr, catalog in catalogs.iteritems():
+            self.assertTrue(all(ring.responsible(key) == addr for key in catalog))
+
+if __name__ == "__main__":
+    unittest.main()
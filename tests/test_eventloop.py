@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+
+from utils import eventloop
+
+"""
+| ===================================================================
+| EventLoop: timers and datagram handlers
+| ===================================================================
+"""
+
+class EventLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = eventloop.EventLoop()
+        self.sockets = []
+
+    def tearDown(self):
+        self.loop.close()
+        for sock in self.sockets:
+            sock.close()
+
+    def udp_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        self.sockets.append(sock)
+        return sock
+
+    def test_timers_fire_in_order(self):
+        fired = []
+        self.loop.call_later(0.02, lambda: fired.append("second"))
+        self.loop.call_later(0.0, lambda: fired.append("first"))
+        self.loop.call_later(0.04, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(fired, ["first", "second"])
+
+    def test_call_every(self):
+        fired = []
+        self.loop.call_every(0.01, lambda: fired.append(time.time()))
+        self.loop.call_later(0.1, self.loop.stop)
+        self.loop.run()
+        self.assertGreaterEqual(len(fired), 3)
+
+    def test_call_every_survives_errors(self):
+        fired = []
+
+        def failing():
+            fired.append(None)
+            raise ValueError("periodic work failed")
+
+        self.loop.call_every(0.01, failing)
+        self.loop.call_later(0.05, self.loop.stop)
+        self.assertRaises(ValueError, self.loop.run)
+
+        # The failing run is rescheduled before the error reaches run()
+        self.loop.call_later(0.05, self.loop.stop)
+        self.assertRaises(ValueError, self.loop.run)
+        self.assertEqual(len(fired), 2)
+
+    def test_datagram_handler(self):
+        sock = self.udp_socket()
+        sender = self.udp_socket()
+        received = []
+
+        # The receive buffer is reused, so what a handler keeps must be copied out
+        def handler(recv_data, ip_addr):
+            received.append((str(bytearray(recv_data)), ip_addr))
+            if len(received) == 3:
+                self.loop.stop()
+
+        self.loop.add_datagram_handler(sock, handler)
+        for i in xrange(3):
+            sender.sendto("datagram%d" % i, sock.getsockname())
+        self.loop.call_later(1.0, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(received, [("datagram%d" % i, sender.getsockname()) for i in xrange(3)])
+
+    def test_batches_yield_to_timers(self):
+        sock = self.udp_socket()
+        sender = self.udp_socket()
+        received = []
+        self.loop.add_datagram_handler(sock, lambda recv_data, ip_addr: received.append(recv_data), max_batch=2)
+        for i in xrange(5):
+            sender.sendto("datagram%d" % i, sock.getsockname())
+
+        # Each wakeup reads at most max_batch datagrams, the rest waits for the next poll
+        self.loop.call_later(0.0, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(len(received), 2)
+        self.loop.call_later(0.2, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(len(received), 5)
+
+    def test_remove_reader(self):
+        sock = self.udp_socket()
+        sender = self.udp_socket()
+        received = []
+        self.loop.add_datagram_handler(sock, lambda recv_data, ip_addr: received.append(recv_data))
+        self.loop.remove_reader(sock)
+        sender.sendto("ignored", sock.getsockname())
+        self.loop.call_later(0.05, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(received, [])
+
+"""
+| ===================================================================
+| Signals: a handler stopping the loop wakes it from poll()
+| ===================================================================
+"""
+
+class SignalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = eventloop.EventLoop()
+        self.previous = signal.signal(signal.SIGUSR2, lambda signum, frame: self.loop.stop())
+
+    def tearDown(self):
+        signal.signal(signal.SIGUSR2, self.previous)
+        self.loop.close()
+
+    def test_signal_from_another_thread(self):
+
+        # Nothing else would end this run before the fallback timer
+        self.loop.call_later(5.0, self.loop.stop)
+        threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGUSR2)).start()
+        started = time.time()
+        self.loop.run()
+        self.assertLess(time.time() - started, 1.0)
+
+    def test_add_signal_handler(self):
+        handled = []
+
+        def handler():
+            handled.append(threading.current_thread())
+            self.loop.stop()
+
+        self.loop.add_signal_handler(signal.SIGUSR2, handler)
+        self.loop.call_later(5.0, self.loop.stop)
+        threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGUSR2)).start()
+        started = time.time()
+        self.loop.run()
+        self.assertLess(time.time() - started, 1.0)
+
+        # Run once, from the loop
+        self.assertEqual(handled, [threading.current_thread()])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+
+from utils import indexutils
+
+"""
+| ===================================================================
+| glob_prefix / SortedIndex: prefix slices and glob matches
+| ===================================================================
+"""
+
+class GlobPrefixTest(unittest.TestCase):
+
+    def test_glob_prefix(self):
+        self.assertEqual(indexutils.glob_prefix("http*"), "http")
+        self.assertEqual(indexutils.glob_prefix("a?c*"), "a")
+        self.assertEqual(indexutils.glob_prefix("[ab]*"), "")
+        self.assertEqual(indexutils.glob_prefix("plain"), "plain")
+
+class SortedIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keys = ["http%02d" % i for i in xrange(20)] + ["ftp%02d" % i for i in xrange(5)] + ["https", "other"]
+        self.index = indexutils.SortedIndex(self.keys + ["http00"])
+
+    def test_deduplicated(self):
+        self.assertEqual(len(self.index), len(self.keys))
+        self.index.insert("http00")
+        self.assertEqual(len(self.index), len(self.keys))
+        self.index.insert("aaa")
+        self.assertEqual(self.index.keys[0], "aaa")
+
+    def test_prefix(self):
+        self.assertEqual(self.index.match("http*"), (sorted(key for key in self.keys if key.startswith("http")),
+                                                     False))
+        self.assertEqual(self.index.match("nothing*"), ([], False))
+
+    def test_glob(self):
+        self.assertEqual(self.index.match("http1?")[0], ["http%02d" % i for i in xrange(10, 20)])
+        self.assertEqual(self.index.match("*p0[12]")[0], ["ftp01", "ftp02", "http01", "http02"])
+        self.assertEqual(self.index.match("https")[0], ["https"])
+
+    def test_pages(self):
+        pages = []
+        after = ""
+        while True:
+            keys, more = self.index.match("http*", after, 7)
+            self.assertLessEqual(len(keys), 7)
+            pages.extend(keys)
+            if not more:
+                break
+            after = keys[-1]
+        self.assertEqual(pages, self.index.match("http*")[0])
+
+    def test_after_below_prefix(self):
+        self.assertEqual(self.index.match("http*", "aaa", 1), (["http00"], True))
+        self.assertEqual(self.index.match("http*", "http18")[0], ["http19", "https"])
+
+if __name__ == "__main__":
+    unittest.main()
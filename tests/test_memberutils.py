@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import random
+import unittest
+
+from utils import memberutils, utils
+from utils.memberutils import ALIVE, SUSPECT, DEAD, LEFT
+
+"""
+| ===================================================================
+| Membership: merging updates and picking whom to probe
+| ===================================================================
+"""
+
+class MembershipTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.self_addr = ("127.0.0.1", 9000)
+        self.others = [("127.0.0.1", 9001 + i) for i in xrange(5)]
+        self.membership = memberutils.Membership(self.self_addr, incarnation=10)
+        for member in self.others:
+            self.membership.apply(member, 1, ALIVE, 0.0)
+
+    def test_apply(self):
+        member = self.others[0]
+        self.assertFalse(self.membership.apply(member, 1, ALIVE, 1.0))
+
+        # Within an incarnation the worst state wins
+        self.assertTrue(self.membership.apply(member, 1, SUSPECT, 1.0))
+        self.assertFalse(self.membership.apply(member, 1, ALIVE, 2.0))
+        self.assertEqual(self.membership.entry(member), (1, SUSPECT))
+
+        # A newer incarnation wins whatever its state, an older one never does
+        self.assertTrue(self.membership.apply(member, 2, ALIVE, 3.0))
+        self.assertFalse(self.membership.apply(member, 1, DEAD, 4.0))
+        self.assertEqual(self.membership.entry(member), (2, ALIVE))
+        self.assertTrue(self.membership.apply(member, 2, LEFT, 5.0))
+        self.assertFalse(self.membership.is_alive(member))
+
+    def test_apply_new_member(self):
+        member = ("127.0.0.1", 9100)
+        self.assertTrue(self.membership.apply(member, 1, SUSPECT, 1.0))
+        self.assertTrue(self.membership.is_alive(member))
+        self.assertIn(member, self.membership.updates)
+
+    def test_refute(self):
+        self.assertFalse(self.membership.apply(self.self_addr, 10, SUSPECT, 1.0))
+        self.assertEqual(self.membership.incarnation, 11)
+        self.assertEqual(self.membership.entry(self.self_addr), (11, ALIVE))
+
+        # Stale rumors about us are ignored
+        self.assertFalse(self.membership.apply(self.self_addr, 5, DEAD, 1.0))
+        self.assertEqual(self.membership.incarnation, 11)
+        self.assertNotIn(self.self_addr, self.membership.members)
+
+    def test_piggyback(self):
+
+        # Every update goes out a few times log(members), then it is dropped
+        sent = dict()
+        while True:
+            records = self.membership.piggyback(count=3)
+            if not records:
+                break
+            self.assertLessEqual(len(records), 3)
+            for record in records:
+                sent[record[0]] = sent.get(record[0], 0) + 1
+        self.assertEqual(sorted(sent), sorted(self.others + [self.self_addr]))
+        self.assertTrue(all(count <= utils.GOSSIP_RETRANSMIT_MULT * 3 for count in sent.itervalues()))
+        self.assertEqual(self.membership.updates, dict())
+
+    def test_rebind(self):
+        self.membership.rebind("10.0.0.1:9000")
+        self.assertEqual(self.membership.self_addr, ("10.0.0.1", 9000))
+        self.assertEqual([record[0] for record in self.membership.piggyback(100) if record[0][1] == 9000],
+                         [("10.0.0.1", 9000)])
+
+    def test_candidate_verified(self):
+        joiner = ("127.0.0.1", 9100)
+        nonce = self.membership.candidate(joiner, 3, 1.0)
+        self.assertIsNone(self.membership.verify(joiner, nonce + 1, 1.5))
+        self.assertIsNone(self.membership.state(joiner))
+
+        # A retried JOIN keeps its nonce
+        self.assertEqual(self.membership.candidate(joiner, 4, 1.2), nonce)
+        self.assertTrue(self.membership.verify(joiner, nonce, 1.5))
+        self.assertEqual(self.membership.entry(joiner), (4, ALIVE))
+        self.assertIsNone(self.membership.verify(joiner, nonce, 1.5))
+
+    def test_candidate_not_joining(self):
+        pinger = ("127.0.0.1", 9100)
+        nonce = self.membership.candidate(pinger, 3, 1.0, joining=False)
+        self.assertIs(self.membership.verify(pinger, nonce, 1.5), False)
+        self.assertTrue(self.membership.is_alive(pinger))
+
+    def test_suspect_told_first(self):
+        member = self.others[0]
+        self.membership.apply(member, 1, SUSPECT, 1.0)
+        self.membership.piggyback(count=100)
+        self.membership.piggyback(count=100)
+        self.assertEqual(self.membership.piggyback(member, 2)[0], (member, 1, SUSPECT))
+        self.assertEqual(self.membership.piggyback(self.others[1], 2)[0][0], member)
+
+    def test_candidates_bounded(self):
+        for i in xrange(utils.GOSSIP_MAX_CANDIDATES):
+            self.assertIsNotNone(self.membership.candidate(("127.0.0.2", i), 1, 1.0))
+        self.assertIsNone(self.membership.candidate(("127.0.0.3", 1), 1, 1.0))
+        self.assertIsNone(self.membership.candidate(self.self_addr, 1, 1.0))
+
+        # Unanswered ones are forgotten after two periods
+        self.membership.expire(3.5, 1.0)
+        self.assertEqual(self.membership.candidates, dict())
+        self.assertIsNotNone(self.membership.candidate(("127.0.0.3", 1), 1, 3.5))
+
+    def test_joins_expire(self):
+        self.membership.joining(self.others[0], 1.0, rebind=True)
+        self.membership.expire(2.5, 1.0)
+        self.assertEqual(self.membership.joins, {self.others[0]: (True, 1.0)})
+        self.membership.expire(3.5, 1.0)
+        self.assertEqual(self.membership.joins, dict())
+
+    def test_next_probe_round_robin(self):
+        for _ in xrange(3):
+            probed = []
+            for _ in xrange(len(self.others)):
+                member = self.membership.next_probe(1.0)
+                self.membership.ack(member)
+                probed.append(member)
+            self.assertEqual(sorted(probed), self.others)
+        self.assertEqual(self.membership.counts()["alive"], len(self.others))
+
+    def test_unanswered_probe_makes_suspect(self):
+        member = self.membership.next_probe(1.0)
+        self.membership.next_probe(2.0)
+        self.assertEqual(self.membership.members[member], [1, SUSPECT, 2.0])
+
+        # Suspects are still probed in the rounds that follow, it is how they get the chance to answer
+        self.assertIn(member, [self.membership.next_probe(3.0) for _ in xrange(2 * len(self.others))])
+
+    def test_next_probe_skips_dead(self):
+        for member in self.others[1:]:
+            self.membership.apply(member, 1, DEAD, 1.0)
+        self.assertEqual(self.membership.next_probe(1.0), self.others[0])
+        self.membership.apply(self.others[0], 1, LEFT, 1.0)
+        self.assertIsNone(self.membership.next_probe(2.0))
+
+    def test_next_probe_alone(self):
+        self.assertIsNone(memberutils.Membership(self.self_addr).next_probe(1.0))
+
+    def test_expire(self):
+        member = self.others[0]
+        self.membership.apply(member, 1, SUSPECT, 0.0)
+        self.membership.expire(1.0, 1.0)
+        self.assertEqual(self.membership.state(member), SUSPECT)
+        self.membership.expire(100.0, 1.0)
+        self.assertEqual(self.membership.state(member), DEAD)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import socket
+import unittest
+
+from utils import peerutils, utils
+
+"""
+| ===================================================================
+| parse_peer
+| ===================================================================
+"""
+
+class ParsePeerTest(unittest.TestCase):
+
+    def test_forms(self):
+        self.assertEqual(peerutils.parse_peer("127.0.0.1:5000"), ("127.0.0.1", 5000))
+        self.assertEqual(peerutils.parse_peer(("127.0.0.1", "5000")), ("127.0.0.1", 5000))
+        self.assertEqual(peerutils.parse_peer("localhost:5000")[1], 5000)
+
+"""
+| ===================================================================
+| PeerTable: membership and fan-out
+| ===================================================================
+"""
+
+class PeerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sockets = []
+        self.sock = self.udp_socket()
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def udp_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(0.2)
+        self.sockets.append(sock)
+        return sock
+
+    def received(self, sock):
+        try:
+            recv_data = sock.recvfrom(utils.MAX_BUFFER_SIZE)[0]
+        except socket.timeout:
+            return None
+        sock.settimeout(0.01)
+        return recv_data
+
+class PeerTableTest(PeerTestCase):
+
+    def test_add_remove(self):
+        table = peerutils.PeerTable(["127.0.0.1:5000", ("127.0.0.1", 5001)])
+        self.assertEqual(table.add("127.0.0.1:5000"), ("127.0.0.1", 5000))
+        self.assertEqual(list(table), [("127.0.0.1", 5000), ("127.0.0.1", 5001)])
+        table.remove("127.0.0.1:5000")
+        table.remove("127.0.0.1:5002")
+        self.assertEqual(len(table), 1)
+        self.assertNotIn(("127.0.0.1", 5000), table)
+        self.assertIn(("127.0.0.1", 5001), table)
+
+    def test_select(self):
+        table = peerutils.PeerTable(["127.0.0.1:5000", "127.0.0.1:5001"])
+        self.assertEqual(table.select(set([("127.0.0.1", 5000)])), [("127.0.0.1", 5001)])
+
+    def fan_out(self, count, use_sendmmsg, exclude_positions):
+        peers = [self.udp_socket() for _ in xrange(count)]
+        table = peerutils.PeerTable([peer.getsockname() for peer in peers], use_sendmmsg=use_sendmmsg)
+        exclude = set(peers[i].getsockname() for i in exclude_positions)
+        self.assertEqual(table.send(self.sock, bytearray("hello"), exclude), count - len(exclude))
+        for i, peer in enumerate(peers):
+            self.assertEqual(self.received(peer), None if i in exclude_positions else "hello")
+
+    def test_send_each(self):
+        self.fan_out(3, False, [1])
+
+    def test_send_batch(self):
+        if peerutils.sendmmsg is None:
+            self.skipTest("no sendmmsg in this libc")
+
+        # Excluded peers in the middle and at both ends split the batch into runs, single ones included
+        self.fan_out(peerutils.SENDMMSG_MIN_PEERS + 4, True, [0, 2, 5, peerutils.SENDMMSG_MIN_PEERS + 3])
+
+    def test_send_batch_memoryview(self):
+        if peerutils.sendmmsg is None:
+            self.skipTest("no sendmmsg in this libc")
+        peers = [self.udp_socket() for _ in xrange(peerutils.SENDMMSG_MIN_PEERS)]
+        table = peerutils.PeerTable([peer.getsockname() for peer in peers])
+        self.assertEqual(table.send(self.sock, memoryview(bytearray("hello world"))[:5]), len(peers))
+        self.assertEqual([self.received(peer) for peer in peers], ["hello"] * len(peers))
+
+    def test_table_change_rebuilds_batch(self):
+        if peerutils.sendmmsg is None:
+            self.skipTest("no sendmmsg in this libc")
+        peers = [self.udp_socket() for _ in xrange(peerutils.SENDMMSG_MIN_PEERS + 1)]
+        table = peerutils.PeerTable([peer.getsockname() for peer in peers])
+        table.send(self.sock, "first")
+        table.remove(peers[0].getsockname())
+        self.assertEqual(table.send(self.sock, "second"), len(peers) - 1)
+        self.assertEqual(self.received(peers[0]), "first")
+        self.assertEqual(self.received(peers[0]), None)
+        for peer in peers[1:]:
+            self.assertEqual((self.received(peer), self.received(peer)), ("first", "second"))
+
+    def test_send_errors_counted_out(self):
+
+        # Port 0 can't be sent to, the others still get the message
+        peers = [self.udp_socket() for _ in xrange(2)]
+        table = peerutils.PeerTable([peers[0].getsockname(), ("127.0.0.1", 0), peers[1].getsockname()],
+                                    use_sendmmsg=False)
+        self.assertEqual(table.send(self.sock, "hello"), 2)
+        self.assertEqual(table.send_errors, 1)
+
+"""
+| ===================================================================
+| PeerHealth: pings, unhealthy peers and weighted fan-out
+| ===================================================================
+"""
+
+class PeerHealthTest(PeerTestCase):
+
+    def test_weight(self):
+        fast = peerutils.PeerHealth()
+        slow = peerutils.PeerHealth()
+        fast.answered(0.002)
+        slow.answered(0.02)
+        self.assertGreater(fast.weight(), slow.weight())
+        for _ in xrange(10):
+            slow.answered(0.002)
+            fast.unanswered()
+        self.assertGreater(slow.weight(), fast.weight())
+
+    def test_missed_pings_make_unhealthy(self):
+        peer = ("127.0.0.1", 5000)
+        table = peerutils.PeerTable([peer, ("127.0.0.1", 5001)])
+        nonces = []
+        for now in xrange(utils.HEALTH_MAX_MISSED + 1):
+            due = dict(table.due_pings(now, 1.0))
+            self.assertIn(peer, due)
+            nonces.append(due[peer])
+        self.assertEqual(table.unhealthy, set([peer, ("127.0.0.1", 5001)]))
+        self.assertEqual(table.select(), [])
+
+        # A late answer to an older ping shows it's alive, but only the last one is an RTT sample
+        table.pong(peer, nonces[0], utils.HEALTH_MAX_MISSED + 0.5)
+        self.assertNotIn(peer, table.unhealthy)
+        self.assertIsNone(table.health[peer].srtt)
+        table.due_pings(utils.HEALTH_MAX_MISSED + 2, 1.0)
+        table.pong(peer, table.health[peer].nonce, utils.HEALTH_MAX_MISSED + 2.25)
+        self.assertEqual(table.health[peer].srtt, 0.25)
+
+    def test_heard_peers_not_pinged(self):
+        peer = ("127.0.0.1", 5000)
+        table = peerutils.PeerTable([peer])
+        self.assertTrue(table.heard(peer, 10.0))
+        self.assertFalse(table.heard(("127.0.0.1", 5001), 10.0))
+        self.assertEqual(table.due_pings(10.5, 1.0), [])
+        self.assertEqual([due_peer for due_peer, _ in table.due_pings(11.0, 1.0)], [peer])
+
+    def test_unhealthy_skipped(self):
+        peers = [self.udp_socket() for _ in xrange(3)]
+        table = peerutils.PeerTable([peer.getsockname() for peer in peers])
+        table.unhealthy.add(peers[1].getsockname())
+        self.assertEqual(table.send(self.sock, "hello"), 2)
+        self.assertEqual([self.received(peer) for peer in peers], ["hello", None, "hello"])
+        self.assertEqual(table.skipped, 1)
+
+        # With every peer down they all get tried anyway
+        table.unhealthy.update(peer.getsockname() for peer in peers)
+        self.assertEqual(table.send(self.sock, "again"), 3)
+
+    def test_fanout(self):
+        peers = [self.udp_socket() for _ in xrange(5)]
+        table = peerutils.PeerTable([peer.getsockname() for peer in peers], fanout=2)
+        self.assertEqual(table.send(self.sock, "hello", set([peers[0].getsockname()])), 2)
+        self.assertEqual(sum(1 for peer in peers if self.received(peer) is not None), 2)
+        self.assertEqual(table.skipped, 2)
+
+    def test_choose_weighted(self):
+        table = peerutils.PeerTable(["127.0.0.1:5000", "127.0.0.1:5001"], fanout=1)
+        table.health[("127.0.0.1", 5000)].answered(0.001)
+        table.health[("127.0.0.1", 5001)].answered(0.1)
+        picks = [table.choose(table.peers, 1)[0] for _ in xrange(1000)]
+        self.assertGreater(picks.count(("127.0.0.1", 5000)), 900)
+
+    def test_unmeasured_gets_mean_rtt(self):
+        table = peerutils.PeerTable(["127.0.0.1:5000", "127.0.0.1:5001", "127.0.0.1:5002"], fanout=1)
+        table.health[("127.0.0.1", 5000)].answered(0.001)
+        table.health[("127.0.0.1", 5001)].answered(0.1)
+
+        # Weighted like a peer at the mean RTT, the unmeasured one is picked less than the fast one
+        picks = [table.choose(table.peers, 1)[0] for _ in xrange(1000)]
+        self.assertGreater(picks.count(("127.0.0.1", 5000)), 900)
+        self.assertGreater(picks.count(("127.0.0.1", 5002)), picks.count(("127.0.0.1", 5001)))
+
+    def test_reply_sampled(self):
+        peer = ("127.0.0.1", 5000)
+        table = peerutils.PeerTable([peer])
+        table.replied(peer, 10.0)
+        self.assertIsNone(table.health[peer].srtt)
+        table.requested(peer, 10.0)
+        table.requested(peer, 10.1)
+        table.replied(peer, 10.25)
+        self.assertEqual(table.health[peer].srtt, 0.25)
+        self.assertEqual(table.health[peer].rate, 1.0)
+
+        # Replies long after the request aren't samples, and a stale request is replaced
+        table.requested(peer, 20.0)
+        table.replied(peer, 20.0 + utils.RECV_TIMEOUT)
+        table.requested(peer, 30.0)
+        table.requested(peer, 30.0 + utils.RECV_TIMEOUT)
+        table.replied(peer, 30.5 + utils.RECV_TIMEOUT)
+        self.assertEqual(table.health[peer].srtt, 0.25 + utils.HEALTH_ALPHA * 0.25)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import socket
+import struct
+import unittest
+
+from utils import protocol, utils
+
+"""
+| ===================================================================
+| Round trips: what a build_* packs, its parse_* gives back
+| ===================================================================
+"""
+
+class RoundTripTest(unittest.TestCase):
+
+    def test_query(self):
+        send_message = protocol.build_query(3, ("10.0.0.1", 5000), 42, "service0")
+        self.assertEqual(protocol.message_type(send_message), utils.MESSAGE_TYPES["QUERY"])
+        self.assertEqual(protocol.parse_query(str(send_message)), (3, "10.0.0.1", 5000, 42, "service0"))
+
+        # Same bytes as the header packed field by field
+        self.assertEqual(str(send_message), struct.pack(utils.MESSAGE_FORMAT["QUERY"], utils.MESSAGE_TYPES["QUERY"], 3,
+                                                        utils.ip_to_int("10.0.0.1"), 5000, 42) + "service0")
+
+    def test_rewrite_query(self):
+        send_message = protocol.build_query(3, ("10.0.0.1", 5000), 42, "service0")
+        self.assertIs(protocol.rewrite_query(send_message, 2), send_message)
+        self.assertEqual(protocol.parse_query(send_message), (2, "10.0.0.1", 5000, 42, "service0"))
+
+        # A str can't be rewritten in place, a copy comes back
+        send_message = protocol.rewrite_query(str(send_message), 1, 43)
+        self.assertEqual(protocol.parse_query(memoryview(send_message)), (1, "10.0.0.1", 5000, 43, "service0"))
+
+    def test_response(self):
+        self.assertEqual(protocol.build_response("service0", "10.0.0.1:80"),
+                         struct.pack("!H", utils.MESSAGE_TYPES["RESPONSE"]) + "service0\t10.0.0.1:80\x00\x00")
+
+    def test_multireq(self):
+        keys = ["key%d" % i for i in xrange(10)]
+        datagrams = protocol.build_multireq(keys)
+        self.assertEqual(len(datagrams), 1)
+        self.assertEqual(protocol.parse_keys(datagrams[0], "MULTIREQ"), keys)
+
+    def test_multiquery(self):
+        datagrams = protocol.build_multiquery(4, ("10.0.0.1", 5000), 7, ["a", "b"])
+        self.assertEqual(protocol.parse_multiquery(datagrams[0]), (4, "10.0.0.1", 5000, 7, ["a", "b"]))
+
+    def test_idreq(self):
+        keys = ["key%d" % i for i in xrange(10)]
+        datagrams = protocol.build_idreq(7, keys, wanted=2)
+        self.assertEqual(len(datagrams), 1)
+        self.assertEqual(protocol.parse_idreq(datagrams[0]), (7, 2, keys))
+
+    def test_idquery(self):
+        datagrams = protocol.build_idquery(4, ("10.0.0.1", 5000), 7, 2, ["a", "b"])
+        self.assertEqual(protocol.parse_idquery(datagrams[0]), (4, "10.0.0.1", 5000, 7, 2, ["a", "b"]))
+
+    def test_idresponse(self):
+        items = [("key%d" % i, "value%d" % i) for i in xrange(100)]
+        datagrams = protocol.build_packed_response(items, request_id=9)
+        self.assertGreater(len(datagrams), 1)
+        parsed = []
+        for datagram in datagrams:
+            self.assertEqual(protocol.message_type(datagram), utils.MESSAGE_TYPES["IDRESPONSE"])
+            self.assertEqual(protocol.parse_request_id(datagram), 9)
+            parsed.extend(protocol.parse_responses(datagram, "IDRESPONSE"))
+        self.assertEqual(parsed, items)
+
+    def test_keys_split_across_datagrams(self):
+        keys = ["key%04d" % i for i in xrange(500)]
+        datagrams = protocol.build_multireq(keys)
+        self.assertGreater(len(datagrams), 1)
+        self.assertTrue(all(len(datagram) <= utils.MAX_BUFFER_SIZE for datagram in datagrams))
+        self.assertEqual(sum((protocol.parse_keys(datagram, "MULTIREQ") for datagram in datagrams), []), keys)
+
+    def test_packed_response(self):
+        items = [("key%d" % i, "value%d" % i) for i in xrange(100)]
+        datagrams = protocol.build_packed_response(items)
+        self.assertGreater(len(datagrams), 1)
+        self.assertEqual(sum((protocol.parse_responses(datagram) for datagram in datagrams), []), items)
+        self.assertEqual(protocol.build_packed_response([]), [])
+
+    def test_oversized_record_sent_alone(self):
+        items = [("small", "1"), ("big", "x" * utils.MAX_BUFFER_SIZE), ("small2", "2")]
+        datagrams = protocol.build_packed_response(items)
+        self.assertEqual([protocol.parse_responses(datagram) for datagram in datagrams],
+                         [[item] for item in items])
+
+    def test_write(self):
+        self.assertEqual(protocol.parse_write(protocol.build_put(5, "key", "a\tb"), "PUT"), (5, "key", "a\tb"))
+        self.assertEqual(protocol.parse_write(protocol.build_delete(6, "key"), "DELETE"), (6, "key", ""))
+
+    def test_replicate(self):
+        entries = [("key", (3, 1, "value")), ("gone", (4, 2, None)), ("empty", (5, 1, ""))]
+        datagrams = protocol.build_replicate(entries)
+        self.assertEqual(protocol.parse_entries(datagrams[0]), entries)
+
+    def test_sync_digest(self):
+        digests = [0, 1, 0xFFFFFFFFFFFFFFFF] + [12345] * 61
+        self.assertEqual(list(protocol.parse_sync_digest(protocol.build_sync_digest(digests))), digests)
+
+    def test_sync_bucket(self):
+        summaries = [("key%04d" % i, (i, 1)) for i in xrange(200)]
+        datagrams = protocol.build_sync_bucket(3, summaries, True)
+        self.assertGreater(len(datagrams), 1)
+        parsed = []
+        for i, datagram in enumerate(datagrams):
+            bucket, reply, part = protocol.parse_sync_bucket(datagram)
+            self.assertEqual(bucket, 3)
+
+            # Only the first part asks for a summary back
+            self.assertEqual(reply, i == 0)
+            parsed.extend(part)
+        self.assertEqual(parsed, summaries)
+
+    def test_empty_sync_bucket(self):
+        self.assertEqual(protocol.parse_sync_bucket(protocol.build_sync_bucket(3, [], True)[0]), (3, True, []))
+
+    def test_sync_pull(self):
+        datagrams = protocol.build_sync_pull(["a", "b"])
+        self.assertEqual(protocol.parse_keys(datagrams[0], "SYNCPULL"), ["a", "b"])
+
+    def test_glob(self):
+        recv_data = protocol.build_globreq(7, 50, "service*", "service10")
+        self.assertEqual(protocol.parse_globreq(recv_data), (7, 50, "service*", "service10"))
+        recv_data = protocol.build_globquery(2, ("10.0.0.1", 5000), 7, 50, "service*")
+        self.assertEqual(protocol.parse_globquery(recv_data), (2, "10.0.0.1", 5000, 7, 50, "service*", ""))
+
+    def test_glob_response(self):
+        items = [("service%03d" % i, "10.0.0.1:%d" % i) for i in xrange(100)]
+        datagrams = protocol.build_glob_response(7, items, True)
+        self.assertGreater(len(datagrams), 1)
+        parsed = []
+        for i, datagram in enumerate(datagrams):
+            request_id, more, page = protocol.parse_glob_response(datagram)
+            self.assertEqual(request_id, 7)
+
+            # Only the last datagram of a page carries the flag
+            self.assertEqual(more, i == len(datagrams) - 1)
+            parsed.extend(page)
+        self.assertEqual(parsed, items)
+        self.assertEqual(protocol.parse_glob_response(protocol.build_glob_response(7, [], False)[0]), (7, False, []))
+
+    def test_large_response(self):
+        recv_data = protocol.build_large_response(9, 1 << 20, ("10.0.0.1", 6000), "key")
+        self.assertEqual(protocol.parse_large_response(recv_data), (9, 1 << 20, ("10.0.0.1", 6000), "key"))
+
+    def test_is_large(self):
+        self.assertFalse(protocol.is_large("key", "x" * 900))
+        self.assertTrue(protocol.is_large("key", "x" * 901))
+
+        # Whatever the threshold, a value that doesn't fit a datagram is large
+        self.assertTrue(protocol.is_large("key", "x" * utils.MAX_BUFFER_SIZE, threshold=1 << 30))
+
+    def test_message_name(self):
+        self.assertEqual(protocol.message_name(utils.MESSAGE_TYPES["CLIREQ"]), "CLIREQ")
+        self.assertEqual(protocol.message_name(999), "UNKNOWN999")
+
+    def test_ping(self):
+        records = [(("10.0.0.1", 5000), 3, 0), (("10.0.0.2", 5001), 4, 1)]
+        recv_data = protocol.build_ping(77, records)
+        self.assertEqual(protocol.message_type(recv_data), utils.MESSAGE_TYPES["PING"])
+        self.assertEqual(protocol.parse_ping(recv_data), 77)
+        self.assertEqual(protocol.parse_members(recv_data, "PING"), records)
+        recv_data = protocol.build_pong(78)
+        self.assertEqual(protocol.parse_ping(recv_data), 78)
+        self.assertEqual(protocol.parse_members(recv_data, "PONG"), [])
+
+    def test_membership(self):
+        self.assertEqual(protocol.parse_incarnation(protocol.build_join(12)), 12)
+        self.assertEqual(protocol.parse_incarnation(protocol.build_leave(13)), 13)
+        records = [(("10.0.0.%d" % (i % 250 + 1), 5000 + i), i, i % 4) for i in xrange(200)]
+        datagrams = protocol.build_members(("10.0.0.9", 5009), records)
+        self.assertGreater(len(datagrams), 1)
+        parsed = []
+        for datagram in datagrams:
+            self.assertEqual(protocol.parse_observed(datagram), ("10.0.0.9", 5009))
+            parsed.extend(protocol.parse_members(datagram, "MEMBERS"))
+        self.assertEqual(parsed, records)
+
+    def test_parse_key(self):
+        recv_data = struct.pack("!H", utils.MESSAGE_TYPES["CLIREQ"]) + "service0"
+        self.assertEqual(protocol.parse_key(recv_data, "CLIREQ"), "service0")
+        self.assertEqual(protocol.parse_key(memoryview(recv_data), "CLIREQ"), "service0")
+
+    def test_ip_conversions(self):
+        self.assertEqual(protocol.int_to_ip(protocol.ip_to_int("10.1.2.3")), "10.1.2.3")
+        self.assertEqual(protocol.ip_to_int("10.1.2.3"), utils.ip_to_int("10.1.2.3"))
+
+"""
+| ===================================================================
+| PacketBuffer: one buffer for every datagram received
+| ===================================================================
+"""
+
+class PacketBufferTest(unittest.TestCase):
+
+    def test_recvfrom(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind(("127.0.0.1", 0))
+            sender.bind(("127.0.0.1", 0))
+            sock.settimeout(1.0)
+            packet_buffer = protocol.PacketBuffer()
+            sender.sendto(str(protocol.build_query(3, ("10.0.0.1", 5000), 42, "service0")), sock.getsockname())
+            recv_data, ip_addr = packet_buffer.recvfrom(sock)
+            self.assertEqual(ip_addr, sender.getsockname())
+            self.assertEqual(protocol.parse_query(recv_data), (3, "10.0.0.1", 5000, 42, "service0"))
+
+            # The next datagram lands in the same buffer
+            sender.sendto("short", sock.getsockname())
+            self.assertEqual(packet_buffer.recvfrom(sock)[0].tobytes(), "short")
+        finally:
+            sock.close()
+            sender.close()
+
+"""
+| ===================================================================
+| Truncated input: headers that don't fit raise struct.error
+| ===================================================================
+"""
+
+class TruncatedTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertRaises(struct.error, protocol.message_type, "")
+        self.assertRaises(struct.error, protocol.message_type, "\x00")
+
+    def test_tagged_headers(self):
+        self.assertRaises(struct.error, protocol.parse_idreq, protocol.build_idreq(7, ["key"])[0][:5])
+        recv_data = protocol.build_packed_response([("key", "value")], 9)[0]
+        self.assertRaises(struct.error, protocol.parse_request_id, recv_data[:5])
+
+    def test_write_headers(self):
+        self.assertRaises(struct.error, protocol.parse_write, protocol.build_put(5, "key", "value")[:5], "PUT")
+        self.assertRaises(struct.error, protocol.parse_sync_bucket, protocol.build_sync_bucket(3, [], True)[0][:5])
+
+    def test_members_cut_short(self):
+        records = [(("10.0.0.1", 5000), 3, 0), (("10.0.0.2", 5001), 4, 1)]
+        recv_data = protocol.build_ping(77, records)
+        self.assertEqual(protocol.parse_members(recv_data[:-1], "PING"), records[:1])
+
+    def test_members_unknown_state(self):
+        records = [(("10.0.0.1", 5000), 3, 0), (("10.0.0.2", 5001), 4, protocol.MEMBER_STATES),
+                   (("10.0.0.3", 5002), 5, 0xFF)]
+        recv_data = protocol.build_ping(77, records)
+        self.assertEqual(protocol.parse_members(recv_data, "PING"), records[:1])
+
+    def test_entries_cut_short(self):
+        entries = [("key", (3, 1, "value")), ("gone", (4, 2, None))]
+        recv_data = protocol.build_replicate(entries)[0]
+        self.assertEqual(protocol.parse_entries(recv_data[:-len("gone") - 2]), entries[:1])
+
+    def test_sync_digest_cut_short(self):
+        recv_data = protocol.build_sync_digest([1, 2, 3])
+        self.assertEqual(protocol.parse_sync_digest(recv_data[:-1]), (1, 2))
+
+    def test_summaries_cut_short(self):
+        recv_data = protocol.build_sync_bucket(3, [("a", (1, 1)), ("b", (2, 1))], False)[0]
+        self.assertEqual(protocol.parse_sync_bucket(recv_data[:-2])[2], [("a", (1, 1))])
+
+    def test_query(self):
+        recv_data = str(protocol.build_query(3, ("10.0.0.1", 5000), 42, "service0"))
+        self.assertRaises(struct.error, protocol.parse_query, recv_data[:protocol.QUERY_SIZE - 1])
+        self.assertEqual(protocol.parse_query(recv_data[:protocol.QUERY_SIZE])[4], "")
+
+if __name__ == "__main__":
+    unittest.main()
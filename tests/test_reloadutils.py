@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from utils import reloadutils, storeutils
+
+def setUpModule():
+    logging.disable(logging.CRITICAL)
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+"""
+| ===================================================================
+| ServiceListReloader: rebuilding and swapping the service list
+| ===================================================================
+"""
+
+class ReloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.directory, "services.txt")
+        self.swapped = []
+        self.write_services("service0 80 tcp\nservice1 81 udp\n")
+        self.reloader = reloadutils.ServiceListReloader(self.input_file, self.swapped.append)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_services(self, content):
+
+        # Replaced like an editor or a deploy would, so the inode changes whatever the size and mtime
+        tmp_file = self.input_file + ".tmp"
+        with open(tmp_file, "w") as services_file:
+            services_file.write(content)
+        os.rename(tmp_file, self.input_file)
+
+    def test_load(self):
+        self.assertEqual(self.reloader.load(), {"service0": "80 tcp", "service1": "81 udp"})
+        self.assertFalse(self.reloader.changed())
+        self.assertEqual(self.swapped, [])
+
+    def test_reload_applies_diff(self):
+        old = self.reloader.load()
+        self.write_services("service0 80 tcp\nservice1 82 udp\nservice2 83 tcp\n")
+        self.assertTrue(self.reloader.changed())
+        self.assertTrue(self.reloader.reload())
+        self.assertEqual(self.swapped, [{"service0": "80 tcp", "service1": "82 udp", "service2": "83 tcp"}])
+        self.assertEqual((self.reloader.last_reload["added"], self.reloader.last_reload["removed"]), (2, 1))
+        self.assertFalse(self.reloader.changed())
+
+        # The table lookups were using is left alone
+        self.assertEqual(old, {"service0": "80 tcp", "service1": "81 udp"})
+
+    def test_duplicate_keys_take_a_full_parse(self):
+        self.reloader.load()
+        self.write_services("service0 80 tcp\nservice1 81 udp\nservice1 84 udp\n")
+        self.reloader.reload()
+        self.assertEqual(self.swapped[-1], {"service0": "80 tcp", "service1": "84 udp"})
+        self.assertFalse(self.reloader.unique)
+
+        # Last line wins, as it does for a fresh read, once the duplicate goes away
+        self.write_services("service0 80 tcp\nservice1 84 udp\n")
+        self.reloader.reload()
+        self.assertEqual(self.swapped[-1], {"service0": "80 tcp", "service1": "84 udp"})
+        self.assertTrue(self.reloader.unique)
+
+    def test_switch_to_compiled_store(self):
+        self.reloader.load()
+        storeutils.compile_store({"service9": "89 tcp"}, self.input_file)
+        self.assertTrue(self.reloader.reload())
+        self.assertIsInstance(self.swapped[-1], storeutils.MappedServiceStore)
+        self.assertEqual(self.swapped[-1].get("service9"), "89 tcp")
+        self.swapped[-1].close()
+
+    def test_retired_store_unmapped_once_unused(self):
+        storeutils.compile_store({"service8": "88 tcp"}, self.input_file)
+        old = self.reloader.load()
+        mapped = old.map
+        storeutils.compile_store({"service9": "89 tcp"}, self.input_file)
+        self.assertTrue(self.reloader.reload())
+
+        # A lookup still holding the old store keeps it mapped
+        self.assertEqual(self.reloader.close_retired(), 1)
+        self.assertEqual(old.get("service8"), "88 tcp")
+        del old
+        self.assertEqual(self.reloader.close_retired(), 0)
+        self.assertRaises(ValueError, mapped.__getitem__, 0)
+        self.swapped[-1].close()
+
+    def test_failed_reload_keeps_the_old_list(self):
+        self.reloader.load()
+        os.remove(self.input_file)
+        self.assertFalse(self.reloader.changed())
+        self.assertFalse(self.reloader.reload())
+        self.assertEqual(self.swapped, [])
+        self.assertEqual(self.reloader.service_list, {"service0": "80 tcp", "service1": "81 udp"})
+
+    def test_background_reload(self):
+        self.reloader.interval = 0.01
+        self.reloader.load()
+        self.reloader.start()
+        self.write_services("service0 90 tcp\n")
+        deadline = time.time() + 2.0
+        while not self.swapped and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.swapped, [{"service0": "90 tcp"}])
+
+        # Back to waiting for trigger(), the daemon thread then sleeps until the interpreter exits
+        self.reloader.interval = 0
+
+    def test_trigger(self):
+        self.reloader.load()
+        self.reloader.start()
+        self.reloader.trigger()
+        deadline = time.time() + 2.0
+        while not self.swapped and time.time() < deadline:
+            time.sleep(0.01)
+
+        # A forced reload of an unchanged file still swaps, SIGHUP means reload
+        self.assertEqual(self.swapped, [{"service0": "80 tcp", "service1": "81 udp"}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+
+from utils import replicautils
+
+"""
+| ===================================================================
+| VersionedStore: writes over a loaded list, merged by version
+| ===================================================================
+"""
+
+class VersionedStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = {"loaded": "10.0.0.1:80"}
+        self.store = replicautils.VersionedStore(self.base, 1)
+
+    def test_write_shadows_base(self):
+        self.assertEqual(self.store.get("loaded"), "10.0.0.1:80")
+        self.assertEqual(self.store.version("loaded"), (0, 0))
+        self.assertEqual(self.store.write("loaded", "10.0.0.2:80"), (1, 1, "10.0.0.2:80"))
+        self.assertEqual(self.store.get("loaded"), "10.0.0.2:80")
+        self.assertEqual(self.store.write("loaded", None), (2, 1, None))
+        self.assertNotIn("loaded", self.store)
+        self.assertEqual(self.base, {"loaded": "10.0.0.1:80"})
+
+    def test_newest_version_wins(self):
+        self.assertTrue(self.store.apply("key", (5, 2, "a")))
+        self.assertFalse(self.store.apply("key", (4, 3, "b")))
+        self.assertFalse(self.store.apply("key", (5, 2, "b")))
+
+        # Equal counters are ordered by writer
+        self.assertTrue(self.store.apply("key", (5, 3, "c")))
+        self.assertEqual(self.store.get("key"), "c")
+
+        # Local writes come after everything seen so far
+        self.assertEqual(self.store.write("key", "d"), (6, 1, "d"))
+        self.assertEqual(self.store.get("key"), "d")
+
+    def test_delete_of_unknown_key_is_not_stored(self):
+        self.assertFalse(self.store.apply("never", (3, 2, None)))
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.digests, [0] * len(self.store.digests))
+
+    def test_digests_merge_in_any_order(self):
+        writes = [("key%d" % i, (i + 1, 2, "value%d" % i)) for i in xrange(50)]
+        writes += [("key%d" % i, (100 + i, 3, "other%d" % i)) for i in xrange(0, 50, 3)]
+        deletes = [("key%d" % i, (200 + i, 3, None)) for i in xrange(0, 50, 5)]
+        other = replicautils.VersionedStore(dict(), 4)
+        for key, entry in writes + deletes:
+            self.store.apply(key, entry)
+        for key, entry in list(reversed(writes)) + list(reversed(deletes)):
+            other.apply(key, entry)
+        self.assertEqual(self.store.digests, other.digests)
+        self.assertEqual(self.store.entries, other.entries)
+        self.assertNotEqual(self.store.digests, [0] * len(self.store.digests))
+
+    def test_delete_before_put(self):
+        other = replicautils.VersionedStore(dict(), 4)
+        self.store.apply("key", (1, 2, "a"))
+        self.store.apply("key", (2, 2, None))
+
+        # Nothing to delete yet, the newer tombstone wins once anti-entropy brings it again
+        self.assertFalse(other.apply("key", (2, 2, None)))
+        self.assertTrue(other.apply("key", (1, 2, "a")))
+        self.assertNotEqual(self.store.digests, other.digests)
+        self.assertTrue(other.apply("key", self.store.entries["key"]))
+        self.assertEqual(self.store.digests, other.digests)
+        self.assertNotIn("key", other)
+
+    def test_digests_cover_writes_only(self):
+        other = replicautils.VersionedStore({"elsewhere": "10.0.0.3:80"}, 2)
+        self.assertEqual(self.store.digests, other.digests)
+        self.store.write("key", "a")
+        self.assertNotEqual(self.store.digests, other.digests)
+        other.apply("key", self.store.entries["key"])
+        self.assertEqual(self.store.digests, other.digests)
+
+    def test_summary(self):
+        self.store.apply("key", (5, 2, "a"))
+        bucket = self.store.bucket("key")
+        self.assertEqual(self.store.summary(bucket), [("key", (5, 2))])
+        self.assertEqual(self.store.items(["key", "missing"]), [("key", (5, 2, "a"))])
+        self.assertEqual(sum(len(self.store.summary(b)) for b in xrange(len(self.store.digests))), 1)
+
+    def test_match_skips_deletes(self):
+        for i in xrange(5):
+            self.store.write("service%d" % i, "10.0.0.1:%d" % i)
+        self.store.write("service1", None)
+        self.assertEqual(self.store.match("service*"),
+                         ([("service0", "10.0.0.1:0"), ("service2", "10.0.0.1:2"), ("service3", "10.0.0.1:3"),
+                           ("service4", "10.0.0.1:4")], False))
+        self.assertEqual(self.store.match("service*", limit=2), ([("service0", "10.0.0.1:0"),
+                                                                  ("service2", "10.0.0.1:2")], True))
+
+    def test_match_sees_applied_entries(self):
+        self.assertEqual(self.store.match("*")[0], [("loaded", "10.0.0.1:80")])
+        self.store.apply("key", (5, 2, "a"))
+        self.assertEqual(self.store.match("*")[0], [("key", "a"), ("loaded", "10.0.0.1:80")])
+
+    def test_collect_tombstones(self):
+        self.store.write("key", "a")
+        self.store.write("key", None)
+        self.store.write("loaded", None)
+        self.assertEqual([self.store.collect(3) for _ in xrange(3)], [0, 0, 1])
+        self.assertNotIn("key", self.store.entries)
+        self.assertEqual(self.store.tombstones, dict())
+
+        # A tombstone over a loaded entry stays, the loaded value would be back otherwise
+        self.assertNotIn("loaded", self.store)
+        other = replicautils.VersionedStore(self.base, 2)
+        other.apply("loaded", self.store.entries["loaded"])
+        self.assertEqual(self.store.digests, other.digests)
+
+    def test_rewrite_cancels_collection(self):
+        self.store.write("key", "a")
+        self.store.write("key", None)
+        self.store.collect(3)
+        self.store.write("key", "b")
+        self.assertEqual([self.store.collect(3) for _ in xrange(5)], [0] * 5)
+        self.assertEqual(self.store.get("key"), "b")
+
+    def test_swap(self):
+        self.store.write("written", "a")
+        self.store.match("*")
+        self.store.swap({"reloaded": "10.0.0.9:80"})
+        self.assertIsNone(self.store.get("loaded"))
+        self.assertEqual(self.store.get("reloaded"), "10.0.0.9:80")
+        self.assertEqual(self.store.get("written"), "a")
+        self.assertEqual(self.store.match("*")[0], [("reloaded", "10.0.0.9:80"), ("written", "a")])
+
+    def test_swap_builds_index_only_if_used(self):
+        self.store.swap({"reloaded": "10.0.0.9:80"})
+        self.assertIsNone(self.store.index)
+        self.store.match("*")
+        self.store.swap({"again": "10.0.0.9:80"})
+        self.store.match("*")
+        self.assertEqual(self.store.index.keys, ["again"])
+
+    def test_swap_keeps_writes_made_during_rebuild(self):
+        store = self.store
+
+        # The reloader thread is interrupted by a write in the loop, after it took the keys written so far
+        class ReloadedList(dict):
+            def __iter__(self):
+                store.write("late", "b")
+                return dict.__iter__(self)
+
+        store.write("written", "a")
+        store.match("*")
+        store.swap(ReloadedList(reloaded="10.0.0.9:80"))
+        self.assertEqual(store.match("*")[0], [("late", "b"), ("reloaded", "10.0.0.9:80"), ("written", "a")])
+
+    def test_writer_tag(self):
+        self.assertEqual(replicautils.writer_tag(("10.0.0.1", 5000)), replicautils.writer_tag(("10.0.0.1", 5000)))
+        self.assertNotEqual(replicautils.writer_tag(("10.0.0.1", 5000)), replicautils.writer_tag(("10.0.0.1", 5001)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,710 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import json
+import logging
+import socket
+import struct
+import time
+import unittest
+
+from utils import cacheutils, dhtutils, memberutils, peerutils, protocol, serventutils, utils
+
+def setUpModule():
+    logging.disable(logging.CRITICAL)
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+"""
+| ===================================================================
+| Servent.handle: datagrams in, answers and forwarded queries out
+| ===================================================================
+"""
+
+class ServentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sockets = []
+        self.srv_sock = self.udp_socket()
+        self.client = self.udp_socket()
+        self.peers = [self.udp_socket() for _ in xrange(2)]
+        self.servent = self.make_servent()
+
+    def make_servent(self, **kwargs):
+        return serventutils.Servent(self.srv_sock, self.srv_sock.getsockname(), {"service0": "10.0.0.1:80"},
+                                    peerutils.PeerTable(peer.getsockname() for peer in self.peers),
+                                    cacheutils.TTLCache(), **kwargs)
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def udp_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(0.2)
+        self.sockets.append(sock)
+        return sock
+
+    def received(self, sock):
+        """Every datagram sock got so far"""
+        datagrams = []
+        while True:
+            try:
+                datagrams.append(sock.recvfrom(utils.MAX_BUFFER_SIZE)[0])
+            except socket.timeout:
+                return datagrams
+            sock.settimeout(0.05)
+
+    def clireq(self, key):
+        return struct.pack(utils.MESSAGE_FORMAT["CLIREQ"], utils.MESSAGE_TYPES["CLIREQ"]) + key
+
+    def query(self, ttl, from_addr, seq, key):
+        return struct.pack(utils.MESSAGE_FORMAT["QUERY"], utils.MESSAGE_TYPES["QUERY"], ttl,
+                           utils.ip_to_int(from_addr[0]), from_addr[1], seq) + key
+
+    def parse_query(self, recv_data):
+        header_size = struct.calcsize(utils.MESSAGE_FORMAT["QUERY"])
+        _, ttl, from_ip, from_port, _ = struct.unpack(utils.MESSAGE_FORMAT["QUERY"], recv_data[:header_size])
+        return ttl, (utils.int_to_ip(from_ip), from_port), recv_data[header_size:]
+
+    def response(self, key, value):
+        return struct.pack("!H", utils.MESSAGE_TYPES["RESPONSE"]) + key + "\t" + value + "\x00\x00"
+
+    def multireq(self, keys):
+        return protocol.build_multireq(keys)[0]
+
+    def responses(self, sock):
+        return sorted(sum((protocol.parse_responses(recv_data) for recv_data in self.received(sock)), []))
+
+class ServentTest(ServentTestCase):
+
+    def test_clireq_answered_locally_and_forwarded(self):
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.assertEqual(self.received(self.client), [self.response("service0", "10.0.0.1:80")])
+        for peer in self.peers:
+            queries = [self.parse_query(recv_data) for recv_data in self.received(peer)]
+            self.assertTrue(queries)
+            self.assertEqual(set(queries), set([(utils.TTL, self.client.getsockname(), "service0")]))
+
+    def test_query_answers_its_origin(self):
+        origin = self.udp_socket()
+        self.servent.handle(self.query(2, origin.getsockname(), 7, "service0"), self.peers[0].getsockname())
+        self.assertEqual(len(self.received(origin)), 1)
+        self.assertEqual(self.received(self.client), [])
+
+    def test_query_forwarded_with_lower_ttl(self):
+        origin = self.client.getsockname()
+        self.servent.handle(self.query(2, origin, 7, "missing"), self.peers[0].getsockname())
+        self.assertEqual(self.received(self.client), [])
+
+        # Never back to the peer it came from
+        self.assertEqual(self.received(self.peers[0]), [])
+        self.assertEqual([self.parse_query(recv_data) for recv_data in self.received(self.peers[1])],
+                         [(1, origin, "missing")])
+
+    def test_query_ttl_exhausted(self):
+        self.servent.handle(self.query(0, self.client.getsockname(), 7, "missing"), self.peers[0].getsockname())
+        self.assertEqual(self.received(self.peers[1]), [])
+
+    def test_duplicate_query_dropped(self):
+        recv_data = self.query(2, self.client.getsockname(), 7, "service0")
+        self.servent.handle(recv_data, self.peers[0].getsockname())
+        self.servent.handle(recv_data, self.peers[1].getsockname())
+        self.assertEqual(len(self.received(self.client)), 1)
+        self.assertEqual(len(self.received(self.peers[1])), 1)
+        self.assertEqual(self.received(self.peers[0]), [])
+
+    def test_multireq(self):
+        self.servent.handle(self.multireq(["service0", "missing0", "missing1"]), self.client.getsockname())
+        self.assertEqual(self.responses(self.client), [("service0", "10.0.0.1:80")])
+
+        # Only the misses go on, in one MULTIQUERY per peer
+        for peer in self.peers:
+            self.assertEqual([protocol.parse_multiquery(recv_data) for recv_data in self.received(peer)],
+                             [(utils.TTL,) + self.client.getsockname() + (self.servent.seq, ["missing0", "missing1"])])
+
+    def test_multiquery(self):
+        origin = self.client.getsockname()
+        for recv_data in protocol.build_multiquery(1, origin, 7, ["service0", "missing0"]):
+            self.servent.handle(recv_data, self.peers[0].getsockname())
+        self.assertEqual(self.responses(self.client), [("service0", "10.0.0.1:80")])
+        self.assertEqual([protocol.parse_multiquery(recv_data) for recv_data in self.received(self.peers[1])],
+                         [(0,) + origin + (7, ["missing0"])])
+        self.assertEqual(self.received(self.peers[0]), [])
+
+        # Keys seen under the same origin and seq are dropped one by one
+        for recv_data in protocol.build_multiquery(1, origin, 7, ["service0", "missing0", "missing1"]):
+            self.servent.handle(recv_data, self.peers[0].getsockname())
+        self.assertEqual(self.responses(self.client), [])
+        self.assertEqual([protocol.parse_multiquery(recv_data)[4] for recv_data in self.received(self.peers[1])],
+                         [["missing1"]])
+
+    def test_idreq(self):
+        self.servent.handle(protocol.build_idreq(9, ["service0", "missing0"])[0], self.client.getsockname())
+        answers = self.received(self.client)
+        self.assertEqual([protocol.parse_request_id(recv_data) for recv_data in answers], [9])
+        self.assertEqual(protocol.parse_responses(answers[0], "IDRESPONSE"), [("service0", "10.0.0.1:80")])
+        for peer in self.peers:
+            self.assertEqual([protocol.parse_idquery(recv_data) for recv_data in self.received(peer)],
+                             [(utils.TTL,) + self.client.getsockname() + (9, 1, ["missing0"])])
+
+    def test_idreq_wanting_several_answers(self):
+
+        # Other servents may hold the key too, so a hit doesn't stop the flood
+        self.servent.handle(protocol.build_idreq(9, ["service0"], wanted=3)[0], self.client.getsockname())
+        self.assertEqual(len(self.received(self.client)), 1)
+        for peer in self.peers:
+            self.assertEqual([protocol.parse_idquery(recv_data)[4:] for recv_data in self.received(peer)],
+                             [(3, ["service0"])])
+
+    def test_swap_service_list(self):
+        self.servent.swap_service_list({"service1": "10.0.0.2:80"})
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.servent.handle(self.clireq("service1"), self.client.getsockname())
+        self.assertEqual(self.received(self.client), [self.response("service1", "10.0.0.2:80")])
+
+    def test_unknown_type_ignored(self):
+        for message_type in (999, 1000, 0xFFFF):
+            self.servent.handle(struct.pack("!H", message_type) + "service0", self.client.getsockname())
+        self.assertEqual(self.received(self.client), [])
+        self.assertEqual(self.received(self.peers[0]), [])
+        self.assertEqual(self.servent.counters["unknown_type"], 3)
+        self.assertEqual(self.servent.processing, {})
+
+"""
+| ===================================================================
+| Response cache: answers relayed through us and kept for later
+| ===================================================================
+"""
+
+class ResponseCacheTest(ServentTestCase):
+
+    def setUp(self):
+        ServentTestCase.setUp(self)
+        self.servent = self.make_servent(response_cache=cacheutils.TTLCache())
+
+    def test_flood_carries_our_address(self):
+        self.servent.handle(self.clireq("remote"), self.client.getsockname())
+        for peer in self.peers:
+            self.assertEqual(set(self.parse_query(recv_data) for recv_data in self.received(peer)),
+                             set([(utils.TTL, self.srv_sock.getsockname(), "remote")]))
+
+    def test_answer_relayed_then_served_from_cache(self):
+        self.servent.handle(self.clireq("remote"), self.client.getsockname())
+        self.received(self.peers[0])
+        self.received(self.peers[1])
+        self.servent.handle(self.response("remote", "10.0.0.5:80"), self.peers[0].getsockname())
+        self.assertEqual(self.received(self.client), [self.response("remote", "10.0.0.5:80")])
+
+        # Another client gets the cached answer and nothing is flooded
+        other_client = self.udp_socket()
+        self.servent.handle(self.clireq("remote"), other_client.getsockname())
+        self.assertEqual(self.received(other_client), [self.response("remote", "10.0.0.5:80")])
+        self.assertEqual(self.received(self.peers[0]), [])
+        self.assertEqual(self.servent.counters["floods_saved"], len(self.peers))
+
+    def test_large_response_relayed(self):
+        self.servent.handle(self.clireq("remote"), self.client.getsockname())
+        notice = protocol.build_large_response(0, 1 << 20, ("10.0.0.5", 6000), "remote")
+        self.servent.handle(notice, self.peers[0].getsockname())
+        self.assertEqual(self.received(self.client), [notice])
+        self.assertEqual(self.servent.counters["large_response"], 1)
+
+    def test_cached_large_response_announced_on(self):
+        self.servent.handle(self.clireq("remote"), self.client.getsockname())
+        self.servent.handle(protocol.build_large_response(0, 1 << 20, ("10.0.0.5", 6000), "remote"),
+                            self.peers[0].getsockname())
+        self.received(self.client)
+
+        # A batch hitting the cached notice gets it back under its own request id, not parsed as a RESPONSE
+        self.servent.handle(protocol.build_idreq(9, ["remote"])[0], self.client.getsockname())
+        self.assertEqual(self.received(self.client),
+                         [protocol.build_large_response(9, 1 << 20, ("10.0.0.5", 6000), "remote")])
+
+    def test_unsolicited_response_dropped(self):
+        self.servent.handle(self.response("remote", "10.0.0.6:80"), self.peers[0].getsockname())
+        self.assertEqual(self.received(self.client), [])
+        self.assertIsNone(self.servent.response_cache.peek("remote"))
+        self.assertEqual(self.servent.counters["responses_unsolicited"], 1)
+
+    def test_answer_from_waiting_client_dropped(self):
+        self.servent.handle(self.clireq("remote"), self.client.getsockname())
+        self.servent.handle(self.response("remote", "10.0.0.6:80"), self.client.getsockname())
+        self.assertEqual(self.received(self.client), [])
+        self.assertIsNone(self.servent.response_cache.peek("remote"))
+        self.assertEqual(self.servent.counters["responses_unsolicited"], 1)
+
+    def test_cached_answers_capped(self):
+        self.servent.handle(self.clireq("remote"), self.client.getsockname())
+        for i in xrange(utils.RESPONSE_CACHE_ANSWERS + 2):
+            self.servent.handle(self.response("remote", "10.0.0.%d:80" % i), self.peers[0].getsockname())
+        self.assertEqual(len(self.received(self.client)), utils.RESPONSE_CACHE_ANSWERS + 2)
+        self.assertEqual(len(self.servent.response_cache.peek("remote")), utils.RESPONSE_CACHE_ANSWERS)
+
+    def test_stats(self):
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        stats = self.servent.stats()
+        self.assertEqual((stats["clireq"], stats["local_hits"]), (1, 1))
+        self.assertIn("response_cache", stats)
+
+    def test_processing_histograms(self):
+        for _ in xrange(3):
+            self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.servent.handle(self.multireq(["service0"]), self.client.getsockname())
+        stats = self.servent.stats()
+        self.assertEqual(stats["messages"], {"CLIREQ": 3, "MULTIREQ": 1})
+        self.assertEqual(stats["processing_us"]["CLIREQ"]["count"], 3)
+        self.assertGreaterEqual(stats["processing_us"]["MULTIREQ"]["max"], 0)
+        self.assertGreaterEqual(stats["uptime"], 0)
+
+        # Dumped as JSON by the servent
+        self.assertEqual(json.loads(json.dumps(stats))["messages"]["CLIREQ"], 3)
+
+"""
+| ===================================================================
+| Routed lookups: one QUERY towards the servent storing the key
+| ===================================================================
+"""
+
+class RoutedTest(ServentTestCase):
+
+    def setUp(self):
+        ServentTestCase.setUp(self)
+        self.ring = dhtutils.Ring(self.srv_sock.getsockname(), [peer.getsockname() for peer in self.peers])
+        self.servent = self.make_servent(ring=self.ring)
+
+    def key_stored_by(self, addr):
+        return next(key for key in ("key%d" % i for i in xrange(1000)) if self.ring.responsible(key) == addr)
+
+    def test_clireq_routed_to_one_peer(self):
+        key = self.key_stored_by(self.peers[1].getsockname())
+        self.servent.handle(self.clireq(key), self.client.getsockname())
+        next_hop = self.ring.next_hop(key)
+        for peer in self.peers:
+            queries = [self.parse_query(recv_data) for recv_data in self.received(peer)]
+            if peer.getsockname() == next_hop:
+                self.assertEqual(queries, [(utils.ROUTED_TTL, self.client.getsockname(), key)])
+            else:
+                self.assertEqual(queries, [])
+
+    def test_query_stops_where_the_key_belongs(self):
+        key = self.key_stored_by(self.srv_sock.getsockname())
+        self.servent.handle(self.query(utils.ROUTED_TTL, self.client.getsockname(), 7, key),
+                            self.peers[0].getsockname())
+        self.assertEqual(self.received(self.peers[0]) + self.received(self.peers[1]), [])
+        self.assertEqual(self.servent.counters["routed_lookups"], 1)
+
+class ReplicationTest(ServentTestCase):
+
+    def acks(self, sock):
+        return [(protocol.parse_request_id(recv_data), protocol.parse_responses(recv_data, "IDRESPONSE"))
+                for recv_data in self.received(sock)]
+
+    def entries(self, sock):
+        return sum((protocol.parse_entries(recv_data) for recv_data in self.received(sock)), [])
+
+    def test_put_acked_and_replicated(self):
+        self.servent.handle(protocol.build_put(42, "key", "10.0.0.2:80"), self.client.getsockname())
+        self.assertEqual(self.acks(self.client), [(42, [("key", "10.0.0.2:80")])])
+        self.assertEqual(self.servent.service_list.get("key"), "10.0.0.2:80")
+
+        # utils.REPLICAS peers get the versioned entry
+        replicated = [self.entries(peer) for peer in self.peers]
+        self.assertEqual(sum(len(entries) for entries in replicated), min(utils.REPLICAS, len(self.peers)))
+        for entries in replicated:
+            if entries:
+                self.assertEqual(entries, [("key", self.servent.service_list.entries["key"])])
+
+    def test_delete(self):
+        self.servent.handle(protocol.build_delete(43, "service0"), self.client.getsockname())
+        self.assertEqual(self.acks(self.client), [(43, [("service0", "")])])
+        self.assertNotIn("service0", self.servent.service_list)
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.assertEqual(self.received(self.client), [])
+
+    def test_replicate_applies_newest(self):
+        sender = self.peers[0].getsockname()
+        self.servent.handle(protocol.build_replicate([("key", (5, 2, "a"))])[0], sender)
+        self.servent.handle(protocol.build_replicate([("key", (4, 2, "b"))])[0], sender)
+        self.assertEqual(self.servent.service_list.get("key"), "a")
+        self.assertEqual(self.servent.counters["entries_applied"], 1)
+        self.assertEqual(self.servent.counters["entries_stale"], 1)
+
+    def test_sync_collects_tombstones(self):
+        self.servent.handle(protocol.build_put(1, "key", "a"), self.client.getsockname())
+        self.servent.handle(protocol.build_delete(2, "key"), self.client.getsockname())
+        for _ in xrange(utils.TOMBSTONE_ROUNDS):
+            self.servent.sync()
+        self.assertEqual(self.servent.counters["tombstones_collected"], 1)
+        self.assertNotIn("key", self.servent.service_list.entries)
+
+    def test_anti_entropy_converges(self):
+        other_sock = self.udp_socket()
+        other = serventutils.Servent(other_sock, other_sock.getsockname(), {}, [self.srv_sock.getsockname()],
+                                     cacheutils.TTLCache())
+        self.servent = self.make_servent()
+        self.servent.other_peers = peerutils.PeerTable([other_sock.getsockname()])
+        for i in xrange(20):
+            self.servent.service_list.write("ours%d" % i, "10.0.0.%d:80" % i)
+            other.service_list.write("theirs%d" % i, "10.0.1.%d:80" % i)
+        self.servent.service_list.write("both", "old")
+        other.service_list.apply("both", (100, 0, "new"))
+
+        # One round from either side, then datagrams pumped until both are quiet
+        self.servent.sync()
+        while True:
+            moved = False
+            for sock, servent, sender in ((self.srv_sock, self.servent, other_sock.getsockname()),
+                                          (other_sock, other, self.srv_sock.getsockname())):
+                for recv_data in self.received(sock):
+                    servent.handle(recv_data, sender)
+                    moved = True
+            if not moved:
+                break
+        self.assertEqual(self.servent.service_list.digests, other.service_list.digests)
+        self.assertEqual(self.servent.service_list.entries, other.service_list.entries)
+        self.assertEqual(self.servent.service_list.get("both"), "new")
+
+        # The buckets sent back for our digests measured the peer without a ping
+        self.assertIsNotNone(self.servent.other_peers.health[other_sock.getsockname()].srtt)
+        self.assertEqual(other.service_list.get("ours7"), "10.0.0.7:80")
+
+class LargeValueTest(ServentTestCase):
+
+    def setUp(self):
+        ServentTestCase.setUp(self)
+        self.servent = self.make_servent(stream_addr=self.srv_sock.getsockname())
+        self.large = "x" * (utils.LARGE_VALUE_THRESHOLD + 1)
+        self.servent.service_list.write("large", self.large)
+
+    def announced(self, sock):
+        return [protocol.parse_large_response(recv_data) for recv_data in self.received(sock)]
+
+    def test_clireq_announces_large_value(self):
+        self.servent.handle(self.clireq("large"), self.client.getsockname())
+        self.assertEqual(self.announced(self.client), [(0, len(self.large), self.srv_sock.getsockname(), "large")])
+
+    def test_idreq_announces_large_value(self):
+        self.servent.handle(protocol.build_idreq(5, ["large", "service0"])[0], self.client.getsockname())
+        received = self.received(self.client)
+        self.assertEqual([protocol.message_type(recv_data) for recv_data in received],
+                         [utils.MESSAGE_TYPES["LARGERESPONSE"], utils.MESSAGE_TYPES["IDRESPONSE"]])
+        self.assertEqual(protocol.parse_large_response(received[0]),
+                         (5, len(self.large), self.srv_sock.getsockname(), "large"))
+        self.assertEqual(protocol.parse_responses(received[1], "IDRESPONSE"), [("service0", "10.0.0.1:80")])
+        self.assertEqual(self.servent.counters["large_announced"], 1)
+
+    def test_threshold(self):
+        self.servent = self.make_servent(large_threshold=1 << 12, stream_addr=self.srv_sock.getsockname())
+        self.servent.service_list.write("large", self.large)
+        self.servent.handle(protocol.build_idreq(5, ["large"])[0], self.client.getsockname())
+        received = self.received(self.client)
+        self.assertEqual([protocol.parse_responses(recv_data, "IDRESPONSE") for recv_data in received],
+                         [[("large", self.large)]])
+
+    def test_inline_without_stream_addr(self):
+        self.servent = self.make_servent()
+        self.servent.service_list.write("large", self.large)
+        self.servent.handle(self.clireq("large"), self.client.getsockname())
+        self.servent.handle(protocol.build_idreq(5, ["large"])[0], self.client.getsockname())
+        received = self.received(self.client)
+        self.assertEqual([protocol.message_type(recv_data) for recv_data in received],
+                         [utils.MESSAGE_TYPES["RESPONSE"], utils.MESSAGE_TYPES["IDRESPONSE"]])
+        self.assertEqual(protocol.parse_responses(received[1], "IDRESPONSE"), [("large", self.large)])
+        self.assertEqual(self.servent.counters["large_announced"], 0)
+
+    def test_glob_announces_ahead_of_page(self):
+        self.servent.handle(protocol.build_globreq(9, 10, "*"), self.client.getsockname())
+        received = self.received(self.client)
+        self.assertEqual(protocol.parse_large_response(received[0])[3], "large")
+        self.assertEqual([protocol.parse_glob_response(recv_data) for recv_data in received[1:]],
+                         [(9, False, [("service0", "10.0.0.1:80")])])
+
+class HeartbeatTest(ServentTestCase):
+
+    def test_ping_answered(self):
+        self.servent.handle(protocol.build_ping(77), self.peers[0].getsockname())
+        self.assertEqual(self.received(self.peers[0]), [protocol.build_pong(77)])
+
+    def test_heartbeat_pings_silent_peers(self):
+        self.servent.handle(protocol.build_ping(1), self.peers[0].getsockname())
+        self.received(self.peers[0])
+        self.servent.heartbeat()
+        self.assertEqual(self.received(self.peers[0]), [])
+        pings = self.received(self.peers[1])
+        self.assertEqual([protocol.message_type(recv_data) for recv_data in pings], [utils.MESSAGE_TYPES["PING"]])
+
+        # The pong gives the peer its round trip time
+        self.servent.handle(protocol.build_pong(protocol.parse_ping(pings[0])), self.peers[1].getsockname())
+        self.assertIsNotNone(self.servent.other_peers.health[self.peers[1].getsockname()].srtt)
+
+    def test_unhealthy_peer_left_out(self):
+        for _ in xrange(utils.HEALTH_MAX_MISSED + 1):
+            self.servent.other_peers.due_pings(time.time() + 3600, self.servent.heartbeat_interval)
+        self.servent.handle(protocol.build_ping(1), self.peers[0].getsockname())
+        self.received(self.peers[0])
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.assertEqual(len(self.received(self.peers[0])), 1)
+        self.assertEqual(self.received(self.peers[1]), [])
+        stats = self.servent.stats()
+        self.assertEqual((stats["peers"], stats["peers_unhealthy"], stats["forwards_skipped"]), (2, 1, 1))
+
+class MembershipTest(ServentTestCase):
+
+    def setUp(self):
+        ServentTestCase.setUp(self)
+        self.seed = self.peers[0]
+        self.membership = memberutils.Membership(self.srv_sock.getsockname(), [self.seed.getsockname()],
+                                                 incarnation=5)
+        self.servent = serventutils.Servent(self.srv_sock, self.srv_sock.getsockname(), {}, [],
+                                            cacheutils.TTLCache(), membership=self.membership)
+
+    def test_alone_joins_seeds(self):
+        self.servent.heartbeat()
+        self.assertEqual(self.received(self.seed), [protocol.build_join(5)])
+
+    def test_join_verified_before_members(self):
+        joiner = self.peers[1].getsockname()
+        self.membership.apply(("10.0.0.7", 5007), 2, memberutils.ALIVE, time.time())
+        self.servent.handle(protocol.build_join(3), joiner)
+
+        # The joiner first gets a bare ping, as big as its JOIN, and isn't a member yet
+        pings = self.received(self.peers[1])
+        self.assertEqual([len(recv_data) for recv_data in pings], [len(protocol.build_join(3))])
+        self.assertIsNone(self.membership.state(joiner))
+        self.servent.handle(protocol.build_pong(protocol.parse_ping(pings[0]) + 1), joiner)
+        self.assertIsNone(self.membership.state(joiner))
+
+        # Answering with the nonce proves it owns the address
+        self.servent.handle(protocol.build_pong(protocol.parse_ping(pings[0])), joiner)
+        received = self.received(self.peers[1])
+        self.assertEqual([protocol.parse_observed(recv_data) for recv_data in received], [joiner])
+        self.assertEqual(sorted(protocol.parse_members(received[0], "MEMBERS")),
+                         sorted([(("10.0.0.7", 5007), 2, memberutils.ALIVE),
+                                 (self.srv_sock.getsockname(), 5, memberutils.ALIVE)]))
+        self.assertEqual(self.membership.entry(joiner), (3, memberutils.ALIVE))
+        self.assertIn(joiner, self.servent.other_peers)
+        self.assertEqual(self.servent.counters["members_admitted"], 1)
+
+    def test_join_from_member_answered_right_away(self):
+        member = self.peers[1].getsockname()
+        self.membership.apply(member, 1, memberutils.ALIVE, time.time())
+        self.servent.handle(protocol.build_join(1), member)
+        self.assertEqual([protocol.message_type(recv_data) for recv_data in self.received(self.peers[1])],
+                         [utils.MESSAGE_TYPES["MEMBERS"]])
+
+    def test_members_reply_capped(self):
+        member = self.peers[1].getsockname()
+        now = time.time()
+        for i in xrange(utils.GOSSIP_MAX_MEMBERS + 100):
+            self.membership.apply(("10.0.%d.%d" % (i / 250, i % 250 + 1), 5000), 1, memberutils.ALIVE, now)
+        self.membership.apply(member, 1, memberutils.ALIVE, now)
+        self.servent.handle(protocol.build_join(1), member)
+        records = sum((protocol.parse_members(recv_data, "MEMBERS") for recv_data in self.received(self.peers[1])), [])
+        self.assertEqual(len(records), utils.GOSSIP_MAX_MEMBERS)
+        self.assertIn(self.srv_sock.getsockname(), [record[0] for record in records])
+
+    def test_members_learned_from_seed(self):
+        records = [(self.seed.getsockname(), 1, memberutils.ALIVE), (self.peers[1].getsockname(), 1, memberutils.ALIVE)]
+        self.servent.heartbeat()
+        self.servent.handle(protocol.build_members(("10.0.0.1", 6000), records)[0], self.seed.getsockname())
+        self.assertEqual(self.membership.self_addr, ("10.0.0.1", 6000))
+        self.assertEqual(sorted(self.servent.other_peers), sorted(peer.getsockname() for peer in self.peers))
+        self.assertEqual(self.servent.stats()["membership"]["alive"], 2)
+
+    def test_unknown_state_ignored(self):
+        seed = self.seed.getsockname()
+        self.membership.apply(seed, 1, memberutils.ALIVE, time.time())
+        records = [(("10.0.0.7", 5007), 1, protocol.MEMBER_STATES), (("10.0.0.8", 5008), 1, memberutils.ALIVE)]
+        self.servent.handle(protocol.build_ping(7, records), seed)
+        self.assertIsNone(self.membership.state(("10.0.0.7", 5007)))
+        self.assertEqual(self.servent.stats()["membership"]["alive"], 2)
+
+    def test_unsolicited_members_dropped(self):
+        records = [(("10.0.0.7", 5007), 1, memberutils.ALIVE)]
+        self.servent.handle(protocol.build_members(("10.0.0.1", 6000), records)[0], self.peers[1].getsockname())
+        self.assertEqual(self.membership.self_addr, self.srv_sock.getsockname())
+        self.assertEqual(len(self.membership), 0)
+        self.assertEqual(self.servent.counters["members_unsolicited"], 1)
+
+    def test_ping_gossips(self):
+        records = [(self.peers[1].getsockname(), 1, memberutils.ALIVE)]
+
+        # Unknown hosts get a bare pong, and can't make anyone a member
+        self.servent.handle(protocol.build_ping(7, records), self.seed.getsockname())
+        self.assertEqual(len(self.membership), 0)
+        self.assertEqual(self.received(self.seed), [protocol.build_pong(7)])
+
+        # Members can, and get our news back
+        self.membership.apply(self.seed.getsockname(), 1, memberutils.ALIVE, time.time())
+        self.servent.handle(protocol.build_ping(8, records), self.seed.getsockname())
+        self.assertTrue(self.membership.is_alive(self.peers[1].getsockname()))
+        received = self.received(self.seed)
+        self.assertIn(self.srv_sock.getsockname(),
+                      [member for member, _, _ in protocol.parse_members(received[0], "PONG")])
+
+    def test_self_vouching_pinger_admitted(self):
+        pinger = self.seed.getsockname()
+        self.servent.handle(protocol.build_ping(7, [(pinger, 2, memberutils.ALIVE)]), pinger)
+        received = self.received(self.seed)
+        self.assertEqual(len(received), 2)
+        nonce = protocol.parse_ping(received[0])
+        self.assertEqual(received[1], protocol.build_pong(7))
+        self.assertIsNone(self.membership.state(pinger))
+        self.servent.handle(protocol.build_pong(nonce), pinger)
+        self.assertEqual(self.membership.entry(pinger), (2, memberutils.ALIVE))
+
+        # It didn't ask for our view, so it doesn't get it
+        self.assertEqual(self.received(self.seed), [])
+
+    def test_suspect_told_directly(self):
+        suspect = self.seed.getsockname()
+        self.membership.apply(suspect, 1, memberutils.SUSPECT, time.time())
+        self.servent.handle(protocol.build_ping(7), suspect)
+        received = self.received(self.seed)
+        self.assertEqual(protocol.parse_members(received[0], "PONG")[0], (suspect, 1, memberutils.SUSPECT))
+
+    def test_probe_and_pong(self):
+        self.membership.apply(self.seed.getsockname(), 1, memberutils.ALIVE, time.time())
+        self.servent.heartbeat()
+        pings = self.received(self.seed)
+        self.assertEqual([protocol.message_type(recv_data) for recv_data in pings], [utils.MESSAGE_TYPES["PING"]])
+        self.servent.handle(protocol.build_pong(protocol.parse_ping(pings[0])), self.seed.getsockname())
+        self.assertIsNone(self.membership.probing)
+
+        # An unanswered probe makes its member suspect, and suspects get no forwards
+        self.servent.heartbeat()
+        self.received(self.seed)
+        self.servent.heartbeat()
+        self.assertEqual(self.membership.state(self.seed.getsockname()), memberutils.SUSPECT)
+        self.assertIn(self.seed.getsockname(), self.servent.other_peers.unhealthy)
+
+    def test_leave(self):
+        self.membership.apply(self.seed.getsockname(), 1, memberutils.ALIVE, time.time())
+        self.servent.refresh_peers()
+        self.servent.leave()
+        self.assertEqual(self.received(self.seed), [protocol.build_leave(5)])
+        self.servent.handle(protocol.build_leave(1), self.seed.getsockname())
+        self.assertEqual(self.membership.state(self.seed.getsockname()), memberutils.LEFT)
+        self.assertNotIn(self.seed.getsockname(), self.servent.other_peers)
+
+class MalformedTest(ServentTestCase):
+
+    def setUp(self):
+        ServentTestCase.setUp(self)
+
+        # Every handler reachable: responses are cached and membership messages handled
+        self.servent = self.make_servent(response_cache=cacheutils.TTLCache(),
+                                         membership=memberutils.Membership(self.srv_sock.getsockname()))
+
+    def test_empty(self):
+        self.servent.handle("", self.client.getsockname())
+        self.servent.handle("\x00", self.client.getsockname())
+        self.assertEqual(self.servent.counters["malformed"], 2)
+
+    def test_truncated_headers(self):
+        truncated = 0
+        for name, message_type in sorted(utils.MESSAGE_TYPES.items()):
+            header = protocol.HEADERS[name]
+            for size in xrange(2, header.size):
+                self.servent.handle(struct.pack("!H", message_type) + "\x00" * (size - 2), self.client.getsockname())
+
+                # Answers meant for clients, and MEMBERS we didn't ask for, are dropped unread
+                if name not in ("IDRESPONSE", "GLOBRESPONSE", "MEMBERS"):
+                    truncated += 1
+        self.assertGreater(truncated, 0)
+        self.assertEqual(self.servent.counters["malformed"], truncated)
+
+        # Still serving
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.assertIn(self.response("service0", "10.0.0.1:80"), self.received(self.client))
+
+    def test_bare_headers(self):
+
+        # Headers with nothing after them are well formed, just empty
+        for name, message_type in sorted(utils.MESSAGE_TYPES.items()):
+            self.servent.handle(struct.pack("!H", message_type) + "\x00" * (protocol.HEADERS[name].size - 2),
+                                self.peers[0].getsockname())
+        self.assertEqual(self.servent.counters["malformed"], 0)
+
+    def test_sync_bucket_out_of_range(self):
+        summaries = [("key", (1, 1))]
+        for bucket in (utils.SYNC_BUCKETS, 0xFFFF):
+            self.servent.handle(protocol.build_sync_bucket(bucket, summaries, True)[0], self.peers[0].getsockname())
+        self.assertEqual(self.servent.counters["malformed"], 2)
+        self.assertEqual(self.received(self.peers[0]), [])
+
+    def test_fields_out_of_range(self):
+
+        # Every header field at its maximum, followed by bytes that look like records, must not stop us
+        for name, message_type in sorted(utils.MESSAGE_TYPES.items()):
+            for payload in ("", "\xff" * 40, "key\t\xff\x00\x00\xff" * 4):
+                recv_data = struct.pack("!H", message_type) + "\xff" * (protocol.HEADERS[name].size - 2) + payload
+                self.servent.handle(recv_data, self.peers[0].getsockname())
+        self.servent.handle(self.clireq("service0"), self.client.getsockname())
+        self.assertIn(self.response("service0", "10.0.0.1:80"), self.received(self.client))
+
+class GlobTest(ServentTestCase):
+
+    def setUp(self):
+        ServentTestCase.setUp(self)
+        for i in xrange(1, 5):
+            self.servent.service_list.write("service%d" % i, "10.0.0.%d:80" % i)
+
+    def pages(self, sock):
+        return [protocol.parse_glob_response(recv_data) for recv_data in self.received(sock)]
+
+    def test_globreq_answered_and_flooded(self):
+        self.servent.handle(protocol.build_globreq(9, 3, "service*"), self.client.getsockname())
+        self.assertEqual(self.pages(self.client), [(9, True, [("service0", "10.0.0.1:80"), ("service1", "10.0.0.1:80"),
+                                                              ("service2", "10.0.0.2:80")])])
+        for peer in self.peers:
+            self.assertEqual([protocol.parse_globquery(recv_data) for recv_data in self.received(peer)],
+                             [(utils.TTL, "127.0.0.1", self.client.getsockname()[1], 9, 3, "service*", "")])
+
+    def test_next_page(self):
+        self.servent.handle(protocol.build_globreq(9, 3, "service*", "service2"), self.client.getsockname())
+        self.assertEqual(self.pages(self.client), [(9, False, [("service3", "10.0.0.3:80"),
+                                                               ("service4", "10.0.0.4:80")])])
+
+    def test_globquery_answers_its_origin(self):
+        send_message = protocol.build_globquery(0, self.client.getsockname(), 9, 10, "service[34]")
+        self.servent.handle(send_message, self.peers[0].getsockname())
+        self.assertEqual(self.pages(self.client), [(9, False, [("service3", "10.0.0.3:80"),
+                                                               ("service4", "10.0.0.4:80")])])
+
+        # TTL exhausted, and the same page asked twice is answered once
+        self.servent.handle(send_message, self.peers[1].getsockname())
+        self.assertEqual(self.received(self.client) + self.received(self.peers[0]) + self.received(self.peers[1]),
+                         [])
+
+    def test_no_match_no_answer(self):
+        self.servent.handle(protocol.build_globreq(9, 3, "nothing*"), self.client.getsockname())
+        self.assertEqual(self.received(self.client), [])
+
+if __name__ == "__main__":
+    unittest.main()
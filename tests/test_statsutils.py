@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+
+from utils import statsutils
+
+"""
+| ===================================================================
+| Histogram: bucketing, percentiles and merges
+| ===================================================================
+"""
+
+class HistogramTest(unittest.TestCase):
+
+    def test_empty(self):
+        histogram = statsutils.Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual(histogram.snapshot(), dict(count=0))
+
+    def test_small_values_exact(self):
+        histogram = statsutils.Histogram()
+        for value in xrange(100):
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(50), 49)
+        self.assertEqual(histogram.percentile(100), 99)
+        self.assertEqual((histogram.min, histogram.max), (0, 99))
+
+    def test_bucket_bounds(self):
+        histogram = statsutils.Histogram()
+
+        # Every value is within 2 ** (1 - sub_bucket_bits) of the highest value of its bucket
+        for value in [0, 1, 127, 128, 129, 255, 256, 1000, 12345, 10 ** 6, 10 ** 9]:
+            top = histogram.value_at(histogram.index(value))
+            self.assertLessEqual(value, top)
+            self.assertLessEqual(top - value, value * 2.0 ** (1 - histogram.sub_bucket_bits))
+
+        # Buckets are contiguous, no value falls between two of them
+        for index in xrange(1, histogram.index(1 << 20)):
+            self.assertEqual(histogram.index(histogram.value_at(index - 1) + 1), index)
+
+    def test_clamped(self):
+        histogram = statsutils.Histogram(max_bits=10)
+        histogram.record(-5)
+        histogram.record(1 << 20)
+        self.assertEqual((histogram.min, histogram.max), (0, 1023))
+
+    def test_percentiles(self):
+        histogram = statsutils.Histogram()
+        for value in xrange(1, 10001):
+            histogram.record(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 10000)
+        self.assertAlmostEqual(snapshot["mean"], 5000.5)
+        for name, expected in (("p50", 5000), ("p90", 9000), ("p99", 9900), ("p999", 9990)):
+            self.assertGreaterEqual(snapshot[name], expected)
+            self.assertLessEqual(snapshot[name], expected * 1.02)
+
+    def test_merge(self):
+        merged = statsutils.Histogram()
+        parts = [statsutils.Histogram() for _ in xrange(3)]
+        for value in xrange(3000):
+            parts[value % 3].record(value)
+        for part in parts + [statsutils.Histogram()]:
+            merged.merge(part)
+        whole = statsutils.Histogram()
+        for value in xrange(3000):
+            whole.record(value)
+        self.assertEqual(merged.snapshot(), whole.snapshot())
+        self.assertEqual(merged.counts, whole.counts)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils import serventutils, storeutils
+
+"""
+| ===================================================================
+| Compiled stores: what compile_store writes, MappedServiceStore reads
+| ===================================================================
+"""
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def compiled(self, services):
+        path = os.path.join(self.directory, "services.store")
+        storeutils.compile_store(services, path)
+        store = storeutils.MappedServiceStore(path)
+        self.stores.append(store)
+        return store
+
+    def test_lookup(self):
+        services = dict(("service%d" % i, "10.0.0.1:%d tcp" % i) for i in xrange(1000))
+        store = self.compiled(services)
+        self.assertEqual(len(store), len(services))
+        for key, value in services.iteritems():
+            self.assertEqual(store.get(key), value)
+            self.assertEqual(store[key], value)
+            self.assertIn(key, store)
+        self.assertIsNone(store.get("service1000"))
+        self.assertEqual(store.get("missing", "default"), "default")
+        self.assertRaises(KeyError, lambda: store["missing"])
+
+    def test_iteration(self):
+        services = {"a": "1", "b": "", "c" * 300: "3" * 5000}
+        store = self.compiled(services)
+        self.assertEqual(dict(store.iteritems()), services)
+        self.assertEqual(sorted(store), sorted(services))
+        self.assertEqual(sorted(store.keys()), sorted(services))
+
+    def test_empty(self):
+        store = self.compiled(dict())
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.get("anything"))
+        self.assertEqual(store.items(), [])
+
+    def test_rejects_text_files(self):
+        path = os.path.join(self.directory, "services.txt")
+        with open(path, "w") as services_file:
+            services_file.write("service0 80 tcp\n")
+        self.assertFalse(storeutils.is_compiled(path))
+        self.assertRaises(ValueError, storeutils.MappedServiceStore, path)
+
+    def test_load_service_list(self):
+        path = os.path.join(self.directory, "services.txt")
+        with open(path, "w") as services_file:
+            services_file.write("service0\t80  tcp\n\n   \nservice1 81 udp # comment\n")
+        services = serventutils.load_service_list(path)
+        self.assertEqual(services, {"service0": "80 tcp", "service1": "81 udp # comment"})
+
+        # A compiled copy answers the same
+        store = self.compiled(services)
+        self.assertTrue(storeutils.is_compiled(store.path))
+        loaded = serventutils.load_service_list(store.path)
+        self.stores.append(loaded)
+        self.assertIsInstance(loaded, storeutils.MappedServiceStore)
+        self.assertEqual(dict(loaded.iteritems()), services)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import select
+import socket
+import time
+import unittest
+
+from utils import protocol, streamutils, utils
+
+"""
+| ===================================================================
+| ValueServer / ValueFetcher: large values over TCP
+| ===================================================================
+"""
+
+class StreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.values = {"small": "v", "large": "x" * (3 << 20), "empty": ""}
+        self.stream_sock = streamutils.bind_stream_socket("127.0.0.1", 0)
+        self.stream_addr = self.stream_sock.getsockname()
+        self.server = streamutils.ValueServer(self.stream_sock, self.values.get)
+        self.server.start()
+        self.fetcher = streamutils.ValueFetcher(1.0)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.close()
+
+class ValueServerTest(StreamTestCase):
+
+    def test_fetch(self):
+        for key, value in self.values.iteritems():
+            self.assertEqual(self.fetcher.fetch(self.stream_addr, key), value)
+
+        # Every fetch went over the one connection
+        self.assertEqual(len(self.fetcher.conns), 1)
+
+    def test_not_found(self):
+        self.assertIsNone(self.fetcher.fetch(self.stream_addr, "missing"))
+        self.assertEqual(self.fetcher.fetch(self.stream_addr, "small"), "v")
+
+    def test_value_read_at_fetch_time(self):
+        self.values["small"] = "changed"
+        self.assertEqual(streamutils.fetch_value(self.stream_addr, "small"), "changed")
+
+    def test_reconnects_once(self):
+        self.assertEqual(self.fetcher.fetch(self.stream_addr, "small"), "v")
+        self.fetcher.conns[self.stream_addr].shutdown(socket.SHUT_RDWR)
+        self.assertEqual(self.fetcher.fetch(self.stream_addr, "small"), "v")
+
+    def test_unreachable(self):
+        self.server.close()
+        self.assertIsNone(self.fetcher.fetch(self.stream_addr, "small"))
+        self.assertEqual(self.fetcher.conns, dict())
+
+    def test_close_joins_thread(self):
+        self.server.close()
+        self.assertFalse(self.server.thread.is_alive())
+
+    def test_connections_capped(self):
+        self.server.close()
+        self.stream_sock = streamutils.bind_stream_socket("127.0.0.1", 0)
+        self.stream_addr = self.stream_sock.getsockname()
+        self.server = streamutils.ValueServer(self.stream_sock, self.values.get, max_connections=1)
+        self.server.start()
+        self.assertEqual(self.fetcher.fetch(self.stream_addr, "small"), "v")
+
+        # The first connection holds the only slot, the other one is closed and tried once more
+        other = streamutils.ValueFetcher(1.0)
+        self.assertIsNone(other.fetch(self.stream_addr, "small"))
+        self.assertEqual(self.server.refused, 2)
+
+        # Its slot is freed once the first client hangs up
+        self.fetcher.close()
+        deadline = time.time() + 2.0
+        while other.fetch(self.stream_addr, "small") is None and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(other.fetch(self.stream_addr, "small"), "v")
+        other.close()
+
+    def test_long_key_cuts_connection(self):
+        conn = socket.create_connection(self.stream_addr, 1.0)
+        try:
+            conn.sendall("k" * utils.STREAM_MAX_KEY + "\n")
+            self.assertEqual(streamutils.recv_exactly(conn, protocol.VALUE_LENGTH.size),
+                             protocol.VALUE_LENGTH.pack(protocol.NOT_FOUND))
+            conn.sendall("k" * (utils.STREAM_MAX_KEY + 1))
+            self.assertEqual(conn.recv(protocol.VALUE_LENGTH.size), "")
+        finally:
+            conn.close()
+        self.assertEqual(self.server.refused, 1)
+
+class PipelinedFetcherTest(StreamTestCase):
+
+    def setUp(self):
+        StreamTestCase.setUp(self)
+        self.fetcher = streamutils.PipelinedFetcher(0.2)
+        self.values_got = dict()
+
+    def got(self, key, value):
+        self.values_got[key] = value
+
+    def run_fetcher(self):
+        while self.fetcher.pending():
+            wait = max(0.0, self.fetcher.next_deadline() - time.time())
+            readable, writable, _ = select.select(self.fetcher.readers(), self.fetcher.writers(), [], wait)
+            self.fetcher.handle(readable, writable)
+            self.fetcher.expire()
+
+    def test_fetch(self):
+        for key in self.values.keys() + ["missing"]:
+            self.fetcher.submit(self.stream_addr, key, self.got)
+        self.assertEqual(len(self.fetcher.conns), 1)
+        self.run_fetcher()
+        self.assertEqual(self.values_got, dict(self.values, missing=None))
+
+    def test_unreachable(self):
+        self.server.close()
+        self.fetcher.submit(self.stream_addr, "small", self.got)
+        self.run_fetcher()
+        self.assertEqual(self.values_got, {"small": None})
+        self.assertEqual(self.fetcher.conns, dict())
+
+    def test_stalled_given_up(self):
+
+        # Connections are accepted by the kernel, but nobody ever answers them
+        stalled_sock = streamutils.bind_stream_socket("127.0.0.1", 0)
+        try:
+            started = time.time()
+            self.fetcher.submit(stalled_sock.getsockname(), "large", self.got)
+            self.fetcher.submit(self.stream_addr, "small", self.got)
+            self.run_fetcher()
+        finally:
+            stalled_sock.close()
+
+        # The other fetch went through meanwhile, the stalled one was asked twice then given up
+        self.assertEqual(self.values_got, {"small": "v", "large": None})
+        self.assertGreaterEqual(time.time() - started, 0.4)
+
+class RecvExactlyTest(unittest.TestCase):
+
+    def test_recv_exactly(self):
+        left, right = socket.socketpair()
+        try:
+            left.sendall("abcdef")
+            self.assertEqual(streamutils.recv_exactly(right, 4), bytearray("abcd"))
+            left.close()
+            self.assertIsNone(streamutils.recv_exactly(right, 4))
+        finally:
+            left.close()
+            right.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import collections
+import mmap
+import multiprocessing
+import struct
+import time
+
+import utils
+
+"""
+| ===================================================================
+| TTLCache: bounded LRU cache whose entries expire after ttl seconds
+| ===================================================================
+"""
+
+class TTLCache(object):
+
+    def __init__(self, max_size=utils.QUERY_HISTORY_SIZE, ttl=utils.QUERY_HISTORY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()  # key => (expires_at, value), oldest first
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] > time.time()
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self.hits += 1
+
+                # Refresh recency, but keep the original expiration time
+                del self.entries[key]
+                self.entries[key] = entry
+                return entry[1]
+            del self.entries[key]
+            self.evictions += 1
+        self.misses += 1
+        return default
+
+    def peek(self, key, default=None):
+        """Like get, but leaves counters and recency alone"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return default
+
+    def put(self, key, value=None):
+        now = time.time()
+        if key in self.entries:
+            del self.entries[key]
+        self.entries[key] = (now + self.ttl, value)
+        self.expire(now)
+
+    def seen(self, key):
+        """Returns True if key is a live entry, otherwise records it and returns False"""
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.hits += 1
+                return True
+            del self.entries[key]
+            self.evictions += 1
+        self.misses += 1
+        self.entries[key] = (now + self.ttl, None)
+        self.expire(now)
+        return False
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+
+        # Oldest entries sit at the head, so we only look at it until it's both fresh and within bounds
+        entries = self.entries
+        while entries:
+            key = next(iter(entries))
+            if len(entries) <= self.max_size and entries[key][0] > now:
+                break
+            del entries[key]
+            self.evictions += 1
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+"""
+| ===================================================================
+| SharedTTLCache: duplicate suppression shared by forked workers
+| ===================================================================
+"""
+
+class SharedTTLCache(object):
+
+    # Each slot holds a 64-bit key fingerprint and its expiration time
+    SLOT = struct.Struct("=Qd")
+    WAYS = 8
+
+    def __init__(self, max_size=utils.QUERY_HISTORY_SIZE, ttl=utils.QUERY_HISTORY_TTL, locks=64):
+        self.ttl = ttl
+        self.buckets = max(1, max_size / self.WAYS)
+        self.max_size = self.buckets * self.WAYS
+
+        # Anonymous shared mapping, so it must be created before the workers fork
+        self.shm = mmap.mmap(-1, self.max_size * self.SLOT.size)
+        self.locks = [multiprocessing.Lock() for _ in xrange(locks)]
+
+        # Counters, kept per process
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        now = time.time()
+        live = 0
+        for offset in xrange(0, self.max_size * self.SLOT.size, self.SLOT.size):
+            fingerprint, expires = self.SLOT.unpack_from(self.shm, offset)
+            if fingerprint and expires > now:
+                live += 1
+        return live
+
+    def __contains__(self, key):
+        fingerprint = (hash(key) & 0xFFFFFFFFFFFFFFFF) or 1
+        base = (fingerprint % self.buckets) * self.WAYS * self.SLOT.size
+        now = time.time()
+        for offset in xrange(base, base + self.WAYS * self.SLOT.size, self.SLOT.size):
+            slot_fingerprint, expires = self.SLOT.unpack_from(self.shm, offset)
+            if slot_fingerprint == fingerprint and expires > now:
+                return True
+        return False
+
+    def seen(self, key):
+        """Returns True if key is a live entry, otherwise records it and returns False"""
+        fingerprint = (hash(key) & 0xFFFFFFFFFFFFFFFF) or 1
+        bucket = fingerprint % self.buckets
+        base = bucket * self.WAYS * self.SLOT.size
+        with self.locks[bucket % len(self.locks)]:
+            now = time.time()
+            victim, victim_expires = base, None
+            for offset in xrange(base, base + self.WAYS * self.SLOT.size, self.SLOT.size):
+                slot_fingerprint, expires = self.SLOT.unpack_from(self.shm, offset)
+                if slot_fingerprint == fingerprint and expires > now:
+                    self.hits += 1
+                    return True
+
+                # Empty and expired slots come first, otherwise the one closest to expiring is replaced
+                if victim_expires is None or expires < victim_expires:
+                    victim, victim_expires = offset, expires
+            if victim_expires > now:
+                self.evictions += 1
+            self.SLOT.pack_into(self.shm, victim, fingerprint, now + self.ttl)
+        self.misses += 1
+        return False
+
+    def stats(self):
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -24,9 +24,17 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import collections
+import heapq
 import logging
+import random
+import select
 import struct
 import socket
+import time
+
+import protocol
+import streamutils
 import utils
 
 """
@@ -49,6 +57,13 @@ def get_responses(sock):
                 if recv_message_type == utils.MESSAGE_TYPES["RESPONSE"]:
                     logger.info("%s:%d answers '%s'" % (ip_addr[0], ip_addr[1], recv_data[recv_header_size:]))
                     responses += 1
+                elif recv_message_type == utils.MESSAGE_TYPES["LARGERESPONSE"]:
+                    _, size, stream_addr, key = protocol.parse_large_response(recv_data)
+                    value = streamutils.fetch_value(stream_addr, key)
+                    if value is not None:
+                        logger.info("%s:%d answers '%s\t%s' (%d bytes over TCP)" % (ip_addr[0], ip_addr[1], key,
+                                                                                   value, size))
+                        responses += 1
         except socket.timeout:
             if responses > 0:
                 logger.info("Received: %d responses", responses)
@@ -79,3 +94,436 @@ def p2p_ask_kv(sock, send_header, key, srv_host, srv_port):
                 logger.warning("Nothing was received after two attempts. Moving on...")
             else:
                 logger.warning("Timeout for first attempt exceeded. Retrying...")
+
+"""
+| ===================================================================
+| p2p_ask_many: looks up a stream of keys with batched MULTIREQs
+| ===================================================================
+"""
+def p2p_ask_many(sock, keys, srv_host, srv_port, on_answer, window=utils.MULTIREQ_WINDOW,
+                 timeout=utils.RECV_TIMEOUT):
+    """Calls on_answer(key, value, ip_addr) for every answer, returns the keys nobody answered"""
+    logger = logging.getLogger(__name__)
+
+    keys = iter(keys)
+    pending = collections.OrderedDict()  # key => deadline, in the order they were sent
+    unanswered = []
+    exhausted = False
+    while True:
+
+        # Keep up to window keys in flight, refilled by halves so they go out packed in full datagrams
+        if not exhausted and len(pending) <= window / 2:
+            batch = []
+            for key in keys:
+                if key not in pending:
+                    batch.append(key)
+                if len(pending) + len(batch) >= window:
+                    break
+            else:
+                exhausted = True
+            deadline = time.time() + timeout
+            for key in batch:
+                pending[key] = deadline
+            for send_message in protocol.build_multireq(batch):
+                sock.sendto(send_message, (srv_host, int(srv_port)))
+        if not pending:
+            break
+
+        readable, _, _ = select.select([sock], [], [], max(0.0, next(pending.itervalues()) - time.time()))
+        if readable:
+            recv_data, ip_addr = sock.recvfrom(utils.MAX_BUFFER_SIZE)
+            recv_message_type = protocol.message_type(recv_data)
+            if recv_message_type == utils.MESSAGE_TYPES["LARGERESPONSE"]:
+                _, _, stream_addr, key = protocol.parse_large_response(recv_data)
+                value = streamutils.fetch_value(stream_addr, key)
+                if value is not None:
+                    pending.pop(key, None)
+                    on_answer(key, value, ip_addr)
+                continue
+            if recv_message_type != utils.MESSAGE_TYPES["RESPONSE"]:
+                continue
+            for key, value in protocol.parse_responses(recv_data):
+                pending.pop(key, None)
+                on_answer(key, value, ip_addr)
+        else:
+            now = time.time()
+            while pending and next(pending.itervalues()) <= now:
+                key, _ = pending.popitem(last=False)
+                logger.warning("Nothing was received for '%s'", key)
+                unanswered.append(key)
+    return unanswered
+
+"""
+| ===================================================================
+| Lookup: one key being looked up by a PipelinedClient
+| ===================================================================
+"""
+class Lookup(object):
+
+    def __init__(self, key, expected=1, callback=None, write=None, glob=None):
+        self.key = key  # None for globs, whose answers are only matched by request id
+        self.write = write  # None for lookups, ("PUT", value) or ("DELETE", None) for writes
+        self.glob = glob  # (pattern, limit, after) for globs, answered by every node holding matches
+        self.cursor = None  # for globs, the key the next page starts after if some node had more
+        self.expected = expected  # answers that complete the lookup, later ones are ignored
+        self.callback = callback  # called with the lookup once it is done
+        self.answers = []  # (value, ip_addr) in arrival order
+        self.request_ids = []  # one per attempt, answers to any of them count
+        self.sent_at = None  # when the last attempt went out
+        self.fetching = 0  # large values announced and still being fetched
+        self.started = time.time()
+        self.finished = None
+        self.done = False
+
+    @property
+    def values(self):
+        return [value for value, _ in self.answers]
+
+    @property
+    def matches(self):
+        """Distinct (key, value) glob matches up to the cursor, sorted, so pages never overlap nor skip keys"""
+        return sorted(set((key, value) for (key, value), _ in self.answers
+                          if self.cursor is None or key <= self.cursor))
+
+    @property
+    def latency(self):
+        return self.finished - self.started if self.done else None
+
+"""
+| ===================================================================
+| PipelinedClient: many tagged lookups in flight over one socket
+| ===================================================================
+"""
+class PipelinedClient(object):
+
+    def __init__(self, srv_host, srv_port, window=utils.MULTIREQ_WINDOW, retries=utils.CLIENT_RETRIES):
+        self.srv_addr = (srv_host, int(srv_port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.setblocking(False)
+        self.window = window  # max lookups sent and not done yet
+        self.retries = retries
+
+        # Every batch we send gets a fresh request id, answers are matched by (request id, key)
+        self.request_id = random.randint(0, utils.MAX_SEQ)
+        self.inflight = dict()  # (request id, key) => Lookup
+        self.outstanding = 0
+        self.backlog = collections.deque()  # lookups waiting for room in the window
+        self.outbox = []  # lookups (re)sent on the next flush
+        self.timers = []  # heap of (deadline, request id, key)
+        self.completed = []
+
+        # RTT estimation as in RFC 6298, ids tell attempts apart so retransmissions can be sampled too
+        self.srtt = None
+        self.rttvar = None
+        self.rto = utils.CLIENT_INITIAL_RTO
+        self.counters = collections.Counter()
+
+        # Values announced by a LARGERESPONSE are fetched over TCP, reusing one connection per servent.
+        # Fetches run alongside the lookups, their sockets are polled with ours
+        self.fetcher = streamutils.PipelinedFetcher()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+        self.fetcher.close()
+
+    def submit(self, key, expected=1, callback=None):
+        """Queues a lookup for key, done on its expected-th answer or once its retries run out"""
+        lookup = Lookup(key, expected, callback)
+        self.backlog.append(lookup)
+        return lookup
+
+    def submit_write(self, key, value=None, callback=None):
+        """Queues a PUT of value, or a DELETE if value is None, done once the servent acknowledges it"""
+        lookup = Lookup(key, 1, callback, ("PUT", value) if value is not None else ("DELETE", None))
+        self.backlog.append(lookup)
+        return lookup
+
+    def submit_glob(self, pattern, limit=utils.GLOB_LIMIT, after="", callback=None):
+        """Queues a search for keys matching pattern, done once nodes had time to answer"""
+        lookup = Lookup(None, 1, callback, None, (pattern, limit, after))
+        self.backlog.append(lookup)
+        return lookup
+
+    def pending(self):
+        return self.outstanding + len(self.backlog)
+
+    def flush(self):
+        """Sends retransmissions and whatever fits in the window"""
+
+        # The window is refilled by halves, so new lookups go out packed in full datagrams
+        while self.backlog and self.outstanding < self.window and (self.outbox or
+                                                                   self.outstanding <= self.window / 2):
+            self.outbox.append(self.backlog.popleft())
+            self.outstanding += 1
+        while self.outbox:
+            self.send_batch()
+
+    def send_batch(self):
+        """Sends lookups from the outbox under one request id, writes under one each"""
+        now = time.time()
+
+        # The same key twice in a batch would share a (request id, key), the second waits for the next one.
+        # Lookups wanting several answers are kept apart, servents must flood their keys even on a hit
+        batch = []
+        keys = set()
+        deferred = []
+        reads = [lookup for lookup in self.outbox if lookup.write is None and lookup.glob is None]
+        wanted = min(max([lookup.expected for lookup in reads] or [1]), 0xFFFF)
+        for lookup in self.outbox:
+            if lookup.write is not None:
+                self.send_write(lookup, now)
+            elif lookup.glob is not None:
+                self.send_glob(lookup, now)
+            elif lookup.key in keys or (lookup.expected > 1) != (wanted > 1):
+                deferred.append(lookup)
+            else:
+                keys.add(lookup.key)
+                batch.append(lookup)
+        self.outbox = deferred
+        if not batch:
+            return
+
+        self.register(batch, now)
+        self.send(protocol.build_idreq(self.request_id, [lookup.key for lookup in batch], wanted))
+
+    def send_write(self, lookup, now):
+        self.register([lookup], now)
+        message_type_name, value = lookup.write
+        if message_type_name == "PUT":
+            self.send([protocol.build_put(self.request_id, lookup.key, value)])
+        else:
+            self.send([protocol.build_delete(self.request_id, lookup.key)])
+
+    def send_glob(self, lookup, now):
+        self.register([lookup], now)
+        pattern, limit, after = lookup.glob
+        self.send([protocol.build_globreq(self.request_id, limit, pattern, after)])
+
+    def register(self, lookups, now):
+        """Tags lookups with a fresh request id and arms their retransmission timers"""
+        self.request_id = (self.request_id + 1) % utils.MAX_SEQ
+        for lookup in lookups:
+            lookup.request_ids.append(self.request_id)
+            lookup.sent_at = now
+            self.inflight[(self.request_id, lookup.key)] = lookup
+            rto = self.rto
+
+            # Answers to a glob come from all over the overlay, we linger for the far ones
+            if lookup.glob is not None:
+                rto = max(rto, utils.GLOB_WAIT)
+            rto = min(utils.CLIENT_MAX_RTO, rto * 2 ** (len(lookup.request_ids) - 1))
+            heapq.heappush(self.timers, (now + rto, self.request_id, lookup.key))
+
+    def send(self, datagrams):
+        for send_message in datagrams:
+            try:
+                self.sock.sendto(send_message, self.srv_addr)
+                self.counters["requests_sent"] += 1
+            except socket.error:
+                self.counters["send_errors"] += 1  # retransmitted on timeout like any loss
+
+    def finish(self, lookup):
+        lookup.done = True
+        lookup.finished = time.time()
+        for request_id in lookup.request_ids:
+            self.inflight.pop((request_id, lookup.key), None)
+        self.outstanding -= 1
+        self.completed.append(lookup)
+        if lookup.callback:
+            lookup.callback(lookup)
+
+    def sample_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = max(utils.CLIENT_MIN_RTO, min(utils.CLIENT_MAX_RTO, self.srtt + 4 * self.rttvar))
+
+    def readers(self):
+        return [self.sock] + self.fetcher.readers()
+
+    def writers(self):
+        return self.fetcher.writers()
+
+    def next_deadline(self):
+        """When expire() has work next, a retransmission or a stalled fetch, None if nothing is pending"""
+        wakeups = [self.timers[0][0]] if self.timers else []
+        if self.fetcher.next_deadline() is not None:
+            wakeups.append(self.fetcher.next_deadline())
+        return min(wakeups) if wakeups else None
+
+    def take_completed(self):
+        completed, self.completed = self.completed, []
+        return completed
+
+    def receive(self):
+        """Handles every datagram already queued on the socket, returns the lookups done meanwhile"""
+        while True:
+            try:
+                recv_data, ip_addr = self.sock.recvfrom(utils.MAX_BUFFER_SIZE)
+            except socket.error:
+                return self.take_completed()
+            recv_message_type = protocol.message_type(recv_data)
+            if recv_message_type == utils.MESSAGE_TYPES["GLOBRESPONSE"]:
+                self.receive_glob(recv_data, ip_addr)
+                continue
+            if recv_message_type == utils.MESSAGE_TYPES["LARGERESPONSE"]:
+                self.receive_large(recv_data, ip_addr)
+                continue
+            if recv_message_type != utils.MESSAGE_TYPES["IDRESPONSE"]:
+                continue
+            request_id = protocol.parse_request_id(recv_data)
+            now = time.time()
+            for key, value in protocol.parse_responses(recv_data, "IDRESPONSE"):
+                self.answer(request_id, key, value, ip_addr, now)
+
+    def answer(self, request_id, key, value, ip_addr, now):
+        lookup = self.inflight.get((request_id, key))
+        if lookup is None:
+            self.counters["late_answers"] += 1
+            return
+        if not lookup.answers and request_id == lookup.request_ids[-1]:
+            self.sample_rtt(now - lookup.sent_at)
+        lookup.answers.append((value, ip_addr))
+        self.counters["answers"] += 1
+        if len(lookup.answers) >= lookup.expected:
+            self.finish(lookup)
+
+    def receive_large(self, recv_data, ip_addr):
+        """Queues the fetch of a value announced by a LARGERESPONSE, taken as any other answer once in"""
+        request_id, _, stream_addr, key = protocol.parse_large_response(recv_data)
+        lookup = self.inflight.get((request_id, key)) or self.inflight.get((request_id, None))
+        if lookup is None:
+            self.counters["late_answers"] += 1
+            return
+
+        # The RTT is the notice's, a fetch takes as long as the value is big
+        now = time.time()
+        lookup.fetching += 1
+        self.fetcher.submit(stream_addr, key,
+                            lambda key, value: self.fetched(lookup, request_id, key, value, ip_addr, now))
+
+    def fetched(self, lookup, request_id, key, value, ip_addr, now):
+        lookup.fetching -= 1
+        if value is None:
+            self.counters["fetch_errors"] += 1
+            return
+        self.counters["large_fetched"] += 1
+        self.counters["large_bytes"] += len(value)
+        if lookup.glob is None:
+            self.answer(request_id, key, value, ip_addr, now)
+        elif lookup.done:
+            self.counters["late_answers"] += 1
+        else:
+            lookup.answers.append(((key, value), ip_addr))
+            self.counters["answers"] += 1
+
+    def transfer(self, readable, writable):
+        """Moves the fetches whose sockets select() found ready, and gives up the stalled ones"""
+        self.fetcher.handle(readable, writable)
+        self.fetcher.expire()
+        return self.take_completed()
+
+    def receive_glob(self, recv_data, ip_addr):
+        request_id, more, items = protocol.parse_glob_response(recv_data)
+        lookup = self.inflight.get((request_id, None))
+        if lookup is None:
+            self.counters["late_answers"] += len(items)
+            return
+        lookup.answers.extend((item, ip_addr) for item in items)
+        self.counters["answers"] += len(items)
+
+        # The flag comes after every key of a node's page, large ones included, and the next page starts
+        # after the lowest last key of those
+        if more:
+            last = max([key for (key, _), answered_by in lookup.answers if answered_by == ip_addr] or [None])
+            if last is not None and (lookup.cursor is None or last < lookup.cursor):
+                lookup.cursor = last
+
+    def expire(self):
+        """Retries lookups nobody answered in time, ends those out of retries or partially answered, returns them"""
+        now = time.time()
+        while self.timers and self.timers[0][0] <= now:
+            _, request_id, key = heapq.heappop(self.timers)
+            lookup = self.inflight.get((request_id, key))
+            if lookup is None or lookup.request_ids[-1] != request_id:
+                continue
+
+            # A value still being fetched is an answer on its way, the fetcher gives up on it soon enough
+            if lookup.fetching:
+                heapq.heappush(self.timers, (now + self.rto, request_id, key))
+                continue
+            if lookup.answers or len(lookup.request_ids) > self.retries:
+                if not lookup.answers:
+                    self.counters["timeouts"] += 1
+                self.finish(lookup)
+            else:
+                self.counters["retries"] += 1
+                self.outbox.append(lookup)
+        return self.take_completed()
+
+    def handle(self, readable, writable):
+        """Handles what select() found ready among readers() and writers(), returns the lookups done meanwhile"""
+        completed = self.receive() if self.sock in readable else []
+        completed.extend(self.transfer(readable, writable))
+        completed.extend(self.expire())
+        return completed
+
+    def poll(self, timeout=None):
+        """Sends, receives and retries for up to timeout seconds, returns the lookups done meanwhile"""
+        self.flush()
+        completed = []
+        if self.outstanding:
+            deadline = self.next_deadline()
+            wait = max(0.0, deadline - time.time()) if deadline is not None else 0.0
+            if timeout is not None:
+                wait = min(wait, timeout)
+            readable, writable, _ = select.select(self.readers(), self.writers(), [], wait)
+            completed = self.handle(readable, writable)
+            self.flush()
+        return completed + self.take_completed()
+
+    def lookup(self, key, expected=1):
+        """Blocking lookup of a single key, returns its Lookup once done"""
+        lookup = self.submit(key, expected)
+        while not lookup.done:
+            self.poll()
+        return lookup
+
+    def write(self, key, value=None):
+        """Blocking PUT (DELETE if value is None), returns its Lookup, answered once acknowledged"""
+        lookup = self.submit_write(key, value)
+        while not lookup.done:
+            self.poll()
+        return lookup
+
+    def glob(self, pattern, limit=utils.GLOB_LIMIT, after=""):
+        """Blocking search for keys matching pattern, returns its Lookup once nodes had time to answer"""
+        lookup = self.submit_glob(pattern, limit, after)
+        while not lookup.done:
+            self.poll()
+        return lookup
+
+    def lookup_many(self, keys, expected=1):
+        """Looks up an iterable of keys, yielding each Lookup as soon as it is done"""
+        keys = iter(keys)
+        exhausted = False
+        while True:
+
+            # Keys are pulled lazily, so they can be streamed from a file or a generator
+            while not exhausted and len(self.backlog) < self.window:
+                try:
+                    self.submit(next(keys), expected)
+                except StopIteration:
+                    exhausted = True
+            if exhausted and not self.pending():
+                break
+            for lookup in self.poll():
+                yield lookup
+
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import bisect
+import hashlib
+import struct
+
+import peerutils
+
+# Identifiers live on a 2^64 ring
+RING_BITS = 64
+RING_SIZE = 1 << RING_BITS
+
+"""
+| ===================================================================
+| ring_id: position of a key or of a HOST:PORT on the ring
+| ===================================================================
+"""
+
+def ring_id(value):
+    return struct.unpack("!Q", hashlib.sha1(value).digest()[:8])[0]
+
+def node_id(addr):
+    return ring_id("%s:%d" % addr)
+
+"""
+| ===================================================================
+| in_interval: tells whether x lies in (start, end] going clockwise
+| ===================================================================
+"""
+
+def in_interval(x, start, end):
+    if start < end:
+        return start < x <= end
+    return x > start or x <= end
+
+"""
+| ===================================================================
+| Ring: Chord style view of the overlay from one servent
+| ===================================================================
+"""
+
+class Ring(object):
+
+    def __init__(self, self_addr, members):
+        self.self_addr = peerutils.parse_peer(self_addr)
+        self.self_id = node_id(self.self_addr)
+        self.nodes = dict()  # ring id => (ip, port)
+        for member in members:
+            member = peerutils.parse_peer(member)
+            self.nodes[node_id(member)] = member
+        self.nodes[self.self_id] = self.self_addr
+        self.ids = sorted(self.nodes)
+
+        # finger[i] is the first node at or after self + 2^i, duplicates collapse to O(log N) distinct peers
+        self.fingers = []
+        for i in xrange(RING_BITS):
+            finger = self.successor((self.self_id + (1 << i)) % RING_SIZE)
+            if finger != self.self_id and finger not in self.fingers:
+                self.fingers.append(finger)
+        self.predecessor = self.ids[self.ids.index(self.self_id) - 1]
+
+    def successor(self, ident):
+        index = bisect.bisect_left(self.ids, ident)
+        return self.ids[index % len(self.ids)]
+
+    def responsible(self, key):
+        """Address of the servent that stores key"""
+        return self.nodes[self.successor(ring_id(key))]
+
+    def replicas(self, key, count):
+        """The servent responsible for key and the ones following it, count of them at most"""
+        index = bisect.bisect_left(self.ids, ring_id(key))
+        return [self.nodes[self.ids[(index + i) % len(self.ids)]] for i in xrange(min(count, len(self.ids)))]
+
+    def is_responsible(self, key):
+        return len(self.ids) == 1 or in_interval(ring_id(key), self.predecessor, self.self_id)
+
+    def next_hop(self, key):
+        """Finger a lookup for key goes to next, None when we are the one storing it"""
+        if self.is_responsible(key):
+            return None
+        key_id = ring_id(key)
+        if in_interval(key_id, self.self_id, self.fingers[0]):
+            return self.nodes[self.fingers[0]]
+
+        # Closest finger preceding the key, so each hop at least halves the remaining distance
+        for finger in reversed(self.fingers):
+            if in_interval(finger, self.self_id, key_id) and finger != key_id:
+                return self.nodes[finger]
+        return self.nodes[self.fingers[0]]
+
+"""
+| ===================================================================
+| partition: splits a services dict by the servent storing each key
+| ===================================================================
+"""
+
+def partition(services, members):
+    ring = Ring(members[0], members[1:])
+    catalogs = dict((addr, dict()) for addr in ring.nodes.values())
+    for key, value in services.iteritems():
+        catalogs[ring.responsible(key)][key] = value
+    return catalogs
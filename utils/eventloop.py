@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import errno
+import heapq
+import itertools
+import logging
+import select
+import signal
+import socket
+import time
+
+import protocol
+import utils
+
+"""
+| ===================================================================
+| EventLoop: non-blocking reactor built on epoll (or poll)
+| ===================================================================
+"""
+
+class EventLoop(object):
+
+    def __init__(self):
+        if hasattr(select, "epoll"):
+            self.poller = select.epoll()
+            self.poll_scale = 1.0  # epoll takes seconds
+        else:
+            self.poller = select.poll()
+            self.poll_scale = 1000.0  # poll takes milliseconds
+        self.readers = dict()  # fd => callback
+        self.timers = []  # heap of (when, tiebreak, callback)
+        self.tiebreak = itertools.count()
+        self.running = False
+        self.signal_handlers = dict()  # signum => callback, run from the loop
+        self.signals = set()  # signals received and not handled yet
+
+        # Signals may land on another thread (the reloader's), the wakeup socket makes poll() return anyway
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.add_reader(self.wakeup_reader, self.drain_wakeup)
+
+    def drain_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def add_reader(self, sock, callback):
+        self.readers[sock.fileno()] = callback
+        self.poller.register(sock.fileno(), select.POLLIN)
+
+    def remove_reader(self, sock):
+        if self.readers.pop(sock.fileno(), None) is not None:
+            self.poller.unregister(sock.fileno())
+
+    def add_datagram_handler(self, sock, handler, max_batch=utils.EVENT_LOOP_BATCH):
+        """Calls handler(recv_data, ip_addr) for every datagram that arrives on sock"""
+        logger = logging.getLogger(__name__)
+        sock.setblocking(False)
+        packet_buffer = protocol.PacketBuffer()
+
+        def on_readable():
+
+            # Drain what is already queued, but yield after max_batch so timers keep running
+            for _ in xrange(max_batch):
+                try:
+                    recv_data, ip_addr = packet_buffer.recvfrom(sock)
+                except socket.error, e:
+                    if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED):
+                        logger.error(str(e))
+                    return
+                if recv_data:
+                    handler(recv_data, ip_addr)
+
+        self.add_reader(sock, on_readable)
+
+    def call_later(self, delay, callback):
+        heapq.heappush(self.timers, (time.time() + delay, next(self.tiebreak), callback))
+
+    def call_every(self, interval, callback):
+        def periodic():
+            try:
+                callback()
+            finally:
+                self.call_later(interval, periodic)
+        self.call_later(interval, periodic)
+
+    def add_signal_handler(self, signum, callback):
+        """Calls callback from the loop once signum arrives, never from the signal handler itself"""
+        self.signal_handlers[signum] = callback
+        signal.signal(signum, lambda signum, frame: self.signals.add(signum))
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        try:
+            signal.set_wakeup_fd(self.wakeup_writer.fileno())
+        except ValueError:
+            pass  # only the main thread can set it
+        self.running = True
+        while self.running:
+
+            # Sleep until a socket is readable or the next timer is due, never on a fixed poll interval
+            if self.timers:
+                timeout = max(0.0, self.timers[0][0] - time.time()) * self.poll_scale
+            else:
+                timeout = -1
+            try:
+                events = self.poller.poll(timeout)
+            except (IOError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, _ in events:
+                callback = self.readers.get(fd)
+                if callback:
+                    callback()
+            while self.signals:
+                self.signal_handlers[self.signals.pop()]()
+
+            now = time.time()
+            while self.timers and self.timers[0][0] <= now:
+                heapq.heappop(self.timers)[2]()
+
+    def close(self):
+        try:
+            signal.set_wakeup_fd(-1)
+        except ValueError:
+            pass
+        self.poller.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import bisect
+import fnmatch
+
+"""
+| ===================================================================
+| glob_prefix: literal part of a pattern, before any wildcard
+| ===================================================================
+"""
+
+GLOB_CHARS = "*?["
+
+def glob_prefix(pattern):
+    for i, char in enumerate(pattern):
+        if char in GLOB_CHARS:
+            return pattern[:i]
+    return pattern
+
+"""
+| ===================================================================
+| SortedIndex: sorted keys of a service table, for prefix and glob
+| ===================================================================
+"""
+
+class SortedIndex(object):
+
+    def __init__(self, keys):
+        self.keys = sorted(set(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def insert(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            self.keys.insert(index, key)
+
+    def match(self, pattern, after="", limit=None):
+        """Keys matching pattern in order, starting after the given key, and whether more are left"""
+        prefix = glob_prefix(pattern)
+
+        # Only the keys starting with the literal prefix can match, they are a contiguous slice
+        if after >= prefix:
+            start = bisect.bisect_right(self.keys, after)
+        else:
+            start = bisect.bisect_left(self.keys, prefix)
+        plain_prefix = pattern == prefix + "*"
+        matches = []
+        for index in xrange(start, len(self.keys)):
+            key = self.keys[index]
+            if not key.startswith(prefix):
+                break
+            if plain_prefix or fnmatch.fnmatchcase(key, pattern):
+                if limit is not None and len(matches) == limit:
+                    return matches, True
+                matches.append(key)
+        return matches, False
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import heapq
+import math
+import random
+import time
+
+import peerutils
+import utils
+
+# A member is ALIVE, SUSPECT once it missed a probe, then DEAD unless it refutes, or LEFT when it said goodbye
+ALIVE, SUSPECT, DEAD, LEFT = range(4)
+STATE_NAMES = ("alive", "suspect", "dead", "left")
+
+"""
+| ===================================================================
+| Membership: SWIM style view of the overlay from one servent
+| ===================================================================
+"""
+
+class Membership(object):
+
+    def __init__(self, self_addr, seeds=(), incarnation=None):
+        self.self_addr = peerutils.parse_peer(self_addr)
+        self.seeds = [seed for seed in (peerutils.parse_peer(seed) for seed in seeds) if seed != self.self_addr]
+
+        # Starting from the clock, a restarted servent always outranks what the overlay remembers of it
+        self.incarnation = int(time.time()) if incarnation is None else incarnation
+        self.members = dict()  # (ip, port) => [incarnation, state, since]
+
+        # Updates to piggyback on pings, each is sent a few times log(members) before being dropped
+        self.updates = dict()  # (ip, port) => transmissions left
+        self.enqueue(self.self_addr)
+
+        # Members are probed in a shuffled round robin, an unanswered probe makes its member suspect
+        self.probes = []
+        self.probing = None
+
+        # Servents that sent a JOIN only become members once they answer a ping carrying a random nonce,
+        # and MEMBERS are only taken from servents we sent a JOIN to, seeds alone may tell us our address
+        self.candidates = dict()  # (ip, port) => (incarnation, nonce, whether it asked for our view, since)
+        self.joins = dict()  # (ip, port) => (whether its answer may rebind us, since)
+
+    def __len__(self):
+        return len(self.members)
+
+    def entry(self, member):
+        if member == self.self_addr:
+            return self.incarnation, ALIVE
+        incarnation, state, _ = self.members[member]
+        return incarnation, state
+
+    def state(self, member):
+        entry = self.members.get(member)
+        return entry[1] if entry is not None else None
+
+    def is_alive(self, member):
+        return self.state(member) in (ALIVE, SUSPECT)
+
+    def alive(self):
+        return [member for member, entry in self.members.iteritems() if entry[1] in (ALIVE, SUSPECT)]
+
+    def counts(self):
+        counts = dict((name, 0) for name in STATE_NAMES)
+        for _, state, _ in self.members.itervalues():
+            counts[STATE_NAMES[state]] += 1
+        return counts
+
+    def enqueue(self, member):
+        self.updates[member] = utils.GOSSIP_RETRANSMIT_MULT * int(math.ceil(math.log(len(self.members) + 2, 2)))
+
+    def apply(self, member, incarnation, state, now):
+        """Merges one update, returns True if it changed our view"""
+
+        # Being suspected or declared dead is refuted by bumping our incarnation, which outranks it
+        if member == self.self_addr:
+            if state != ALIVE and incarnation >= self.incarnation:
+                self.incarnation = incarnation + 1
+                self.enqueue(member)
+            return False
+
+        # Newer incarnations win, within one incarnation the worst state does
+        entry = self.members.get(member)
+        if entry is not None and (incarnation, state) <= (entry[0], entry[1]):
+            return False
+        self.members[member] = [incarnation, state, now]
+        self.enqueue(member)
+        return True
+
+    def rebind(self, self_addr):
+        """Takes the address others see us from, as told by a seed"""
+        self_addr = peerutils.parse_peer(self_addr)
+        if self_addr != self.self_addr:
+            self.updates.pop(self.self_addr, None)
+            self.members.pop(self_addr, None)
+            self.self_addr = self_addr
+            self.enqueue(self_addr)
+
+    def candidate(self, member, incarnation, now, joining=True):
+        """Nonce to ping a servent we don't know with, None if too many are already waiting"""
+        if member == self.self_addr:
+            return None
+
+        # A retried JOIN keeps its nonce, the answer to our first ping may still be on its way
+        candidate = self.candidates.get(member)
+        if candidate is not None:
+            nonce = candidate[1]
+            joining = joining or candidate[2]
+        elif len(self.candidates) >= utils.GOSSIP_MAX_CANDIDATES:
+            return None
+        else:
+            nonce = random.randint(0, utils.MAX_SEQ)
+        self.candidates[member] = (max(incarnation, candidate[0]) if candidate else incarnation, nonce, joining, now)
+        return nonce
+
+    def verify(self, member, nonce, now):
+        """Admits a servent that answered our ping, returns None for any other pong, else whether it joined"""
+        candidate = self.candidates.get(member)
+        if candidate is None or candidate[1] != nonce:
+            return None
+        del self.candidates[member]
+        self.apply(member, candidate[0], ALIVE, now)
+        return candidate[2]
+
+    def joining(self, member, now, rebind=False):
+        self.joins[member] = (rebind, now)
+
+    def piggyback(self, to=None, count=utils.GOSSIP_MAX_UPDATES):
+        """Up to count (member, incarnation, state) records, the least sent first"""
+
+        # A member we suspect or think dead is told so first, it can refute long before the rumor reaches it
+        records = []
+        entry = self.members.get(to)
+        if entry is not None and entry[1] != ALIVE:
+            records.append((to, entry[0], entry[1]))
+            count -= 1
+        for member in heapq.nlargest(count, (member for member in self.updates if member != to),
+                                     key=self.updates.get):
+            records.append((member,) + self.entry(member))
+            self.updates[member] -= 1
+            if self.updates[member] <= 0:
+                del self.updates[member]
+        return records
+
+    def next_probe(self, now):
+        """Member to ping this protocol period, None when there is nobody to ping"""
+        if self.probing is not None:
+            member, self.probing = self.probing, None
+            entry = self.members.get(member)
+            if entry is not None and entry[1] == ALIVE:
+                self.apply(member, entry[0], SUSPECT, now)
+        if not self.probes:
+            self.probes = self.alive()
+            random.shuffle(self.probes)
+        while self.probes:
+            member = self.probes.pop()
+            if self.is_alive(member):
+                self.probing = member
+                return member
+        return None
+
+    def ack(self, member):
+        if self.probing == member:
+            self.probing = None
+
+    def expire(self, now, interval):
+        """Declares dead the members suspected for too long, and forgets old dead ones"""
+
+        # Suspicion lasts a few periods times log(members), long enough for the suspect to hear of it and refute
+        timeout = interval * utils.GOSSIP_SUSPECT_MULT * max(1.0, math.log10(len(self.members) + 1))
+
+        # Joins not answered within two periods are forgotten, retried ones start over
+        for pending in (self.candidates, self.joins):
+            for member, entry in pending.items():
+                if now - entry[-1] > 2 * interval:
+                    del pending[member]
+        for member, (incarnation, state, since) in self.members.items():
+            if state == SUSPECT and now - since > timeout:
+                self.apply(member, incarnation, DEAD, now)
+            elif state in (DEAD, LEFT) and now - since > utils.GOSSIP_DEAD_TTL and member not in self.updates:
+                del self.members[member]
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import ctypes
+import ctypes.util
+import heapq
+import logging
+import random
+import socket
+import struct
+
+import utils
+
+"""
+| ===================================================================
+| sendmmsg bindings, used when libc provides them (Linux)
+| ===================================================================
+"""
+
+class SockaddrIn(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16), ("sin_addr", ctypes.c_uint32),
+                ("sin_zero", ctypes.c_char * 8)]
+
+class Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class Msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(Iovec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t), ("msg_flags", ctypes.c_int)]
+
+class Mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", Msghdr), ("msg_len", ctypes.c_uint)]
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    sendmmsg = libc.sendmmsg
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(Mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+except (OSError, AttributeError, TypeError):
+    sendmmsg = None
+
+# Below this many peers a plain sendto loop is cheaper than going through ctypes
+SENDMMSG_MIN_PEERS = 8
+
+logger = logging.getLogger(__name__)
+
+"""
+| ===================================================================
+| parse_peer: resolves a HOST:PORT string (or tuple) to (ip, port)
+| ===================================================================
+"""
+
+def parse_peer(peer):
+    if isinstance(peer, basestring):
+        host, port = peer.rsplit(":", 1)
+    else:
+        host, port = peer
+    return socket.gethostbyname(host), int(port)
+
+"""
+| ===================================================================
+| PeerTable: peers resolved once, with batched fan-out sends
+| ===================================================================
+"""
+
+class PeerTable(object):
+
+    def __init__(self, peers=(), use_sendmmsg=True, fanout=0):
+        self.peers = []  # (ip, port) tuples, ready for sendto
+        self.addresses = dict()  # (ip, port) => (packed ip, port) in network byte order
+        self.use_sendmmsg = use_sendmmsg and sendmmsg is not None
+        self.batch = None  # sendmmsg structures, built on demand
+
+        # Peers that stopped answering are left out of sends, fanout > 0 caps how many of the others get each one
+        self.health = dict()  # (ip, port) => PeerHealth
+        self.unhealthy = set()
+        self.fanout = fanout
+        self.skipped = 0  # sends left out because of health or fanout
+        self.send_errors = 0
+        for peer in peers:
+            self.add(peer)
+
+    def __iter__(self):
+        return iter(self.peers)
+
+    def __len__(self):
+        return len(self.peers)
+
+    def __contains__(self, peer):
+        return peer in self.addresses
+
+    def add(self, peer):
+        peer = parse_peer(peer)
+        if peer not in self.addresses:
+            self.addresses[peer] = (socket.inet_aton(peer[0]), socket.htons(peer[1]))
+            self.peers.append(peer)
+            self.health[peer] = PeerHealth()
+            self.batch = None
+        return peer
+
+    def remove(self, peer):
+        peer = parse_peer(peer)
+        if self.addresses.pop(peer, None) is not None:
+            self.peers.remove(peer)
+            del self.health[peer]
+            self.unhealthy.discard(peer)
+            self.batch = None
+
+    def select(self, exclude=()):
+        """Healthy peers that are not in exclude, which should be a set of (ip, port)"""
+        return [peer for peer in self.peers if peer not in exclude and peer not in self.unhealthy]
+
+    def send(self, sock, send_message, exclude=()):
+        """Sends send_message to every healthy peer not in exclude, or fanout of them, returns how many succeeded"""
+        if self.fanout or self.unhealthy:
+            candidates = [peer for peer in self.peers if peer not in exclude]
+            targets = [peer for peer in candidates if peer not in self.unhealthy]
+
+            # With every peer looking down we keep trying them all, rather than cutting ourselves off
+            if not targets:
+                targets = candidates
+            if self.fanout and len(targets) > self.fanout:
+                targets = self.choose(targets, self.fanout)
+            self.skipped += len(candidates) - len(targets)
+            sent = send_each(sock, send_message, targets)
+            self.send_errors += len(targets) - sent
+            return sent
+        if self.use_sendmmsg and len(self.peers) >= SENDMMSG_MIN_PEERS:
+            sent = self.send_batch(sock, send_message, exclude)
+        else:
+            sent = send_each(sock, send_message, self.select(exclude) if exclude else self.peers)
+        self.send_errors += len(self.peers) - sum(1 for peer in exclude if peer in self.addresses) - sent
+        return sent
+
+    def choose(self, targets, count):
+        """count peers out of targets, sampled without replacement with probability weighted by their health"""
+
+        # Peers without an RTT sample yet are given the mean of the others, rather than the best possible one
+        measured = [self.health[peer].srtt for peer in targets if self.health[peer].srtt is not None]
+        prior_rtt = sum(measured) / len(measured) if measured else None
+
+        # Efraimidis-Spirakis: the count largest random() ** (1 / weight) are a weighted sample
+        return heapq.nlargest(count, targets,
+                              key=lambda peer: random.random() ** (1.0 / self.health[peer].weight(prior_rtt)))
+
+    def heard(self, peer, now):
+        """Any datagram from a peer shows it is alive, returns False if it isn't one of ours"""
+        health = self.health.get(peer)
+        if health is None:
+            return False
+        health.last_heard = now
+        if health.missed:
+            health.missed = 0
+            if peer in self.unhealthy:
+                self.unhealthy.discard(peer)
+                logger.warning("Peer %s:%d is back", peer[0], peer[1])
+        return True
+
+    def pong(self, peer, nonce, now):
+        """Answer to one of our pings, feeds the peer round trip time and answer rate"""
+        if not self.heard(peer, now):
+            return
+        health = self.health[peer]
+        if nonce == health.nonce and health.pinged is not None:
+            health.answered(now - health.pinged)
+            health.pinged = None
+
+    def requested(self, peer, now):
+        """A request peer answers directly is about to be sent, its reply is an RTT sample like a pong"""
+        health = self.health.get(peer)
+        if health is not None and (health.requested is None or now - health.requested >= utils.RECV_TIMEOUT):
+            health.requested = now
+
+    def replied(self, peer, now):
+        """Reply to a request sent to peer, peers busy enough never to be pinged are measured this way"""
+        health = self.health.get(peer)
+        if health is None or health.requested is None:
+            return
+        if now - health.requested < utils.RECV_TIMEOUT:
+            health.sampled(now - health.requested)
+        health.requested = None
+
+    def due_pings(self, now, interval, max_missed=utils.HEALTH_MAX_MISSED):
+        """Peers not heard from in interval seconds, a ping still unanswered counts as missed"""
+        due = []
+        for peer in self.peers:
+            health = self.health[peer]
+            if health.last_heard is not None and now - health.last_heard < interval:
+                continue
+            if health.pinged is not None:
+                health.missed += 1
+                health.unanswered()
+                if health.missed >= max_missed and peer not in self.unhealthy:
+                    self.unhealthy.add(peer)
+                    logger.warning("Peer %s:%d missed %d pings, no longer forwarding to it", peer[0], peer[1],
+                                   health.missed)
+            due.append((peer, self.ping(peer, now)))
+        return due
+
+    def ping(self, peer, now):
+        """Nonce for a ping about to be sent to peer, its answer feeds the peer round trip time"""
+        health = self.health[peer]
+        health.nonce = (health.nonce + 1) % (utils.MAX_SEQ + 1)
+        health.pinged = now
+        return health.nonce
+
+    def build_batch(self):
+
+        # One mmsghdr per peer, all sharing a single iovec that points at the message being sent
+        self.iov = Iovec()
+        self.batch = (Mmsghdr * len(self.peers))()
+        self.sockaddrs = (SockaddrIn * len(self.peers))()
+        self.positions = dict()
+        for i, peer in enumerate(self.peers):
+            self.positions[peer] = i
+            packed_ip, port = self.addresses[peer]
+            self.sockaddrs[i] = SockaddrIn(socket.AF_INET, port, struct.unpack("=L", packed_ip)[0])
+            msg = self.batch[i].msg_hdr
+            msg.msg_name = ctypes.addressof(self.sockaddrs[i])
+            msg.msg_namelen = ctypes.sizeof(SockaddrIn)
+            msg.msg_iov = ctypes.pointer(self.iov)
+            msg.msg_iovlen = 1
+
+    def send_batch(self, sock, send_message, exclude=()):
+        if self.batch is None:
+            self.build_batch()
+        data = send_message.tobytes() if isinstance(send_message, memoryview) else str(send_message)
+        self.iov.iov_base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+        self.iov.iov_len = len(data)
+
+        # Excluded peers split the table in runs, each run goes out with a single sendmmsg call
+        sent = 0
+        start = 0
+        for end in sorted(self.positions[peer] for peer in exclude if peer in self.positions) + [len(self.peers)]:
+            if end > start:
+                sent += self.send_run(sock, send_message, start, end)
+            start = end + 1
+        return sent
+
+    def send_run(self, sock, send_message, start, end):
+        count = end - start
+        if count == 1:
+            return send_each(sock, send_message, self.peers[start:end])
+        sent = sendmmsg(sock.fileno(), ctypes.cast(ctypes.byref(self.batch, start * ctypes.sizeof(Mmsghdr)),
+                                                   ctypes.POINTER(Mmsghdr)), count, 0)
+        if sent < 0:
+            logger.debug("sendmmsg failed with errno %d, falling back to sendto", ctypes.get_errno())
+            sent = 0
+        if sent < count:
+
+            # Whatever the kernel refused is retried one by one, so a single bad peer doesn't stop the rest
+            sent += send_each(sock, send_message, self.peers[start + sent:end])
+        return sent
+
+"""
+| ===================================================================
+| PeerHealth: liveness, round trip time and ping answer rate of a peer
+| ===================================================================
+"""
+
+class PeerHealth(object):
+
+    def __init__(self):
+        self.last_heard = None  # last time any datagram came from the peer
+        self.pinged = None  # when the ping still waiting for an answer was sent
+        self.requested = None  # when the request still waiting for a reply was sent
+        self.nonce = random.randint(0, utils.MAX_SEQ)
+        self.missed = 0  # pings in a row left unanswered
+        self.rate = 1.0  # moving average of answered pings
+        self.srtt = None
+
+    def answered(self, rtt):
+        self.rate += utils.HEALTH_ALPHA * (1.0 - self.rate)
+        self.sampled(rtt)
+
+    def sampled(self, rtt):
+        self.srtt = rtt if self.srtt is None else self.srtt + utils.HEALTH_ALPHA * (rtt - self.srtt)
+
+    def unanswered(self):
+        self.rate -= utils.HEALTH_ALPHA * self.rate
+
+    def weight(self, prior_rtt=None):
+        """Answer rate over round trip time: peers that answer, and answer fast, get picked more"""
+        srtt = self.srtt if self.srtt is not None else prior_rtt
+        return max(self.rate, 0.01) / max(srtt or utils.HEALTH_MIN_RTT, utils.HEALTH_MIN_RTT)
+
+"""
+| ===================================================================
+| send_each: sends one message to many peers with one sendto each
+| ===================================================================
+"""
+
+def send_each(sock, send_message, targets):
+    sent = 0
+    for peer in targets:
+        try:
+            sock.sendto(send_message, peer)
+            sent += 1
+        except socket.error:
+            pass
+    return sent
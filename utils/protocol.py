@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import struct
+
+import utils
+
+"""
+| ===================================================================
+| Precompiled codecs for utils.MESSAGE_FORMAT
+| ===================================================================
+"""
+
+MESSAGE_TYPE = struct.Struct("!H")
+HEADERS = dict((name, struct.Struct(fmt)) for name, fmt in utils.MESSAGE_FORMAT.items())
+MESSAGE_NAMES = dict((message_type, name) for name, message_type in utils.MESSAGE_TYPES.items())
+QUERY = HEADERS["QUERY"]
+QUERY_SIZE = QUERY.size
+
+# QUERY fields that change hop by hop, so they can be rewritten in place
+QUERY_TTL = struct.Struct("!H")
+QUERY_TTL_OFFSET = 2
+QUERY_SEQ = struct.Struct("!L")
+QUERY_SEQ_OFFSET = 10
+
+# A replicated entry is (Lamport counter, writer tag, deleted flag, key length, value length) + key + value,
+# a version summary (Lamport counter, writer tag, key length) + key
+ENTRY = struct.Struct("!QLBHH")
+SUMMARY = struct.Struct("!QLH")
+
+# Values fetched over TCP are preceded by their length, NOT_FOUND standing for a key we no longer hold
+VALUE_LENGTH = struct.Struct("!L")
+
+# Membership records gossiped between servents: ip, port, incarnation and state
+MEMBER = struct.Struct("!LHLB")
+# alive, suspect, dead and left, as numbered in memberutils
+MEMBER_STATES = 4
+NOT_FOUND = 0xFFFFFFFF
+
+# Addresses seen on the wire are few, so conversions are memoized
+IP_CACHE_SIZE = 4096
+ip_to_int_cache = dict()
+int_to_ip_cache = dict()
+
+"""
+| ===================================================================
+| ip_to_int / int_to_ip: memoized versions of the utils conversions
+| ===================================================================
+"""
+
+def ip_to_int(ip):
+    intip = ip_to_int_cache.get(ip)
+    if intip is None:
+        if len(ip_to_int_cache) >= IP_CACHE_SIZE:
+            ip_to_int_cache.clear()
+        intip = ip_to_int_cache[ip] = utils.ip_to_int(ip)
+    return intip
+
+def int_to_ip(intip):
+    ip = int_to_ip_cache.get(intip)
+    if ip is None:
+        if len(int_to_ip_cache) >= IP_CACHE_SIZE:
+            int_to_ip_cache.clear()
+        ip = int_to_ip_cache[intip] = utils.int_to_ip(intip)
+    return ip
+
+"""
+| ===================================================================
+| message_type: reads the type of a packet without copying it
+| ===================================================================
+"""
+
+def message_type(recv_data):
+    return MESSAGE_TYPE.unpack_from(recv_data)[0]
+
+def message_name(message_type):
+    return MESSAGE_NAMES.get(message_type, "UNKNOWN%d" % message_type)
+
+"""
+| ===================================================================
+| parse_query: unpacks a QUERY header and its key
+| ===================================================================
+"""
+
+def parse_query(recv_data):
+    _, ttl, from_ip, from_port, seq = QUERY.unpack_from(recv_data)
+    key = recv_data[QUERY_SIZE:]
+    return (ttl, int_to_ip_cache.get(from_ip) or int_to_ip(from_ip), from_port, seq,
+            key.tobytes() if isinstance(key, memoryview) else str(key))
+
+"""
+| ===================================================================
+| parse_key: returns the payload that follows a fixed size header
+| ===================================================================
+"""
+
+def parse_key(recv_data, message_type_name):
+    return payload(recv_data, HEADERS[message_type_name].size)
+
+"""
+| ===================================================================
+| payload: copies out what follows offset in a str or buffer
+| ===================================================================
+"""
+
+def payload(recv_data, offset):
+    if isinstance(recv_data, memoryview):
+        return recv_data[offset:].tobytes()
+    return str(recv_data[offset:])
+
+"""
+| ===================================================================
+| build_query: packs a QUERY header and key into a new buffer
+| ===================================================================
+"""
+
+def build_query(ttl, from_addr, seq, key):
+    send_message = bytearray(QUERY.size + len(key))
+    QUERY.pack_into(send_message, 0, utils.MESSAGE_TYPES["QUERY"], ttl, ip_to_int(from_addr[0]), from_addr[1], seq)
+    send_message[QUERY.size:] = key
+    return send_message
+
+"""
+| ===================================================================
+| rewrite_query: updates TTL and seq of a QUERY buffer in place
+| ===================================================================
+"""
+
+def rewrite_query(send_message, ttl, seq=None):
+    if isinstance(send_message, str):
+        send_message = bytearray(send_message)
+    QUERY_TTL.pack_into(send_message, QUERY_TTL_OFFSET, ttl)
+    if seq is not None:
+        QUERY_SEQ.pack_into(send_message, QUERY_SEQ_OFFSET, seq)
+    return send_message
+
+"""
+| ===================================================================
+| build_response: packs a RESPONSE for key => value
+| ===================================================================
+"""
+
+def build_response(key, value):
+    return HEADERS["RESPONSE"].pack(utils.MESSAGE_TYPES["RESPONSE"]) + key + '\t' + value + '\x00\x00'
+
+"""
+| ===================================================================
+| parse_keys: splits the keys carried by a MULTIREQ or MULTIQUERY
+| ===================================================================
+"""
+
+def parse_keys(recv_data, message_type_name):
+    return [key for key in parse_key(recv_data, message_type_name).split(utils.KEY_SEPARATOR) if key]
+
+"""
+| ===================================================================
+| parse_multiquery: unpacks a MULTIQUERY header and its keys
+| ===================================================================
+"""
+
+def parse_multiquery(recv_data):
+    _, ttl, from_ip, from_port, seq = HEADERS["MULTIQUERY"].unpack_from(recv_data)
+    return ttl, int_to_ip(from_ip), from_port, seq, parse_keys(recv_data, "MULTIQUERY")
+
+"""
+| ===================================================================
+| parse_idreq / parse_idquery: tagged lookups and their keys
+| ===================================================================
+"""
+
+def parse_idreq(recv_data):
+    _, request_id, wanted = HEADERS["IDREQ"].unpack_from(recv_data)
+    return request_id, wanted, parse_keys(recv_data, "IDREQ")
+
+def parse_idquery(recv_data):
+    _, ttl, from_ip, from_port, request_id, wanted = HEADERS["IDQUERY"].unpack_from(recv_data)
+    return ttl, int_to_ip(from_ip), from_port, request_id, wanted, parse_keys(recv_data, "IDQUERY")
+
+"""
+| ===================================================================
+| parse_request_id: the id an IDRESPONSE echoes back
+| ===================================================================
+"""
+
+def parse_request_id(recv_data):
+    return HEADERS["IDRESPONSE"].unpack_from(recv_data)[1]
+
+"""
+| ===================================================================
+| parse_responses: (key, value) of every record in a RESPONSE
+| ===================================================================
+"""
+
+def parse_responses(recv_data, message_type_name="RESPONSE"):
+    records = []
+    for record in parse_key(recv_data, message_type_name).split('\x00\x00'):
+        if record:
+            key, _, value = record.partition('\t')
+            records.append((key, value))
+    return records
+
+"""
+| ===================================================================
+| pack_records: fills as few datagrams as possible after a header
+| ===================================================================
+"""
+
+def pack_records(header, records, separator=""):
+    datagrams = []
+    chunk = []
+    size = len(header)
+    for record in records:
+
+        # A record too big for a datagram of its own is still sent alone, like a single RESPONSE would be
+        if chunk and size + len(separator) + len(record) > utils.MAX_BUFFER_SIZE:
+            datagrams.append(header + separator.join(chunk))
+            chunk = []
+            size = len(header)
+        size += len(record) + (len(separator) if chunk else 0)
+        chunk.append(record)
+    if chunk:
+        datagrams.append(header + separator.join(chunk))
+    return datagrams
+
+"""
+| ===================================================================
+| build_multireq / build_multiquery: keys packed into datagrams
+| ===================================================================
+"""
+
+def build_multireq(keys):
+    return pack_records(HEADERS["MULTIREQ"].pack(utils.MESSAGE_TYPES["MULTIREQ"]), keys, utils.KEY_SEPARATOR)
+
+def build_multiquery(ttl, from_addr, seq, keys):
+    header = HEADERS["MULTIQUERY"].pack(utils.MESSAGE_TYPES["MULTIQUERY"], ttl, ip_to_int(from_addr[0]),
+                                        from_addr[1], seq)
+    return pack_records(header, keys, utils.KEY_SEPARATOR)
+
+"""
+| ===================================================================
+| build_idreq / build_idquery: keys packed into tagged lookups
+| ===================================================================
+"""
+
+def build_idreq(request_id, keys, wanted=1):
+    header = HEADERS["IDREQ"].pack(utils.MESSAGE_TYPES["IDREQ"], request_id, wanted)
+    return pack_records(header, keys, utils.KEY_SEPARATOR)
+
+def build_idquery(ttl, from_addr, request_id, wanted, keys):
+    header = HEADERS["IDQUERY"].pack(utils.MESSAGE_TYPES["IDQUERY"], ttl, ip_to_int(from_addr[0]), from_addr[1],
+                                     request_id, wanted)
+    return pack_records(header, keys, utils.KEY_SEPARATOR)
+
+"""
+| ===================================================================
+| build_packed_response: many key => value records per (ID)RESPONSE
+| ===================================================================
+"""
+
+def build_packed_response(items, request_id=None):
+    if request_id is None:
+        header = HEADERS["RESPONSE"].pack(utils.MESSAGE_TYPES["RESPONSE"])
+    else:
+        header = HEADERS["IDRESPONSE"].pack(utils.MESSAGE_TYPES["IDRESPONSE"], request_id)
+    return pack_records(header, [key + '\t' + value + '\x00\x00' for key, value in items])
+
+"""
+| ===================================================================
+| is_large: whether a value must be fetched over TCP instead
+| ===================================================================
+"""
+
+def is_large(key, value, threshold=utils.LARGE_VALUE_THRESHOLD):
+
+    # Above MAX_BUFFER_SIZE a record would be truncated by the receiver, whatever the threshold says
+    return (len(value) > threshold or
+            HEADERS["IDRESPONSE"].size + len(key) + len(value) + 3 > utils.MAX_BUFFER_SIZE)
+
+"""
+| ===================================================================
+| build_large_response: announces a value and where to fetch it
+| ===================================================================
+"""
+
+def build_large_response(request_id, size, stream_addr, key):
+    return HEADERS["LARGERESPONSE"].pack(utils.MESSAGE_TYPES["LARGERESPONSE"], request_id, size,
+                                         ip_to_int(stream_addr[0]), stream_addr[1]) + key
+
+def parse_large_response(recv_data):
+    _, request_id, size, stream_ip, stream_port = HEADERS["LARGERESPONSE"].unpack_from(recv_data)
+    return request_id, size, (int_to_ip(stream_ip), stream_port), parse_key(recv_data, "LARGERESPONSE")
+
+"""
+| ===================================================================
+| parse_write: request id, key and value of a PUT or DELETE
+| ===================================================================
+"""
+
+def parse_write(recv_data, message_type_name):
+    request_id = HEADERS[message_type_name].unpack_from(recv_data)[1]
+    key, _, value = parse_key(recv_data, message_type_name).partition('\t')
+    return request_id, key, value
+
+"""
+| ===================================================================
+| build_put / build_delete: client write requests
+| ===================================================================
+"""
+
+def build_put(request_id, key, value):
+    return HEADERS["PUT"].pack(utils.MESSAGE_TYPES["PUT"], request_id) + key + '\t' + value
+
+def build_delete(request_id, key):
+    return HEADERS["DELETE"].pack(utils.MESSAGE_TYPES["DELETE"], request_id) + key
+
+"""
+| ===================================================================
+| build_replicate / parse_entries: versioned entries, deletes included
+| ===================================================================
+"""
+
+def build_replicate(entries):
+    records = []
+    for key, (counter, writer, value) in entries:
+        deleted = value is None
+        value = value or ""
+        records.append(ENTRY.pack(counter, writer, deleted, len(key), len(value)) + key + value)
+    return pack_records(HEADERS["REPLICATE"].pack(utils.MESSAGE_TYPES["REPLICATE"]), records)
+
+def parse_entries(recv_data):
+    data = parse_key(recv_data, "REPLICATE")
+    entries = []
+    offset = 0
+    while offset + ENTRY.size <= len(data):
+        counter, writer, deleted, key_len, value_len = ENTRY.unpack_from(data, offset)
+        offset += ENTRY.size
+        key = data[offset:offset + key_len]
+        value = None if deleted else data[offset + key_len:offset + key_len + value_len]
+        offset += key_len + value_len
+        entries.append((key, (counter, writer, value)))
+    return entries
+
+"""
+| ===================================================================
+| build_sync_digest / parse_sync_digest: one 64-bit digest per bucket
+| ===================================================================
+"""
+
+def build_sync_digest(digests):
+    return HEADERS["SYNCDIGEST"].pack(utils.MESSAGE_TYPES["SYNCDIGEST"]) + struct.pack("!%dQ" % len(digests),
+                                                                                      *digests)
+
+def parse_sync_digest(recv_data):
+    data = parse_key(recv_data, "SYNCDIGEST")
+    return struct.unpack("!%dQ" % (len(data) / 8), data[:len(data) / 8 * 8])
+
+"""
+| ===================================================================
+| build_sync_bucket / parse_sync_bucket: versions held in one bucket
+| ===================================================================
+"""
+
+def build_sync_bucket(bucket, summaries, reply):
+    header = HEADERS["SYNCBUCKET"].pack(utils.MESSAGE_TYPES["SYNCBUCKET"], bucket, reply)
+    datagrams = pack_records(header, [SUMMARY.pack(counter, writer, len(key)) + key
+                                      for key, (counter, writer) in summaries]) or [header]
+
+    # Only the first part asks for the receiver's own summary back, so it is sent once per bucket
+    no_reply = HEADERS["SYNCBUCKET"].pack(utils.MESSAGE_TYPES["SYNCBUCKET"], bucket, False)
+    return datagrams[:1] + [no_reply + datagram[len(header):] for datagram in datagrams[1:]]
+
+def parse_sync_bucket(recv_data):
+    _, bucket, reply = HEADERS["SYNCBUCKET"].unpack_from(recv_data)
+    data = parse_key(recv_data, "SYNCBUCKET")
+    summaries = []
+    offset = 0
+    while offset + SUMMARY.size <= len(data):
+        counter, writer, key_len = SUMMARY.unpack_from(data, offset)
+        offset += SUMMARY.size
+        summaries.append((data[offset:offset + key_len], (counter, writer)))
+        offset += key_len
+    return bucket, reply, summaries
+
+"""
+| ===================================================================
+| build_sync_pull: asks a peer for its entries of some keys
+| ===================================================================
+"""
+
+def build_sync_pull(keys):
+    return pack_records(HEADERS["SYNCPULL"].pack(utils.MESSAGE_TYPES["SYNCPULL"]), keys, utils.KEY_SEPARATOR)
+
+"""
+| ===================================================================
+| build_globreq / build_globquery: a pattern and the key to resume after
+| ===================================================================
+"""
+
+def build_globreq(request_id, limit, pattern, after=""):
+    return (HEADERS["GLOBREQ"].pack(utils.MESSAGE_TYPES["GLOBREQ"], request_id, limit) + pattern +
+            utils.KEY_SEPARATOR + after)
+
+def build_globquery(ttl, from_addr, request_id, limit, pattern, after=""):
+    return (HEADERS["GLOBQUERY"].pack(utils.MESSAGE_TYPES["GLOBQUERY"], ttl, ip_to_int(from_addr[0]), from_addr[1],
+                                      request_id, limit) + pattern + utils.KEY_SEPARATOR + after)
+
+"""
+| ===================================================================
+| parse_globreq / parse_globquery: header fields, pattern and cursor
+| ===================================================================
+"""
+
+def parse_globreq(recv_data):
+    _, request_id, limit = HEADERS["GLOBREQ"].unpack_from(recv_data)
+    pattern, _, after = parse_key(recv_data, "GLOBREQ").partition(utils.KEY_SEPARATOR)
+    return request_id, limit, pattern, after
+
+def parse_globquery(recv_data):
+    _, ttl, from_ip, from_port, request_id, limit = HEADERS["GLOBQUERY"].unpack_from(recv_data)
+    pattern, _, after = parse_key(recv_data, "GLOBQUERY").partition(utils.KEY_SEPARATOR)
+    return ttl, int_to_ip(from_ip), from_port, request_id, limit, pattern, after
+
+"""
+| ===================================================================
+| build_glob_response: a page of matches, flagged if more are left
+| ===================================================================
+"""
+
+def build_glob_response(request_id, items, more):
+    header = HEADERS["GLOBRESPONSE"].pack(utils.MESSAGE_TYPES["GLOBRESPONSE"], request_id, False)
+    datagrams = pack_records(header, [key + '\t' + value + '\x00\x00' for key, value in items]) or [header]
+
+    # Only the last datagram of a page carries the flag, the client resumes after the last key it got
+    last = HEADERS["GLOBRESPONSE"].pack(utils.MESSAGE_TYPES["GLOBRESPONSE"], request_id, more)
+    return datagrams[:-1] + [last + datagrams[-1][len(header):]]
+
+def parse_glob_response(recv_data):
+    _, request_id, more = HEADERS["GLOBRESPONSE"].unpack_from(recv_data)
+    return request_id, bool(more), parse_responses(recv_data, "GLOBRESPONSE")
+
+"""
+| ===================================================================
+| build_ping / build_pong / parse_ping: heartbeats between peers
+| ===================================================================
+"""
+
+def build_ping(nonce, updates=()):
+    return HEADERS["PING"].pack(utils.MESSAGE_TYPES["PING"], nonce) + pack_members(updates)
+
+def build_pong(nonce, updates=()):
+    return HEADERS["PONG"].pack(utils.MESSAGE_TYPES["PONG"], nonce) + pack_members(updates)
+
+def parse_ping(recv_data):
+    """Nonce of a PING or a PONG, both share the same layout"""
+    return HEADERS["PING"].unpack_from(recv_data)[1]
+
+"""
+| ===================================================================
+| pack_members / parse_members: membership records after a header
+| ===================================================================
+"""
+
+def pack_member(record):
+    (ip, port), incarnation, state = record
+    return MEMBER.pack(ip_to_int(ip), port, incarnation, state)
+
+def pack_members(records):
+    return "".join(pack_member(record) for record in records)
+
+def parse_members(recv_data, message_type_name):
+    """(member, incarnation, state) records gossiped in a PING, PONG or MEMBERS"""
+    records = []
+    for offset in xrange(HEADERS[message_type_name].size, len(recv_data) - MEMBER.size + 1, MEMBER.size):
+        intip, port, incarnation, state = MEMBER.unpack_from(recv_data, offset)
+        # A state we don't know of would reach Membership.apply, skip the record instead
+        if state >= MEMBER_STATES:
+            continue
+        records.append(((int_to_ip(intip), port), incarnation, state))
+    return records
+
+"""
+| ===================================================================
+| build_join / build_leave / build_members: overlay membership
+| ===================================================================
+"""
+
+def build_join(incarnation):
+    return HEADERS["JOIN"].pack(utils.MESSAGE_TYPES["JOIN"], incarnation)
+
+def build_leave(incarnation):
+    return HEADERS["LEAVE"].pack(utils.MESSAGE_TYPES["LEAVE"], incarnation)
+
+def parse_incarnation(recv_data):
+    """Incarnation of a JOIN or a LEAVE, both share the same layout"""
+    return HEADERS["JOIN"].unpack_from(recv_data)[1]
+
+def build_members(observed_addr, records):
+    """Every member a seed knows of, with the address the joining servent was seen from"""
+    header = HEADERS["MEMBERS"].pack(utils.MESSAGE_TYPES["MEMBERS"], ip_to_int(observed_addr[0]), observed_addr[1])
+    return pack_records(header, [pack_member(record) for record in records]) or [header]
+
+def parse_observed(recv_data):
+    _, intip, port = HEADERS["MEMBERS"].unpack_from(recv_data)
+    return int_to_ip(intip), port
+
+"""
+| ===================================================================
+| PacketBuffer: reusable receive buffer for recvfrom_into
+| ===================================================================
+"""
+
+class PacketBuffer(object):
+
+    def __init__(self, size=utils.MAX_BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def recvfrom(self, sock):
+        """Receives a datagram into the buffer, returns a memoryview of it and the sender address"""
+        nbytes, ip_addr = sock.recvfrom_into(self.buffer)
+        return self.view[:nbytes], ip_addr
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+import serventutils
+import storeutils
+import utils
+
+"""
+| ===================================================================
+| file_signature: what tells us input_file has been replaced or edited
+| ===================================================================
+"""
+
+def file_signature(input_file):
+    stat = os.stat(input_file)
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+"""
+| ===================================================================
+| ServiceListReloader: rebuilds the service list in the background
+| ===================================================================
+"""
+
+class ServiceListReloader(object):
+
+    def __init__(self, input_file, on_swap, interval=0):
+        self.input_file = input_file
+        self.on_swap = on_swap  # called with the new service list, must only swap a reference
+        self.interval = interval  # how often input_file is checked for changes, 0 waits for trigger()
+        self.service_list = None
+        self.lines = None  # lines of the last text file read, None for compiled stores
+        self.unique = False
+        self.signature = None
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.retired = []  # compiled stores swapped out, unmapped once no lookup holds them anymore
+
+        # Figures of the last reload
+        self.reloads = 0
+        self.last_reload = dict()
+
+    def load(self):
+        """Initial synchronous load, returns the service list"""
+        self.signature = file_signature(self.input_file)
+        self.service_list, _ = self.build()
+        return self.service_list
+
+    def build(self):
+        if storeutils.is_compiled(self.input_file):
+            self.lines = None
+            service_list = storeutils.MappedServiceStore(self.input_file)
+            return service_list, (len(service_list), 0)
+
+        with open(self.input_file) as input_file:
+            ordered_lines = input_file.readlines()
+        lines = set(ordered_lines)
+        service_list = None
+        if self.lines is not None and self.unique and isinstance(self.service_list, dict):
+            service_list, changes = self.apply_diff(lines)
+        if service_list is None:
+            service_list = dict()
+            parsed = 0
+            for line in ordered_lines:
+                service = serventutils.parse_line(line)
+                if service:
+                    service_list[service[0]] = service[1]
+                    parsed += 1
+            changes = (len(service_list), 0)
+
+            # Diffs are only safe while every key comes from exactly one line
+            self.unique = parsed == len(service_list)
+        self.lines = lines
+        return service_list, changes
+
+    def apply_diff(self, lines):
+        """Applies only the lines that changed to a copy of the current table, None if that's not safe"""
+        removed = [serventutils.parse_line(line) for line in self.lines - lines]
+        added = [serventutils.parse_line(line) for line in lines - self.lines]
+        service_list = self.service_list.copy()
+        for service in removed:
+            if service and service_list.get(service[0]) == service[1]:
+                del service_list[service[0]]
+        for service in added:
+            if service:
+
+                # A key defined by more than one line depends on line order, so we go for a full parse
+                if service[0] in service_list:
+                    return None, None
+                service_list[service[0]] = service[1]
+        return service_list, (len(added), len(removed))
+
+    def reload(self):
+        logger = logging.getLogger(__name__)
+
+        started = time.time()
+        try:
+            signature = file_signature(self.input_file)
+            service_list, (added, removed) = self.build()
+        except (IOError, OSError, ValueError), e:
+            logger.error("Couldn't reload %s: %s", self.input_file, str(e))
+            return False
+        built = time.time()
+
+        # Lookups keep using the old table until this single reference swap
+        self.on_swap(service_list)
+        swapped = time.time()
+
+        if isinstance(self.service_list, storeutils.MappedServiceStore):
+            self.retired.append(self.service_list)
+        self.service_list = service_list
+        self.signature = signature
+        self.reloads += 1
+        self.last_reload = {"entries": len(service_list), "added": added, "removed": removed,
+                            "reload_time": built - started, "swap_time": swapped - built}
+        logger.info("Reloaded %(entries)d services (+%(added)d -%(removed)d) in %(reload_time).3fs, "
+                    "swap took %(swap_time).6fs", self.last_reload)
+        return True
+
+    def close_retired(self):
+        """Unmaps the stores swapped out that nothing refers to anymore, returns how many are left"""
+        retired, self.retired = self.retired, []
+        while retired:
+
+            # A lookup or an iteration still running holds a reference, besides ours and getrefcount's
+            service_list = retired.pop()
+            if sys.getrefcount(service_list) > 2:
+                self.retired.append(service_list)
+            else:
+                service_list.close()
+        return len(self.retired)
+
+    def trigger(self):
+        """Asks for a reload, safe to call from a signal handler"""
+        self.wakeup.set()
+
+    def changed(self):
+        try:
+            return file_signature(self.input_file) != self.signature
+        except OSError:
+            return False
+
+    def run(self):
+        while True:
+
+            # Stores swapped out are closed on a later pass, once the lookups that were using them are done
+            timeout = self.interval or None
+            if self.retired:
+                timeout = min(timeout or utils.RELOAD_RETIRE_INTERVAL, utils.RELOAD_RETIRE_INTERVAL)
+            self.wakeup.wait(timeout)
+            triggered = self.wakeup.is_set()
+            self.wakeup.clear()
+            if triggered or self.changed():
+                self.reload()
+            self.close_retired()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="reloader")
+        self.thread.daemon = True
+        self.thread.start()
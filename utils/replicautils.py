@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import collections
+import hashlib
+import itertools
+import struct
+import zlib
+
+import indexutils
+import utils
+
+"""
+| ===================================================================
+| writer_tag: 32-bit id of a servent, breaks ties between versions
+| ===================================================================
+"""
+
+def writer_tag(addr):
+    return zlib.crc32("%s:%d" % (addr[0], addr[1])) & 0xFFFFFFFF
+
+"""
+| ===================================================================
+| entry_hash: 64-bit hash of a (key, version), xored into digests
+| ===================================================================
+"""
+
+def entry_hash(key, counter, writer):
+    return struct.unpack("!Q", hashlib.md5("%s\0%d\0%d" % (key, counter, writer)).digest()[:8])[0]
+
+"""
+| ===================================================================
+| VersionedStore: writes and deletes layered over a service list
+| ===================================================================
+|
+| The loaded service list is version (0, 0) of every key it holds, writes
+| carry a Lamport counter and the writer's tag, the highest one wins.
+| Deletes are kept as tombstones so they replicate like any write, for
+| TOMBSTONE_ROUNDS anti-entropy rounds unless they hide a loaded entry.
+| Digests cover written entries only, loaded lists are local to a servent.
+"""
+
+class VersionedStore(object):
+
+    def __init__(self, base, writer, buckets=utils.SYNC_BUCKETS):
+        self.base = base
+        self.writer = writer
+        self.clock = 0
+        self.entries = dict()  # key => (counter, writer, value), value None for deletes
+        self.bucket_keys = [set() for _ in xrange(buckets)]
+        self.digests = [0] * buckets
+        self.rounds = 0  # anti-entropy rounds run so far
+        self.tombstones = dict()  # key => round its delete was stored in
+
+        # Sorted index for prefix and glob queries, built on the first one so exact lookups never pay for it.
+        # Indexes rebuilt by swap wait in rebuilt until the loop thread installs them
+        self.index = None
+        self.rebuilt = collections.deque(maxlen=1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key) if self.entries else None
+        if entry is None:
+            return self.base.get(key, default)
+        return default if entry[2] is None else entry[2]
+
+    def swap(self, base):
+        """Replaces the loaded service list, writes stay on top of it"""
+        self.base = base
+
+        # Runs in the reloader thread while writes and matches run in the loop, which installs the new index
+        if self.index is not None:
+            self.rebuilt.append(indexutils.SortedIndex(itertools.chain(base, self.entries.keys())))
+
+    def install_index(self):
+        """Installs the index rebuilt by swap, with the keys written while it was being built"""
+        while self.rebuilt:
+            index = self.rebuilt.popleft()
+            for key in self.entries:
+                index.insert(key)
+            self.index = index
+
+    def bucket(self, key):
+        return (zlib.crc32(key) & 0xFFFFFFFF) % len(self.digests)
+
+    def version(self, key):
+        entry = self.entries.get(key)
+        return (entry[0], entry[1]) if entry else (0, 0)
+
+    def write(self, key, value):
+        """Local PUT (or DELETE with value None), returns the new entry"""
+        entry = (self.clock + 1, self.writer, value)
+        self.apply(key, entry)
+        return entry
+
+    def apply(self, key, entry):
+        """Stores entry if it is newer than what we have for key, returns whether it was"""
+        counter, writer, value = entry
+        self.clock = max(self.clock, counter)
+        old = self.entries.get(key)
+        if old is not None and (old[0], old[1]) >= (counter, writer):
+            return False
+
+        # Deleting what we never had changes nothing here. Storing it would also bring back tombstones we
+        # already collected, as peers that still have them push them to us again
+        if value is None and old is None and self.base.get(key) is None:
+            return False
+
+        # Digests are kept up to date incrementally, xor takes the old version out and the new one in
+        self.install_index()
+        bucket = self.bucket(key)
+        if old is not None:
+            self.digests[bucket] ^= entry_hash(key, old[0], old[1])
+        self.digests[bucket] ^= entry_hash(key, counter, writer)
+        self.bucket_keys[bucket].add(key)
+        self.entries[key] = entry
+        if value is None:
+            self.tombstones[key] = self.rounds
+        else:
+            self.tombstones.pop(key, None)
+        if self.index is not None and old is None:
+            self.index.insert(key)
+        return True
+
+    def collect(self, rounds=utils.TOMBSTONE_ROUNDS):
+        """Ends an anti-entropy round, dropping tombstones stored rounds ago, returns how many were dropped"""
+        self.rounds += 1
+        expired = [key for key, stored in self.tombstones.iteritems() if self.rounds - stored >= rounds]
+        collected = 0
+        for key in expired:
+            del self.tombstones[key]
+
+            # A tombstone hiding a loaded entry is kept for good, the entry would come back otherwise
+            if self.base.get(key) is not None:
+                continue
+            counter, writer, _ = self.entries.pop(key)
+            bucket = self.bucket(key)
+            self.digests[bucket] ^= entry_hash(key, counter, writer)
+            self.bucket_keys[bucket].discard(key)
+            collected += 1
+        return collected
+
+    def match(self, pattern, after="", limit=None):
+        """(key, value) of the keys matching a prefix or glob pattern, and whether more are left"""
+        self.install_index()
+        index = self.index
+        if index is None:
+            index = self.index = indexutils.SortedIndex(itertools.chain(self.base, self.entries))
+        items = []
+        while True:
+
+            # Deleted keys stay in the index, a page is refilled past them
+            keys, more = index.match(pattern, after, None if limit is None else limit - len(items))
+            for key in keys:
+                value = self.get(key)
+                if value is not None:
+                    items.append((key, value))
+            if not more or not keys or len(items) == limit:
+                return items, more
+            after = keys[-1]
+
+    def summary(self, bucket):
+        """(key, version) of every entry in bucket"""
+        return [(key, self.version(key)) for key in self.bucket_keys[bucket]]
+
+    def items(self, keys):
+        return [(key, self.entries[key]) for key in keys if key in self.entries]
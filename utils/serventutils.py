@@ -23,15 +23,30 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+import collections
 import logging
+import random
+import socket
 import struct
+import time
 
+import cacheutils
+import dhtutils
+import memberutils
+import peerutils
+import protocol
+import replicautils
+import statsutils
+import storeutils
 import utils
 
 # Logging setup
 logging.basicConfig(level=logging.DEBUG, format="[%(asctime)s][%(levelname)s] %(message)s",
                     datefmt="%m-%d-%Y %I:%M:%S %p")
 
+# Looked up once, getLogger takes the logging module lock on every call and handlers run per datagram
+logger = logging.getLogger(__name__)
+
 """
 | ===================================================================
 | read_input_file: gets a list of services from input_file
@@ -41,34 +56,62 @@ logging.basicConfig(level=logging.DEBUG, format="[%(asctime)s][%(levelname)s] %(
 def read_input_file(input_file):
     services = dict()
     with open(input_file) as input_file:
-        for line in input_file.readlines():
-            line = ''.join(line).strip(' ')
-            if line != "#" and not line.isspace():
-                splitted_line = line.replace('\t', ' ').replace('  ', ' ').split()
-                service_key = splitted_line[0]  # Extracts service name
-                services[service_key] = " ".join(splitted_line[1:])  # Service port, protocol and any more info
+        for line in input_file:
+            service = parse_line(line)
+            if service:
+                services[service[0]] = service[1]
     return services
 
+"""
+| ===================================================================
+| parse_line: extracts (key, value) from a services file line
+| ===================================================================
+"""
+
+def parse_line(line):
+
+    # split() already takes care of tabs and repeated spaces, one pass per line is enough
+    splitted_line = line.split()
+    if splitted_line and line.strip(' ') != "#":
+        service_key = splitted_line[0]  # Extracts service name
+        return service_key, " ".join(splitted_line[1:])  # Service port, protocol and any more info
+    return None
+
+"""
+| ===================================================================
+| load_service_list: maps a compiled store or reads a text file
+| ===================================================================
+"""
+
+def load_service_list(input_file):
+    if storeutils.is_compiled(input_file):
+        return storeutils.MappedServiceStore(input_file)
+    return read_input_file(input_file)
+
 """
 | ===================================================================
 | local_db_search: takes a key searches for it in local storage
 | ===================================================================
 """
 
-def local_db_search(srv_sock, service_list, recv_message, ip_addr):
-    logger = logging.getLogger(__name__)
+def local_db_search(srv_sock, service_list, recv_message, ip_addr, stream_addr=None,
+                    large_threshold=utils.LARGE_VALUE_THRESHOLD, counters=None):
 
-    # Check if key is locally stored
-    if recv_message in service_list:
+    # Check if key is locally stored, a single lookup works for dicts and compiled stores alike
+    value = service_list.get(recv_message)
+    if value is not None:
 
-        # Prepare response
-        send_header = struct.pack(utils.MESSAGE_FORMAT["RESPONSE"], utils.MESSAGE_TYPES["RESPONSE"])
-        send_message = send_header + recv_message + '\t' + service_list[recv_message] + '\x00\x00'
+        # Prepare response, values too big for it are announced and fetched over TCP from stream_addr
+        if stream_addr is not None and protocol.is_large(recv_message, value, large_threshold):
+            send_message = protocol.build_large_response(0, len(value), stream_addr, recv_message)
+        else:
+            send_message = protocol.build_response(recv_message, value)
         try:
             srv_sock.sendto(send_message, (ip_addr[0], ip_addr[1]))
             logger.info("Answer sent successfully to %s:%d", ip_addr[0], ip_addr[1])
         except:
-            pass
+            if counters is not None:
+                counters["send_errors"] += 1
         finally:
             return True
     else:
@@ -76,26 +119,745 @@ def local_db_search(srv_sock, service_list, recv_message, ip_addr):
 
 """
 | ===================================================================
-| forward_query: takes a query and forward it to other peers
+| forward_message: sends an already built query to other peers
+| ===================================================================
+"""
+
+def forward_message(srv_sock, send_message, exclude_list, other_peers, counters=None):
+
+    # Peers given as HOST:PORT strings are resolved here, a PeerTable is used as is
+    if not isinstance(other_peers, peerutils.PeerTable):
+        other_peers = peerutils.PeerTable(other_peers)
+    send_errors = other_peers.send_errors
+    sent = other_peers.send(srv_sock, send_message, set(exclude_list))
+    if counters is not None:
+        counters["send_errors"] += other_peers.send_errors - send_errors
+    logger.info("Query forwarded successfully to %d peers", sent)
+    return sent
+
+"""
+| ===================================================================
+| cache_search: answers a key from the responses cached for it
+| ===================================================================
+"""
+
+def cache_search(srv_sock, response_cache, recv_message, ip_addr, counters=None):
+    responses = response_cache.get(recv_message)
+    if not responses:
+        return 0
+    for send_message in responses:
+        try:
+            srv_sock.sendto(send_message, (ip_addr[0], ip_addr[1]))
+        except:
+            if counters is not None:
+                counters["send_errors"] += 1
+    logger.info("Answered %s:%d with %d cached responses", ip_addr[0], ip_addr[1], len(responses))
+    return len(responses)
+
+"""
+| ===================================================================
+| Servent: per-datagram processing shared by every servent loop
 | ===================================================================
 """
 
-def forward_query(srv_sock, recv_data, recv_header_size, ttl, from_addr, exclude_list, seq, other_peers):
-    logger = logging.getLogger(__name__)
+class Servent(object):
+
+    def __init__(self, srv_sock, srv_addr, service_list, other_peers, query_history, response_cache=None,
+                 advertise_addr=None, ring=None, replicas=utils.REPLICAS,
+                 large_threshold=utils.LARGE_VALUE_THRESHOLD, heartbeat_interval=utils.HEARTBEAT_INTERVAL,
+                 membership=None, max_peers=utils.GOSSIP_MAX_PEERS, stream_addr=None):
+        self.srv_sock = srv_sock
+        self.srv_addr = srv_addr
+        if not isinstance(other_peers, peerutils.PeerTable):
+            other_peers = peerutils.PeerTable(other_peers)
+        self.other_peers = other_peers
+
+        # Here we keep a track of recently seen queries, keyed by (origin ip, origin port, seq, key)
+        self.query_history = query_history
+
+        # With a response cache, queries we flood carry our own address so answers come back through us.
+        # pending maps a key to the clients waiting for it, response_cache a key to the RESPONSEs we got
+        self.response_cache = response_cache
+        self.advertise_addr = advertise_addr or srv_addr
+        self.pending = None
+        if response_cache is not None:
+            self.pending = cacheutils.TTLCache(response_cache.max_size, utils.RECV_TIMEOUT)
+
+        # With a ring, lookups are routed towards the servent storing the key instead of flooded
+        self.ring = ring
+
+        # PUTs and DELETEs are versioned on top of the loaded list, and pushed to replicas peers
+        self.service_list = replicautils.VersionedStore(service_list, replicautils.writer_tag(self.advertise_addr))
+        self.replicas = replicas
+
+        # Values above large_threshold bytes are served over TCP from stream_addr, without one every value goes
+        # inline, a guessed address would send clients fetching from a host that isn't us
+        self.large_threshold = large_threshold
+        self.stream_addr = stream_addr
+
+        # Peers not heard from in heartbeat_interval seconds are pinged, those missing pings stop getting forwards
+        self.heartbeat_interval = heartbeat_interval
+
+        # With a membership, peers are learned by gossip instead of given, and kept up to max_peers of them
+        self.membership = membership
+        self.max_peers = max_peers
+        self.periods = 0
+
+        self.counters = collections.Counter()
+        self.processing = dict()  # message type => statsutils.Histogram of handling times
+        self.started = time.time()
+
+        # Lets generate a random seq to start
+        self.seq = random.randint(0, utils.MAX_SEQ)
+
+    def swap_service_list(self, service_list):
+
+        # A single reference assignment, lookups in flight finish on the table they started with
+        self.service_list.swap(service_list)
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["uptime"] = time.time() - self.started
+        stats["messages"] = dict((protocol.message_name(message_type), histogram.count)
+                                 for message_type, histogram in self.processing.iteritems())
+        stats["processing_us"] = dict((protocol.message_name(message_type), histogram.snapshot())
+                                      for message_type, histogram in self.processing.iteritems())
+        stats["peers"] = len(self.other_peers)
+        stats["peers_unhealthy"] = len(self.other_peers.unhealthy)
+        stats["forwards_skipped"] = self.other_peers.skipped
+        if self.membership is not None:
+            stats["membership"] = self.membership.counts()
+            stats["incarnation"] = self.membership.incarnation
+        stats["query_history"] = self.query_history.stats()
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.stats()
+        return stats
+
+    def handle(self, recv_data, ip_addr):
+
+        # First of all we extract message_type before processing whole messsage
+        started = time.time()
+        self.other_peers.heard(ip_addr, started)
+
+        # Truncated datagrams fail to unpack somewhere down the handlers, they are dropped instead of killing us
+        try:
+            recv_message_type = protocol.message_type(recv_data)
+            self.dispatch(recv_message_type, recv_data, ip_addr)
+        except struct.error:
+            self.counters["malformed"] += 1
+            logger.info("Dropped a malformed datagram from %s:%d", ip_addr[0], ip_addr[1])
+            return
+
+        # Processing time goes into one histogram per message type, in microseconds. Types we don't know of are
+        # only counted, anyone could otherwise have us keep up to 65536 histograms
+        if recv_message_type not in protocol.MESSAGE_NAMES:
+            self.counters["unknown_type"] += 1
+            return
+        histogram = self.processing.get(recv_message_type)
+        if histogram is None:
+            histogram = self.processing[recv_message_type] = statsutils.Histogram()
+        histogram.record((time.time() - started) * 1e6)
+
+    def dispatch(self, recv_message_type, recv_data, ip_addr):
+        if recv_message_type == utils.MESSAGE_TYPES["CLIREQ"]:
+            self.handle_clireq(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["QUERY"]:
+            self.handle_query(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["RESPONSE"] and self.response_cache is not None:
+            self.handle_response(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["LARGERESPONSE"] and self.response_cache is not None:
+            self.handle_large_response(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["MULTIREQ"]:
+            self.handle_multireq(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["MULTIQUERY"]:
+            self.handle_multiquery(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["IDREQ"]:
+            self.handle_idreq(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["IDQUERY"]:
+            self.handle_idquery(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["PUT"]:
+            self.handle_write(recv_data, ip_addr, "PUT")
+        elif recv_message_type == utils.MESSAGE_TYPES["DELETE"]:
+            self.handle_write(recv_data, ip_addr, "DELETE")
+        elif recv_message_type == utils.MESSAGE_TYPES["REPLICATE"]:
+            self.handle_replicate(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["SYNCDIGEST"]:
+            self.handle_sync_digest(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["SYNCBUCKET"]:
+            self.handle_sync_bucket(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["SYNCPULL"]:
+            self.handle_sync_pull(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["GLOBREQ"]:
+            self.handle_globreq(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["GLOBQUERY"]:
+            self.handle_globquery(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["PING"]:
+            self.handle_ping(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["PONG"]:
+            self.handle_pong(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["JOIN"] and self.membership is not None:
+            self.handle_join(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["MEMBERS"] and self.membership is not None:
+            self.handle_members(recv_data, ip_addr)
+        elif recv_message_type == utils.MESSAGE_TYPES["LEAVE"] and self.membership is not None:
+            self.handle_leave(recv_data, ip_addr)
+
+    def search(self, recv_message, ip_addr):
+        """Answers from the local table and the response cache, returns whether each of them had the key"""
+        found = local_db_search(self.srv_sock, self.service_list, recv_message, ip_addr, self.stream_addr,
+                                self.large_threshold, self.counters)
+        if found:
+            self.counters["local_hits"] += 1
+            self.counters["responses_sent"] += 1
+        else:
+            self.counters["local_misses"] += 1
+            logger.info("Couldn't find %s in my service list", recv_message)
+
+        cached = 0
+        if self.response_cache is not None:
+            cached = cache_search(self.srv_sock, self.response_cache, recv_message, ip_addr, self.counters)
+            if cached:
+                self.counters["responses_sent"] += cached
+                self.counters["floods_saved"] += len(self.other_peers)
+        return found, cached > 0
+
+    def route(self, send_message, recv_message, hops):
+        """Sends a QUERY one hop closer to the servent storing its key, returns False if that's us"""
+        next_hop = self.ring.next_hop(recv_message)
+        if next_hop is None:
+            self.counters["routed_lookups"] += 1
+            self.counters["routed_hops"] += hops
+            return False
+        try:
+            self.srv_sock.sendto(send_message, next_hop)
+            self.counters["forwards"] += 1
+            logger.info("Query routed to %s:%d", next_hop[0], next_hop[1])
+        except:
+            self.counters["send_errors"] += 1
+        return True
+
+    def handle_clireq(self, recv_data, ip_addr):
+        self.counters["clireq"] += 1
+
+        # Get key asked from user
+        recv_message = protocol.parse_key(recv_data, "CLIREQ")
+        self.seq = (self.seq + 1) % utils.MAX_SEQ
+
+        if not self.query_history.seen((ip_addr[0], ip_addr[1], self.seq, recv_message)):
+            logger.info("[CLIREQ] %s:%s asked for '%s'", ip_addr[0], ip_addr[1], recv_message)
+            found, cached = self.search(recv_message, ip_addr)
+            if cached or (found and self.ring is not None):
+                return
+
+            origin = ip_addr
+            if self.response_cache is not None:
+                self.pending.put(recv_message, self.pending.peek(recv_message, []) + [ip_addr])
+                origin = self.advertise_addr
+
+                # Our own query may come back around the overlay, it must look like a duplicate then
+                self.query_history.seen((origin[0], origin[1], self.seq, recv_message))
+
+            if self.ring is not None:
+                send_message = protocol.build_query(utils.ROUTED_TTL, origin, self.seq, recv_message)
+                self.route(send_message, recv_message, 0)
+                return
+
+            # Prepare forward query
+            send_message = protocol.build_query(utils.TTL, origin, self.seq, recv_message)
+            self.counters["forwards"] += forward_message(self.srv_sock, send_message, [ip_addr, self.srv_addr],
+                                                         self.other_peers, self.counters)
+
+    def handle_query(self, recv_data, ip_addr):
+        self.counters["query"] += 1
+        recv_ttl, recv_from, recv_port, recv_seq, recv_message = protocol.parse_query(recv_data)
+
+        if not self.query_history.seen((recv_from, recv_port, recv_seq, recv_message)):
+            logger.info("[QUERY] %s:%s asked for '%s'", recv_from, recv_port, recv_message)
+            found, cached = self.search(recv_message, (recv_from, recv_port))
+            if cached:
+                return
 
-    # Prepare forward query
-    send_header = struct.pack(utils.MESSAGE_FORMAT["QUERY"], utils.MESSAGE_TYPES["QUERY"], ttl,
-                              utils.ip_to_int(from_addr[0]), from_addr[1], seq)
-    send_message = send_header + recv_data[recv_header_size:]
-    for peer in other_peers:
+            # Routed queries stop where the key is found, or one hop before running out of TTL
+            if self.ring is not None:
+                hops = utils.ROUTED_TTL - recv_ttl + 1
+                if found:
+                    self.counters["routed_lookups"] += 1
+                    self.counters["routed_hops"] += hops
+                elif recv_ttl > 0:
+                    self.route(protocol.rewrite_query(recv_data, recv_ttl - 1), recv_message, hops)
+                return
 
-        # As opt args are stored as string, here we convert peer port to int in order
-        # to properly forward query message
-        peer = tuple([peer.split(":")[0], int(peer.split(":")[1])])
-        # print ("%s:%d => %s:%d" % (peer[0], int(peer[1]), peer_addr[0], int(peer_addr[1])))
-        if peer not in exclude_list:
+            # Sends query to other peers as long as TTL > 0, rewriting it in the receive buffer
+            if recv_ttl > 0:
+                send_message = protocol.rewrite_query(recv_data, recv_ttl - 1)
+                self.counters["forwards"] += forward_message(self.srv_sock, send_message, [ip_addr, self.srv_addr],
+                                                             self.other_peers, self.counters)
+        else:
+            self.counters["duplicates"] += 1
+
+    def handle_response(self, recv_data, ip_addr):
+        self.counters["response"] += 1
+
+        # Responses only reach us for queries we flooded on behalf of our clients
+        recv_message = protocol.parse_key(recv_data, "RESPONSE").split('\t', 1)[0]
+        self.relay(protocol.payload(recv_data, 0), recv_message, ip_addr)
+
+    def handle_large_response(self, recv_data, ip_addr):
+        self.counters["large_response"] += 1
+
+        # Large values are announced to us like any answer, clients then fetch them from the announcer
+        recv_message = protocol.parse_large_response(recv_data)[3]
+        self.relay(protocol.payload(recv_data, 0), recv_message, ip_addr)
+
+    def relay(self, send_message, recv_message, ip_addr):
+        """Passes an answer for recv_message on to the clients waiting for it, then caches it"""
+        # Only answers to a lookup still pending are taken, and not from the clients waiting for it, who
+        # could otherwise have their own answer served to everyone asking for the key after them
+        clients = self.pending.peek(recv_message)
+        if not clients:
+            self.counters["responses_unsolicited"] += 1
+            return
+        if ip_addr in clients or ip_addr == self.advertise_addr:
+            self.counters["responses_unsolicited"] += 1
+            logger.info("Dropped an answer for '%s' from %s:%d, a client waiting for it", recv_message, ip_addr[0],
+                        ip_addr[1])
+            return
+        for client_addr in clients:
             try:
-                srv_sock.sendto(send_message, peer)
-                logger.info("Query forwarded successfully to %s", peer)
+                self.srv_sock.sendto(send_message, client_addr)
+                self.counters["responses_relayed"] += 1
             except:
-                pass
+                self.counters["send_errors"] += 1
+        logger.info("Relayed answer for '%s' from %s:%d to %d clients", recv_message, ip_addr[0], ip_addr[1],
+                    len(clients))
+
+        # Several servents may answer the same key, the cache keeps every distinct answer up to a few of them
+        cached = self.response_cache.peek(recv_message, [])
+        if send_message not in cached and len(cached) < utils.RESPONSE_CACHE_ANSWERS:
+            self.response_cache.put(recv_message, cached + [send_message])
+
+    def handle_multireq(self, recv_data, ip_addr):
+        self.counters["multireq"] += 1
+
+        # Batches are answered straight to the client, so they go out with its address even with a cache
+        keys = protocol.parse_keys(recv_data, "MULTIREQ")
+        self.seq = (self.seq + 1) % utils.MAX_SEQ
+        logger.info("[MULTIREQ] %s:%s asked for %d keys", ip_addr[0], ip_addr[1], len(keys))
+        next_ttl = utils.ROUTED_TTL if self.ring is not None else utils.TTL
+        self.search_many(keys, ip_addr, self.seq, next_ttl, [ip_addr, self.srv_addr], 0)
+
+    def handle_idreq(self, recv_data, ip_addr):
+        self.counters["idreq"] += 1
+
+        # The client's request id takes the place of our seq, every answer echoes it back
+        request_id, wanted, keys = protocol.parse_idreq(recv_data)
+        logger.info("[IDREQ] %s:%s asked for %d keys as #%d", ip_addr[0], ip_addr[1], len(keys), request_id)
+        next_ttl = utils.ROUTED_TTL if self.ring is not None else utils.TTL
+        self.search_many(keys, ip_addr, request_id, next_ttl, [ip_addr, self.srv_addr], 0, wanted)
+
+    def handle_multiquery(self, recv_data, ip_addr):
+        self.counters["multiquery"] += 1
+        recv_ttl, recv_from, recv_port, recv_seq, keys = protocol.parse_multiquery(recv_data)
+        logger.info("[MULTIQUERY] %s:%s asked for %d keys", recv_from, recv_port, len(keys))
+        hops = utils.ROUTED_TTL - recv_ttl + 1 if self.ring is not None else 0
+        self.search_many(keys, (recv_from, recv_port), recv_seq, recv_ttl - 1 if recv_ttl > 0 else None,
+                         [ip_addr, self.srv_addr], hops)
+
+    def handle_idquery(self, recv_data, ip_addr):
+        self.counters["idquery"] += 1
+        recv_ttl, recv_from, recv_port, request_id, wanted, keys = protocol.parse_idquery(recv_data)
+        logger.info("[IDQUERY] %s:%s asked for %d keys as #%d", recv_from, recv_port, len(keys), request_id)
+        hops = utils.ROUTED_TTL - recv_ttl + 1 if self.ring is not None else 0
+        self.search_many(keys, (recv_from, recv_port), request_id, recv_ttl - 1 if recv_ttl > 0 else None,
+                         [ip_addr, self.srv_addr], hops, wanted)
+
+    def search_many(self, keys, origin, seq, next_ttl, exclude_list, hops, wanted=None):
+        """Answers the keys we hold in packed RESPONSEs and sends only the misses on, with next_ttl"""
+        # Tagged lookups (wanted is not None) carry the client's request id as seq, and get IDRESPONSEs
+        # echoing it. A client wanting more than one answer per key gets hits flooded on as well
+        def build_queries(query_keys):
+            if wanted is None:
+                return protocol.build_multiquery(next_ttl, origin, seq, query_keys)
+            return protocol.build_idquery(next_ttl, origin, seq, wanted, query_keys)
+
+        # Each key is remembered on its own, misses forwarded by different peers may overlap
+        fresh = []
+        hits = []
+        notices = []
+        misses = []
+        for key in keys:
+            if self.query_history.seen((origin[0], origin[1], seq, key)):
+                self.counters["duplicates"] += 1
+                continue
+            fresh.append(key)
+            value = self.service_list.get(key)
+            if value is not None:
+                hits.append((key, value))
+                continue
+            cached = self.response_cache.get(key) if self.response_cache is not None else None
+            if cached:
+                # Large values announced to us are announced on, under the request id of this lookup
+                for send_message in cached:
+                    if protocol.message_type(send_message) == utils.MESSAGE_TYPES["LARGERESPONSE"]:
+                        notices.append(protocol.parse_large_response(send_message)[1:])
+                    else:
+                        hits.extend(protocol.parse_responses(send_message))
+                continue
+            misses.append(key)
+        self.counters["local_hits"] += len(hits) + len(notices)
+        self.counters["local_misses"] += len(misses)
+
+        request_id = None if wanted is None else seq
+        datagrams = [protocol.build_large_response(request_id or 0, size, stream_addr, key)
+                     for size, stream_addr, key in notices]
+        datagrams.extend(protocol.build_packed_response(self.announce_large(hits, origin, request_id or 0),
+                                                        request_id))
+        for send_message in datagrams:
+            try:
+                self.srv_sock.sendto(send_message, origin)
+                self.counters["responses_sent"] += 1
+            except socket.error:
+                self.counters["send_errors"] += 1
+        if hits or notices:
+            logger.info("Answered %d keys to %s:%d", len(hits) + len(notices), origin[0], origin[1])
+
+        if self.ring is not None:
+            self.counters["routed_lookups"] += len(hits)
+            self.counters["routed_hops"] += hops * len(hits)
+
+            # Misses are split by the finger each of them goes to next
+            next_hops = collections.defaultdict(list)
+            for key in misses:
+                next_hops[self.ring.next_hop(key)].append(key)
+            resolved = next_hops.pop(None, [])
+            self.counters["routed_lookups"] += len(resolved)
+            self.counters["routed_hops"] += hops * len(resolved)
+            if next_ttl is None:
+                return
+            for next_hop, hop_keys in next_hops.iteritems():
+                for send_message in build_queries(hop_keys):
+                    try:
+                        self.srv_sock.sendto(send_message, next_hop)
+                        self.counters["forwards"] += 1
+                    except socket.error:
+                        self.counters["send_errors"] += 1
+        elif next_ttl is not None:
+            for send_message in build_queries(fresh if wanted > 1 else misses):
+                self.counters["forwards"] += forward_message(self.srv_sock, send_message, exclude_list,
+                                                             self.other_peers, self.counters)
+
+    def announce_large(self, items, origin, request_id):
+        """Sends a LARGERESPONSE for every (key, value) too big for a datagram, returns the others"""
+        if self.stream_addr is None:
+            return list(items)
+        small = []
+        for key, value in items:
+            if not protocol.is_large(key, value, self.large_threshold):
+                small.append((key, value))
+                continue
+            try:
+                self.srv_sock.sendto(protocol.build_large_response(request_id, len(value), self.stream_addr, key),
+                                     origin)
+                self.counters["large_announced"] += 1
+            except socket.error:
+                self.counters["send_errors"] += 1
+        return small
+
+    def replica_peers(self, key):
+        """Peers a write to key is pushed to"""
+        if self.ring is not None:
+            owners = self.ring.replicas(key, self.replicas + 1)
+            return [addr for addr in owners if addr != self.ring.self_addr][:self.replicas]
+
+        # Rendezvous hashing over our peers, so every write of a key goes to the same ones
+        return sorted(self.other_peers.peers,
+                      key=lambda peer: dhtutils.ring_id("%s:%d/%s" % (peer[0], peer[1], key)))[:self.replicas]
+
+    def send_all(self, datagrams, addr, counter):
+        for send_message in datagrams:
+            try:
+                self.srv_sock.sendto(send_message, addr)
+                self.counters[counter] += len(send_message)
+            except socket.error:
+                self.counters["send_errors"] += 1
+
+    def handle_write(self, recv_data, ip_addr, message_type_name):
+        self.counters[message_type_name.lower()] += 1
+        request_id, key, value = protocol.parse_write(recv_data, message_type_name)
+        if not key:
+            return
+        entry = self.service_list.write(key, value if message_type_name == "PUT" else None)
+        logger.info("[%s] %s:%s wrote '%s' as version %d", message_type_name, ip_addr[0], ip_addr[1], key, entry[0])
+
+        # The client gets its request id back once the write is applied here, replicas follow asynchronously
+        self.send_all(protocol.build_packed_response([(key, value)], request_id), ip_addr, "ack_bytes_sent")
+        datagrams = protocol.build_replicate([(key, entry)])
+        for peer in self.replica_peers(key):
+            self.send_all(datagrams, peer, "replication_bytes_sent")
+            self.counters["replicated"] += 1
+
+    def handle_replicate(self, recv_data, ip_addr):
+        self.counters["replicate"] += 1
+        for key, entry in protocol.parse_entries(recv_data):
+            if self.service_list.apply(key, entry):
+                self.counters["entries_applied"] += 1
+            else:
+                self.counters["entries_stale"] += 1
+
+    def sync(self):
+        """One anti-entropy round: our bucket digests go to a random peer"""
+        peers = self.other_peers.select() or self.other_peers.peers
+        if not peers:
+            return
+        peer = random.choice(peers)
+        self.counters["sync_rounds"] += 1
+        self.other_peers.requested(peer, time.time())
+        self.send_all([protocol.build_sync_digest(self.service_list.digests)], peer, "sync_bytes_sent")
+
+        # Deletes had this many rounds to reach every replica, their tombstones can go
+        self.counters["tombstones_collected"] += self.service_list.collect()
+
+    def handle_sync_digest(self, recv_data, ip_addr):
+        self.counters["sync_bytes_received"] += len(recv_data)
+
+        # Only buckets whose digests differ are compared, by the versions of the keys in them
+        digests = protocol.parse_sync_digest(recv_data)
+        differing = [bucket for bucket, digest in enumerate(self.service_list.digests)
+                     if bucket >= len(digests) or digests[bucket] != digest]
+        for bucket in differing:
+            self.send_all(protocol.build_sync_bucket(bucket, self.service_list.summary(bucket), True), ip_addr,
+                          "sync_bytes_sent")
+        if differing:
+            logger.info("[SYNC] %d buckets differ from %s:%d", len(differing), ip_addr[0], ip_addr[1])
+
+    def handle_sync_bucket(self, recv_data, ip_addr):
+        self.counters["sync_bytes_received"] += len(recv_data)
+        bucket, reply, summaries = protocol.parse_sync_bucket(recv_data)
+
+        # Peers with another SYNC_BUCKETS, or anyone else, may name a bucket we don't have
+        if bucket >= len(self.service_list.digests):
+            self.counters["malformed"] += 1
+            return
+
+        # A bucket sent back for our digests is a round trip to that peer, as good as a pong
+        if reply:
+            self.other_peers.replied(ip_addr, time.time())
+
+        # We push what we have newer and pull what they have newer
+        push = []
+        pull = []
+        for key, version in summaries:
+            local = self.service_list.version(key)
+            if local > version:
+                push.append(key)
+            elif local < version:
+                pull.append(key)
+        self.send_all(protocol.build_replicate(self.service_list.items(push)), ip_addr, "sync_bytes_sent")
+        self.send_all(protocol.build_sync_pull(pull), ip_addr, "sync_bytes_sent")
+
+        # Keys they don't have at all only show up in our own summary, sent back once per bucket
+        if reply:
+            theirs = set(key for key, _ in summaries)
+            ours = [(key, version) for key, version in self.service_list.summary(bucket) if key not in theirs]
+            if ours:
+                self.send_all(protocol.build_sync_bucket(bucket, ours, False), ip_addr, "sync_bytes_sent")
+
+    def handle_sync_pull(self, recv_data, ip_addr):
+        self.counters["sync_bytes_received"] += len(recv_data)
+        keys = protocol.parse_keys(recv_data, "SYNCPULL")
+        self.send_all(protocol.build_replicate(self.service_list.items(keys)), ip_addr, "sync_bytes_sent")
+
+    def handle_globreq(self, recv_data, ip_addr):
+        self.counters["globreq"] += 1
+        request_id, limit, pattern, after = protocol.parse_globreq(recv_data)
+        logger.info("[GLOBREQ] %s:%s asked for '%s' after '%s' as #%d", ip_addr[0], ip_addr[1], pattern, after,
+                    request_id)
+        self.search_glob(pattern, after, limit, ip_addr, request_id, utils.TTL, [ip_addr, self.srv_addr])
+
+    def handle_globquery(self, recv_data, ip_addr):
+        self.counters["globquery"] += 1
+        recv_ttl, recv_from, recv_port, request_id, limit, pattern, after = protocol.parse_globquery(recv_data)
+        logger.info("[GLOBQUERY] %s:%s asked for '%s' as #%d", recv_from, recv_port, pattern, request_id)
+        self.search_glob(pattern, after, limit, (recv_from, recv_port), request_id,
+                         recv_ttl - 1 if recv_ttl > 0 else None, [ip_addr, self.srv_addr])
+
+    def search_glob(self, pattern, after, limit, origin, request_id, next_ttl, exclude_list):
+        """Answers a page of our keys matching pattern, and floods the query on with next_ttl"""
+        # Patterns are remembered apart from plain keys, and each page is a query of its own
+        if self.query_history.seen((origin[0], origin[1], request_id, "\x00glob" + pattern + "\x00" + after)):
+            self.counters["duplicates"] += 1
+            return
+        limit = min(limit or utils.GLOB_LIMIT, utils.GLOB_LIMIT)
+        items, more = self.service_list.match(pattern, after, limit)
+        self.counters["glob_matches"] += len(items)
+        if items or more:
+
+            # Large values are announced ahead of the page, so the flag still comes after every key of it
+            small = self.announce_large(items, origin, request_id)
+            self.send_all(protocol.build_glob_response(request_id, small, more), origin, "glob_bytes_sent")
+            logger.info("Answered %d keys matching '%s' to %s:%d", len(items), pattern, origin[0], origin[1])
+
+        # Matches may live on any node whatever the routing, so patterns are always flooded
+        if next_ttl is not None:
+            send_message = protocol.build_globquery(next_ttl, origin, request_id, limit, pattern, after)
+            self.counters["forwards"] += forward_message(self.srv_sock, send_message, exclude_list, self.other_peers,
+                                                         self.counters)
+
+    def heartbeat(self):
+        """Pings the peers we haven't heard from lately, marking those that keep missing them unhealthy"""
+        now = time.time()
+        if self.membership is None:
+            pings = self.other_peers.due_pings(now, self.heartbeat_interval)
+        else:
+
+            # One protocol period of the membership: expire suspects, probe one member, rejoin if alone.
+            # Its probes replace the per peer heartbeats, a suspect member gets no forwards
+            self.periods += 1
+            self.membership.expire(now, self.heartbeat_interval)
+            probe = self.membership.next_probe(now)
+            pings = []
+            if probe is None:
+                self.join()
+            else:
+                pings.append((probe, self.other_peers.ping(probe, now) if probe in self.other_peers else 0))
+
+                # Every few periods the whole view of a random member is pulled, piggybacking alone can fall
+                # behind when many servents join at once
+                if self.periods % utils.GOSSIP_SYNC_PERIODS == 0:
+                    self.pull(random.choice(self.membership.alive()), now)
+            self.refresh_peers()
+        for peer, nonce in pings:
+            self.counters["pings_sent"] += 1
+            self.send_all([protocol.build_ping(nonce, self.piggyback(peer))], peer, "gossip_bytes_sent")
+
+    def piggyback(self, addr):
+        if self.membership is None:
+            return ()
+
+        # Hosts that aren't live members get at most their own record, a ping can't be turned into a flood
+        if not self.membership.is_alive(addr):
+            return self.membership.piggyback(addr, 1) if addr in self.membership.members else ()
+        return self.membership.piggyback(addr)
+
+    def handle_ping(self, recv_data, ip_addr):
+        self.counters["ping"] += 1
+        if self.membership is not None:
+            self.counters["gossip_bytes_received"] += len(recv_data)
+            records = protocol.parse_members(recv_data, "PING")
+
+            # A servent we don't know yet, vouching for itself, is pinged back before it counts as a member
+            if ip_addr not in self.membership.members:
+                for member, incarnation, state in records:
+                    if member == ip_addr and state == memberutils.ALIVE:
+                        nonce = self.membership.candidate(ip_addr, incarnation, time.time(), joining=False)
+                        if nonce is not None:
+                            self.send_all([protocol.build_ping(nonce)], ip_addr, "gossip_bytes_sent")
+            self.merge(records, ip_addr)
+        self.send_all([protocol.build_pong(protocol.parse_ping(recv_data), self.piggyback(ip_addr))], ip_addr,
+                      "gossip_bytes_sent")
+
+    def handle_pong(self, recv_data, ip_addr):
+        self.counters["pong"] += 1
+        now = time.time()
+        nonce = protocol.parse_ping(recv_data)
+        self.other_peers.pong(ip_addr, nonce, now)
+        if self.membership is not None:
+            self.counters["gossip_bytes_received"] += len(recv_data)
+            self.membership.ack(ip_addr)
+
+            # A servent we pinged with a nonce proved it owns its address, one that sent a JOIN gets our members
+            joined = self.membership.verify(ip_addr, nonce, now)
+            if joined is not None:
+                self.counters["members_admitted"] += 1
+                self.refresh_peers()
+                if joined:
+                    self.send_members(ip_addr)
+            self.merge(protocol.parse_members(recv_data, "PONG"), ip_addr)
+
+    def merge(self, records, sender=None):
+        """Applies membership records, refreshing our peers if any of them was news"""
+
+        # Gossip from a sender we don't count as alive may only be about itself: a servent declared dead can
+        # still refute it, and unknown hosts can't make anyone a member
+        if sender is not None and not self.membership.is_alive(sender):
+            if sender not in self.membership.members:
+                return
+            records = [record for record in records if record[0] == sender]
+        now = time.time()
+        changed = False
+        for member, incarnation, state in records:
+            if self.membership.apply(member, incarnation, state, now):
+                changed = True
+                logger.info("Member %s:%d is %s (incarnation %d)", member[0], member[1],
+                            memberutils.STATE_NAMES[state], incarnation)
+        if changed:
+            self.refresh_peers()
+
+    def refresh_peers(self):
+        """Drops peers known to be dead or gone, and tops the table up to max_peers with random live members"""
+        for peer in list(self.other_peers.peers):
+            if peer in self.membership.members and not self.membership.is_alive(peer):
+                self.other_peers.remove(peer)
+                self.counters["peers_dropped"] += 1
+        self.other_peers.unhealthy = set(peer for peer in self.other_peers.peers
+                                         if self.membership.state(peer) == memberutils.SUSPECT)
+        missing = self.max_peers - len(self.other_peers)
+        if missing > 0:
+            candidates = [member for member in self.membership.alive() if member not in self.other_peers]
+            for peer in random.sample(candidates, min(missing, len(candidates))):
+                self.other_peers.add(peer)
+                self.counters["peers_added"] += 1
+
+    def join(self):
+        """Asks the seeds for the members they know, until one of them answers"""
+        for seed in self.membership.seeds:
+            self.pull(seed, time.time(), rebind=True)
+
+    def pull(self, member, now, rebind=False):
+        self.membership.joining(member, now, rebind)
+        self.send_all([protocol.build_join(self.membership.incarnation)], member, "gossip_bytes_sent")
+
+    def send_members(self, addr):
+        """Our view, at most GOSSIP_MAX_MEMBERS records of it, so a JOIN can't be turned into a flood"""
+        members = [member for member in self.membership.alive() if member != addr]
+        if len(members) >= utils.GOSSIP_MAX_MEMBERS:
+            members = random.sample(members, utils.GOSSIP_MAX_MEMBERS - 1)
+        records = [(member,) + self.membership.entry(member) for member in members + [self.membership.self_addr]]
+        self.send_all(protocol.build_members(addr, records), addr, "gossip_bytes_sent")
+
+    def leave(self):
+        """Says goodbye to our peers and a few other members, who gossip it to the rest"""
+        alive = self.membership.alive()
+        targets = set(self.other_peers.peers) | set(random.sample(alive, min(self.max_peers, len(alive))))
+        for peer in targets:
+            self.send_all([protocol.build_leave(self.membership.incarnation)], peer, "gossip_bytes_sent")
+
+    def handle_join(self, recv_data, ip_addr):
+        self.counters["join"] += 1
+        self.counters["gossip_bytes_received"] += len(recv_data)
+        incarnation = protocol.parse_incarnation(recv_data)
+
+        # Members pulling our view get it right away. Anyone else first answers a bare ping, as big as
+        # their JOIN, so a spoofed source address gets neither our members nor a place among them
+        if self.membership.is_alive(ip_addr):
+            self.send_members(ip_addr)
+            return
+        nonce = self.membership.candidate(ip_addr, incarnation, time.time())
+        if nonce is not None:
+            self.send_all([protocol.build_ping(nonce)], ip_addr, "gossip_bytes_sent")
+
+    def handle_members(self, recv_data, ip_addr):
+        self.counters["members"] += 1
+        self.counters["gossip_bytes_received"] += len(recv_data)
+        join = self.membership.joins.get(ip_addr)
+        if join is None:
+            self.counters["members_unsolicited"] += 1
+            return
+        if join[0]:
+            self.membership.rebind(protocol.parse_observed(recv_data))
+        self.merge(protocol.parse_members(recv_data, "MEMBERS"))
+
+    def handle_leave(self, recv_data, ip_addr):
+        self.counters["leave"] += 1
+        self.counters["gossip_bytes_received"] += len(recv_data)
+        self.merge([(ip_addr, protocol.parse_incarnation(recv_data), memberutils.LEFT)])
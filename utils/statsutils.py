@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import utils
+
+"""
+| ===================================================================
+| Histogram: log-linear buckets in the style of HdrHistogram
+| ===================================================================
+"""
+
+class Histogram(object):
+
+    def __init__(self, sub_bucket_bits=utils.HISTOGRAM_SUB_BUCKET_BITS, max_bits=utils.HISTOGRAM_MAX_BITS):
+
+        # Values below 2 ** sub_bucket_bits get a bucket each, above that every power of two is split in
+        # 2 ** (sub_bucket_bits - 1) buckets, so any value is known within 2 ** (1 - sub_bucket_bits) of itself
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.max_value = (1 << max_bits) - 1
+        self.counts = [0] * self.index(self.max_value) + [0]
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return (shift + 1) * self.half_count + (value >> shift) - self.half_count
+
+    def value_at(self, index):
+        """Highest value that lands in bucket index"""
+        if index < self.sub_bucket_count:
+            return index
+        shift = index / self.half_count - 1
+        sub_bucket = index % self.half_count + self.half_count
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percentile):
+        if not self.count:
+            return None
+        wanted = max(1, int(round(self.count * percentile / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self.value_at(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return dict(count=0)
+        return dict(count=self.count, min=self.min, max=self.max, mean=float(self.total) / self.count,
+                    p50=self.percentile(50), p90=self.percentile(90), p99=self.percentile(99),
+                    p999=self.percentile(99.9))
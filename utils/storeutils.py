@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+"""
+| ===================================================================
+| Compiled service store layout
+| ===================================================================
+|
+| header | slots | records
+|
+| header:  magic, number of slots (a power of two), number of entries
+| slots:   (crc32 of key, offset of its record), offset 0 marks an empty slot
+| records: key length, value length, key, value
+"""
+
+MAGIC = "P2PKVS01"
+HEADER = struct.Struct("=8sII")
+SLOT = struct.Struct("=IQ")
+RECORD = struct.Struct("=HI")
+
+"""
+| ===================================================================
+| key_hash: stable hash used to place keys in the slot table
+| ===================================================================
+"""
+
+def key_hash(key):
+    return zlib.crc32(key) & 0xFFFFFFFF
+
+"""
+| ===================================================================
+| is_compiled: tells whether path holds a compiled service store
+| ===================================================================
+"""
+
+def is_compiled(path):
+    with open(path, "rb") as store_file:
+        return store_file.read(len(MAGIC)) == MAGIC
+
+"""
+| ===================================================================
+| compile_store: writes a services dict as a compiled store
+| ===================================================================
+"""
+
+def compile_store(services, output_file):
+
+    # Keep the table at most half full so probe sequences stay short
+    slots = 1
+    while slots < 2 * max(1, len(services)):
+        slots <<= 1
+
+    table = [(0, 0)] * slots
+    records = []
+    offset = HEADER.size + slots * SLOT.size
+    for key, value in services.iteritems():
+        slot = key_hash(key) & (slots - 1)
+        while table[slot][1]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = (key_hash(key), offset)
+        record = RECORD.pack(len(key), len(value)) + key + value
+        records.append(record)
+        offset += len(record)
+
+    # Written aside and renamed, so a servent never maps a half written store
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "wb") as store_file:
+        store_file.write(HEADER.pack(MAGIC, slots, len(services)))
+        store_file.write("".join(SLOT.pack(*slot) for slot in table))
+        store_file.write("".join(records))
+    os.rename(tmp_file, output_file)
+
+"""
+| ===================================================================
+| MappedServiceStore: read-only dict-like view of a compiled store
+| ===================================================================
+"""
+
+class MappedServiceStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as store_file:
+
+            # Pages come from the page cache, so every process mapping the store shares them
+            self.map = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slots, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError("%s is not a compiled service store" % path)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def find(self, key):
+        """Returns the offset of key's record, or None"""
+        khash = key_hash(key)
+        mask = self.slots - 1
+        slot = khash & mask
+        while True:
+            slot_hash, offset = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == khash:
+                key_len = RECORD.unpack_from(self.map, offset)[0]
+                start = offset + RECORD.size
+                if self.map[start:start + key_len] == key:
+                    return offset
+            slot = (slot + 1) & mask
+
+    def get(self, key, default=None):
+        offset = self.find(key)
+        if offset is None:
+            return default
+        key_len, value_len = RECORD.unpack_from(self.map, offset)
+        start = offset + RECORD.size + key_len
+        return self.map[start:start + value_len]
+
+    def iteritems(self):
+        offset = HEADER.size + self.slots * SLOT.size
+        end = len(self.map)
+        while offset < end:
+            key_len, value_len = RECORD.unpack_from(self.map, offset)
+            start = offset + RECORD.size
+            yield self.map[start:start + key_len], self.map[start + key_len:start + key_len + value_len]
+            offset = start + key_len + value_len
+
+    def iterkeys(self):
+        for key, _ in self.iteritems():
+            yield key
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def close(self):
+        self.map.close()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Copyright (c) 2017
+Gabriel Pacheco     <gabriel.pacheco@dcc.ufmg.br>
+Guilherme Sousa     <gadsousa@gmail.com>
+Joao Paulo Bastos   <joaopaulosr95@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import collections
+import errno
+import logging
+import os
+import socket
+import threading
+import time
+
+import protocol
+import utils
+
+"""
+| ===================================================================
+| bind_stream_socket: the TCP socket large values are served from
+| ===================================================================
+"""
+
+def bind_stream_socket(srv_host, srv_port, reuse_port=False):
+    stream_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    stream_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        stream_sock.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_REUSEPORT", 15), 1)
+    stream_sock.bind((srv_host, srv_port))
+    stream_sock.listen(utils.STREAM_BACKLOG)
+    return stream_sock
+
+"""
+| ===================================================================
+| recv_exactly: reads size bytes from a stream, None if it ends first
+| ===================================================================
+"""
+
+def recv_exactly(sock, size):
+
+    # Received straight into one preallocated buffer, megabytes of small strings are never joined
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        nbytes = sock.recv_into(view[received:], min(size - received, utils.STREAM_CHUNK_SIZE))
+        if nbytes == 0:
+            return None
+        received += nbytes
+    return buf
+
+"""
+| ===================================================================
+| ValueServer: answers TCP fetches of values too big for a datagram
+| ===================================================================
+"""
+
+class ValueServer(object):
+
+    def __init__(self, stream_sock, lookup, max_connections=utils.STREAM_MAX_CONNECTIONS):
+        self.stream_sock = stream_sock
+        self.lookup = lookup  # key => value or None, read at fetch time so reloads and writes are seen
+        self.thread = None
+        self.fetches = 0
+        self.bytes_sent = 0
+
+        # One thread per connection, those past max_connections are closed right away
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.refused = 0  # connections turned away, or cut off for a line longer than any key
+
+    def run(self):
+        logger = logging.getLogger(__name__)
+        while True:
+            try:
+                conn, ip_addr = self.stream_sock.accept()
+            except socket.error, e:
+                if e.errno in (errno.EINTR, errno.ECONNABORTED):
+                    continue
+                return  # closed on shutdown
+            if not self.slots.acquire(False):
+                self.refused += 1
+                logger.warning("[STREAM] %s:%d refused, already serving every connection we can", ip_addr[0],
+                               ip_addr[1])
+                conn.close()
+                continue
+            logger.info("[STREAM] %s:%d connected", ip_addr[0], ip_addr[1])
+            thread = threading.Thread(target=self.serve_slot, args=(conn,), name="stream")
+            thread.daemon = True
+            thread.start()
+
+    def serve_slot(self, conn):
+        try:
+            self.serve_connection(conn)
+        finally:
+            self.slots.release()
+
+    def serve_connection(self, conn):
+        """Answers every key line sent on conn with its length and value, until the client hangs up"""
+        conn.settimeout(utils.STREAM_TIMEOUT)
+
+        # Each answer is a request-response exchange, Nagle would hold its tail back for the peer's delayed ACK
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = conn.makefile("rb")
+        try:
+            while True:
+
+                # Keys come from datagrams, a line longer than any of them ends the connection
+                line = stream.readline(utils.STREAM_MAX_KEY + 1)
+                if not line:
+                    break
+                if len(line) > utils.STREAM_MAX_KEY and not line.endswith("\n"):
+                    self.refused += 1
+                    break
+                key = line.rstrip("\n")
+                value = self.lookup(key)
+                if value is None:
+                    conn.sendall(protocol.VALUE_LENGTH.pack(protocol.NOT_FOUND))
+                    continue
+                header = protocol.VALUE_LENGTH.pack(len(value))
+                if len(value) <= utils.STREAM_CHUNK_SIZE:
+                    conn.sendall(header + value)
+                else:
+                    conn.sendall(header)
+                    conn.sendall(value)
+                self.fetches += 1
+                self.bytes_sent += len(value)
+        except socket.error:
+            pass
+        finally:
+            stream.close()
+            conn.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="stream")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        try:
+            self.stream_sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.stream_sock.close()
+
+        # accept() wakes up with an error once the socket is shut down, we wait for it before exiting
+        if self.thread is not None:
+            self.thread.join(utils.STREAM_TIMEOUT)
+
+"""
+| ===================================================================
+| ValueFetcher: fetches large values, one connection per servent
+| ===================================================================
+"""
+
+class ValueFetcher(object):
+
+    def __init__(self, timeout=utils.STREAM_TIMEOUT):
+        self.timeout = timeout
+        self.conns = dict()  # (host, port) => connected socket
+
+    def fetch(self, stream_addr, key):
+        """The value of key held at stream_addr, None if it's gone or the servent can't be reached"""
+        logger = logging.getLogger(__name__)
+
+        # A connection left over from an earlier fetch may have been closed meanwhile, we reconnect once
+        for attempt in range(2):
+            conn = self.conns.get(stream_addr)
+            try:
+                if conn is None:
+                    conn = self.conns[stream_addr] = socket.create_connection(stream_addr, self.timeout)
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                conn.sendall(key + "\n")
+                header = recv_exactly(conn, protocol.VALUE_LENGTH.size)
+                if header is None:
+                    raise socket.error(errno.ECONNRESET, "connection closed")
+                size, = protocol.VALUE_LENGTH.unpack(str(header))
+                if size == protocol.NOT_FOUND:
+                    return None
+                value = recv_exactly(conn, size)
+                if value is None:
+                    raise socket.error(errno.ECONNRESET, "connection closed")
+                return str(value)
+            except socket.error, e:
+                self.drop(stream_addr)
+                if attempt == 1:
+                    logger.warning("Couldn't fetch '%s' from %s:%d: %s", key, stream_addr[0], stream_addr[1], e)
+        return None
+
+    def drop(self, stream_addr):
+        conn = self.conns.pop(stream_addr, None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        for stream_addr in list(self.conns):
+            self.drop(stream_addr)
+
+"""
+| ===================================================================
+| StreamConnection: a non-blocking connection to one ValueServer
+| ===================================================================
+"""
+
+class StreamConnection(object):
+
+    def __init__(self, stream_addr, now, timeout):
+        self.stream_addr = stream_addr
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        err = self.sock.connect_ex(stream_addr)
+        if err not in (0, errno.EINPROGRESS):
+            self.sock.close()
+            raise socket.error(err, os.strerror(err))
+        self.connected = False
+        self.outbox = bytearray()  # key lines not sent yet
+        self.waiting = collections.deque()  # fetches asked for, answered in order by the servent
+        self.header = bytearray()  # the length of the next value, as far as received
+        self.value = None  # buffer the value being received goes into, once its length is known
+        self.received = 0
+        self.timeout = timeout
+        self.deadline = now + timeout  # the connection is given up if nothing moves until then
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def queue(self, fetch, now):
+        if not self.waiting:
+            self.deadline = now + self.timeout
+        self.waiting.append(fetch)
+        self.outbox += fetch[0] + "\n"
+
+    def wants_write(self):
+        return not self.connected or len(self.outbox) > 0
+
+    def write(self, now):
+        if not self.connected:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise socket.error(err, os.strerror(err))
+            self.connected = True
+        if self.outbox:
+            sent = self.sock.send(str(self.outbox))
+            del self.outbox[:sent]
+            self.deadline = now + self.timeout
+
+    def recv(self, size):
+        """Up to size bytes, None once nothing more is queued on the socket"""
+        try:
+            data = self.sock.recv(size)
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return None
+            raise
+        if not data:
+            raise socket.error(errno.ECONNRESET, "connection closed")
+        return data
+
+    def read(self, now, answered):
+        """Appends a (fetch, value) to answered for every value received in full"""
+        while True:
+            if self.value is None:
+                data = self.recv(protocol.VALUE_LENGTH.size - len(self.header))
+                if data is None:
+                    return
+                self.deadline = now + self.timeout
+                self.header += data
+                if len(self.header) < protocol.VALUE_LENGTH.size:
+                    continue
+                size, = protocol.VALUE_LENGTH.unpack(str(self.header))
+                self.header = bytearray()
+                if not self.waiting:
+                    raise socket.error(errno.EPROTO, "answer to nothing asked")
+                if size == protocol.NOT_FOUND:
+                    answered.append((self.waiting.popleft(), None))
+                    continue
+                self.value = bytearray(size)
+                self.received = 0
+
+            # Received straight into the preallocated buffer, as recv_exactly does
+            while self.received < len(self.value):
+                try:
+                    nbytes = self.sock.recv_into(memoryview(self.value)[self.received:],
+                                                 min(len(self.value) - self.received, utils.STREAM_CHUNK_SIZE))
+                except socket.error, e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return
+                    raise
+                if nbytes == 0:
+                    raise socket.error(errno.ECONNRESET, "connection closed")
+                self.received += nbytes
+                self.deadline = now + self.timeout
+            answered.append((self.waiting.popleft(), str(self.value)))
+            self.value = None
+
+"""
+| ===================================================================
+| PipelinedFetcher: fetches large values without ever blocking
+| ===================================================================
+"""
+
+class PipelinedFetcher(object):
+
+    def __init__(self, timeout=utils.STREAM_TIMEOUT):
+        self.timeout = timeout
+        self.conns = dict()  # (host, port) => StreamConnection
+
+    def submit(self, stream_addr, key, callback, attempt=0):
+        """Queues a fetch of key, callback(key, value) gets None if it's gone or the servent can't be reached"""
+        now = time.time()
+        conn = self.conns.get(stream_addr)
+        try:
+            if conn is None:
+                conn = self.conns[stream_addr] = StreamConnection(stream_addr, now, self.timeout)
+        except socket.error, e:
+            self.give_up((key, callback, attempt), stream_addr, e)
+            return
+        conn.queue((key, callback, attempt), now)
+
+    def readers(self):
+        return self.conns.values()
+
+    def writers(self):
+        return [conn for conn in self.conns.itervalues() if conn.wants_write()]
+
+    def pending(self):
+        return sum(len(conn.waiting) for conn in self.conns.itervalues())
+
+    def next_deadline(self):
+        """When the stalest connection with fetches left is given up, None if there is none"""
+        deadlines = [conn.deadline for conn in self.conns.itervalues() if conn.waiting]
+        return min(deadlines) if deadlines else None
+
+    def handle(self, readable, writable):
+        """Moves every connection select() found ready, then calls back the fetches done meanwhile"""
+        now = time.time()
+        readable = set(readable)
+        writable = set(writable)
+        answered = []
+        for stream_addr, conn in self.conns.items():
+            try:
+                if conn in writable:
+                    conn.write(now)
+                if conn in readable:
+                    conn.read(now, answered)
+            except socket.error, e:
+                self.drop(stream_addr, e)
+        for (key, callback, _), value in answered:
+            callback(key, value)
+
+    def expire(self):
+        now = time.time()
+        for stream_addr, conn in self.conns.items():
+            if conn.waiting and conn.deadline <= now:
+                self.drop(stream_addr, socket.timeout("timed out"))
+
+    def drop(self, stream_addr, e):
+        """Closes a connection, its fetches are asked again once on a new one"""
+        conn = self.conns.pop(stream_addr)
+        conn.close()
+
+        # A connection left over from earlier fetches may have been closed by the servent meanwhile
+        for key, callback, attempt in conn.waiting:
+            if attempt == 0:
+                self.submit(stream_addr, key, callback, 1)
+            else:
+                self.give_up((key, callback, attempt), stream_addr, e)
+
+    def give_up(self, fetch, stream_addr, e):
+        logger = logging.getLogger(__name__)
+        logger.warning("Couldn't fetch '%s' from %s:%d: %s", fetch[0], stream_addr[0], stream_addr[1], e)
+        fetch[1](fetch[0], None)
+
+    def close(self):
+        for conn in self.conns.values():
+            conn.close()
+        self.conns.clear()
+
+"""
+| ===================================================================
+| fetch_value: one-shot fetch of a large value
+| ===================================================================
+"""
+
+def fetch_value(stream_addr, key, timeout=utils.STREAM_TIMEOUT):
+    fetcher = ValueFetcher(timeout)
+    try:
+        return fetcher.fetch(stream_addr, key)
+    finally:
+        fetcher.close()
@@ -32,12 +32,59 @@ import struct
 | ===================================================================
 """
 
-MESSAGE_TYPES = {"CLIREQ": 1, "QUERY": 2, "RESPONSE": 3}
-MESSAGE_FORMAT = {"CLIREQ": "!H", "QUERY": "!HHLHL", "RESPONSE": "!H"}
+MESSAGE_TYPES = {"CLIREQ": 1, "QUERY": 2, "RESPONSE": 3, "MULTIREQ": 4, "MULTIQUERY": 5, "IDREQ": 6, "IDQUERY": 7,
+                 "IDRESPONSE": 8, "PUT": 9, "DELETE": 10, "REPLICATE": 11, "SYNCDIGEST": 12, "SYNCBUCKET": 13,
+                 "SYNCPULL": 14, "GLOBREQ": 15, "GLOBQUERY": 16, "GLOBRESPONSE": 17,
+                 "LARGERESPONSE": 18, "PING": 19, "PONG": 20, "JOIN": 21, "MEMBERS": 22, "LEAVE": 23}
+MESSAGE_FORMAT = {"CLIREQ": "!H", "QUERY": "!HHLHL", "RESPONSE": "!H", "MULTIREQ": "!H", "MULTIQUERY": "!HHLHL",
+                  "IDREQ": "!HLH", "IDQUERY": "!HHLHLH", "IDRESPONSE": "!HL", "PUT": "!HL", "DELETE": "!HL",
+                  "REPLICATE": "!H", "SYNCDIGEST": "!H", "SYNCBUCKET": "!HHH", "SYNCPULL": "!H", "GLOBREQ": "!HLH",
+                  "GLOBQUERY": "!HHLHLH", "GLOBRESPONSE": "!HLB", "LARGERESPONSE": "!HLLLH",
+                  "PING": "!HL", "PONG": "!HL", "JOIN": "!HL", "MEMBERS": "!HLH", "LEAVE": "!HL"}
+KEY_SEPARATOR = "\n"
 MAX_BUFFER_SIZE = 1000
 MAX_SEQ = 4294967295L
 RECV_TIMEOUT = 4.0
 TTL = 3
+ROUTED_TTL = 32
+QUERY_HISTORY_SIZE = 65536
+QUERY_HISTORY_TTL = 30.0
+EVENT_LOOP_BATCH = 64
+RELOAD_RETIRE_INTERVAL = 1.0
+RESPONSE_CACHE_SIZE = 4096
+RESPONSE_CACHE_TTL = 60.0
+RESPONSE_CACHE_ANSWERS = 8
+MULTIREQ_WINDOW = 256
+CLIENT_INITIAL_RTO = 1.0
+CLIENT_MIN_RTO = 0.05
+CLIENT_MAX_RTO = 4.0
+CLIENT_RETRIES = 2
+REPLICAS = 2
+SYNC_BUCKETS = 64
+SYNC_INTERVAL = 10.0
+TOMBSTONE_ROUNDS = 30
+GLOB_LIMIT = 100
+GLOB_WAIT = 0.5
+LARGE_VALUE_THRESHOLD = 900
+STREAM_TIMEOUT = 5.0
+STREAM_BACKLOG = 64
+STREAM_CHUNK_SIZE = 262144
+STREAM_MAX_CONNECTIONS = 64
+STREAM_MAX_KEY = MAX_BUFFER_SIZE
+HISTOGRAM_SUB_BUCKET_BITS = 7
+HISTOGRAM_MAX_BITS = 36
+HEARTBEAT_INTERVAL = 2.0
+HEALTH_MAX_MISSED = 3
+HEALTH_ALPHA = 0.25
+HEALTH_MIN_RTT = 0.001
+GOSSIP_MAX_PEERS = 8
+GOSSIP_MAX_UPDATES = 16
+GOSSIP_RETRANSMIT_MULT = 3
+GOSSIP_SUSPECT_MULT = 4
+GOSSIP_SYNC_PERIODS = 10
+GOSSIP_MAX_MEMBERS = 180
+GOSSIP_MAX_CANDIDATES = 1024
+GOSSIP_DEAD_TTL = 60.0
 
 """
 | ===================================================================